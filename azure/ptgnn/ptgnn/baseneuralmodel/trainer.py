@@ -165,18 +165,25 @@ class ModelTrainer(Generic[TRawDatapoint, TTensorizedDatapoint, TNeuralModule]):
         parallelize,
         scheduler,
         show_progress_bar,
+        shuffle_input=True,
+        expected_num_minibatches=None,
     ):
         sum_epoch_loss, running_avg_loss, num_minibatches, num_samples = 0.0, 0.0, 0, 0
         start_time = time.time()
         self.neural_module.train()
-        with tqdm(desc="Training", disable=not show_progress_bar, leave=False) as progress_bar:
+        with tqdm(
+            desc="Training",
+            total=expected_num_minibatches,
+            disable=not show_progress_bar,
+            leave=False,
+        ) as progress_bar:
             for step_idx, (mb_data, raw_samples) in enumerate(
                 self.__model.minibatch_iterator(
                     training_tensors(),
                     device=device,
                     max_minibatch_size=self.__minibatch_size,
                     yield_partial_minibatches=False,
-                    shuffle_input=True,
+                    shuffle_input=shuffle_input,
                     parallelize=parallelize,
                 )
             ):
@@ -229,13 +236,23 @@ class ModelTrainer(Generic[TRawDatapoint, TTensorizedDatapoint, TNeuralModule]):
             self.LOGGER.info("Training Metrics: %s", json.dumps(train_metrics, indent=2))
 
     def _run_validation(
-        self, validation_tensors, epoch, best_target_metric, device, parallelize, show_progress_bar
+        self,
+        validation_tensors,
+        epoch,
+        best_target_metric,
+        device,
+        parallelize,
+        show_progress_bar,
+        expected_num_minibatches=None,
     ):
         self.neural_module.eval()
         sum_epoch_loss, num_minibatches, num_samples = 0.0, 0, 0
         start_time = time.time()
         with tqdm(
-            desc="Validation", disable=not show_progress_bar, leave=False
+            desc="Validation",
+            total=expected_num_minibatches,
+            disable=not show_progress_bar,
+            leave=False,
         ) as progress_bar, torch.no_grad():
             for mb_data, raw_samples in self.__model.minibatch_iterator(
                 validation_tensors(),
@@ -295,6 +312,9 @@ class ModelTrainer(Generic[TRawDatapoint, TTensorizedDatapoint, TNeuralModule]):
         exponential_running_average_factor: float = 0.97,
         device=None,
         store_tensorized_data_in_memory: bool = False,
+        shuffle_training_data: bool = True,
+        expected_num_training_minibatches: Optional[int] = None,
+        expected_num_validation_minibatches: Optional[int] = None,
     ) -> None:
         """
         The training-validation loop for `AbstractNeuralModel`s.
@@ -312,6 +332,11 @@ class ModelTrainer(Generic[TRawDatapoint, TTensorizedDatapoint, TNeuralModule]):
             displayed in the progress bar.
         :param device: the target PyTorch device for training
         :param store_tensorized_data_in_memory: store all tensorized data in memory instead of computing them on-line.
+        :param shuffle_training_data: Shuffle the training data before minibatching. Set this to False if
+            `training_data` already yields its samples in the desired (e.g. size-bucketed) order.
+        :param expected_num_training_minibatches: The (estimated) number of training minibatches per epoch, used as
+            the total of the progress bar.
+        :param expected_num_validation_minibatches: The (estimated) number of validation minibatches.
         """
         if initialize_metadata:
             self.__load_metadata_and_create_network(training_data, parallelize, show_progress_bar)
@@ -334,7 +359,7 @@ class ModelTrainer(Generic[TRawDatapoint, TTensorizedDatapoint, TNeuralModule]):
             iter(validation_data), parallelize=parallelize, use_multiprocessing=use_multiprocessing
         )
         if store_tensorized_data_in_memory:
-            training_tensors = MemorizedDataIterable(training_tensors, shuffle=True)
+            training_tensors = MemorizedDataIterable(training_tensors, shuffle=shuffle_training_data)
             validation_tensors = MemorizedDataIterable(validation_tensors)
 
         if device is None:
@@ -355,7 +380,13 @@ class ModelTrainer(Generic[TRawDatapoint, TTensorizedDatapoint, TNeuralModule]):
 
         if validate_on_start:
             target_metric, improved = self._run_validation(
-                validation_tensors, 0, best_target_metric, device, parallelize, show_progress_bar
+                validation_tensors,
+                0,
+                best_target_metric,
+                device,
+                parallelize,
+                show_progress_bar,
+                expected_num_validation_minibatches,
             )
             assert improved
             self.LOGGER.info(f"Initial {self.__target_metric or 'Loss'}: {target_metric}")
@@ -372,6 +403,8 @@ class ModelTrainer(Generic[TRawDatapoint, TTensorizedDatapoint, TNeuralModule]):
                 parallelize,
                 scheduler,
                 show_progress_bar,
+                shuffle_training_data,
+                expected_num_training_minibatches,
             )
 
             target_metric, target_metric_improved = self._run_validation(
@@ -381,6 +414,7 @@ class ModelTrainer(Generic[TRawDatapoint, TTensorizedDatapoint, TNeuralModule]):
                 device,
                 parallelize,
                 show_progress_bar,
+                expected_num_validation_minibatches,
             )
             if target_metric_improved:
                 self.LOGGER.info(
@@ -1,7 +1,9 @@
-from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+from itertools import islice
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, TypeVar, Union
 from typing_extensions import Final, TypedDict
 
 import torch
+from torch import nn
 
 from ptgnn.baseneuralmodel import AbstractNeuralModel, ModuleWithMetrics
 from ptgnn.baseneuralmodel.utils.data import enforce_not_None
@@ -20,17 +22,61 @@ from ptgnn.neuralmodels.sequence.grucopydecoder import (
     TokenizedOutput,
 )
 
+T = TypeVar("T")
 
-class CodeGraph2Seq(TypedDict):
+
+class CodeGraph2Seq(TypedDict, total=False):
     backbone_sequence: List[int]
     node_labels: List[str]
     edges: Dict[str, List[Tuple[int, int]]]
     method_name: List[str]
+    log_node: int
+    # The log level, in statement mode only
+    severity: str
+    # Multi-log graphs (all logs of a file in one graph) have a target per LOG node instead
+    method_names: List[List[str]]
+    log_nodes: List[int]
+    severities: List[str]
+
+
+def graph_targets(datapoint: CodeGraph2Seq) -> List[List[str]]:
+    """The targets of a graph, one per LOG node for multi-log graphs."""
+    if "method_names" in datapoint:
+        return datapoint["method_names"]
+    return [datapoint["method_name"]]
+
+
+def align_with_targets(
+    data: List[CodeGraph2Seq], decoded_graphs: List[CodeGraph2Seq], decoded: List[T]
+) -> List[Optional[T]]:
+    """
+    One entry per target of each graph of `data` (see `graph_targets`), None for the targets of the graphs that
+    `tensorize` discarded (e.g. graphs without a LOG node when reading out the LOG node).
+
+    :param decoded_graphs: the graphs that were decoded, the same objects as in `data` and in the same order.
+    :param decoded: one entry per target of each of the `decoded_graphs`.
+    """
+    decoded_entries = iter(decoded)
+    remaining_graphs = iter(decoded_graphs)
+    next_decoded_graph = next(remaining_graphs, None)
+    aligned: List[Optional[T]] = []
+    for graph in data:
+        num_targets = len(graph_targets(graph))
+        if graph is next_decoded_graph:
+            aligned.extend(islice(decoded_entries, num_targets))
+            next_decoded_graph = next(remaining_graphs, None)
+        else:
+            aligned.extend([None] * num_targets)
+    assert next_decoded_graph is None and len(aligned) == sum(
+        len(graph_targets(d)) for d in data
+    ), "The decoded graphs are not in the order of the data."
+    return aligned
 
 
 class TensorizedGraph2Seq(NamedTuple):
     encoder_data: TensorizedGraphData
-    decoder_data: TokenizedOutput
+    # One per target
+    decoder_data: List[TokenizedOutput]
 
 
 class Graph2SeqModule(ModuleWithMetrics):
@@ -38,12 +84,30 @@ class Graph2SeqModule(ModuleWithMetrics):
         self,
         gnn: GraphNeuralNetwork,
         decoder: GruCopyingDecoder,
-        node_to_graph_representation: AbstractVarSizedElementReduce,
+        node_to_graph_representation: Union[AbstractVarSizedElementReduce, nn.Linear],
+        log_node_readout: bool = False,
+        prune_gnn: bool = False,
     ):
+        """
+        :param node_to_graph_representation: computes the initial decoder state from the node representations. An
+            `nn.Linear` over the representations of the LOG node when `log_node_readout` is set.
+        :param log_node_readout: initialize the decoder from the LOG node instead of all nodes.
+        :param prune_gnn: only compute the node states that the LOG node and the backbone nodes depend on, see
+            `GraphNeuralNetwork.pruned_gnn`. Requires `log_node_readout`.
+        """
         super().__init__()
+        assert log_node_readout or not prune_gnn, "Pruning the GNN requires the LOG node readout."
         self._gnn = gnn
         self._decoder = decoder
         self.__node_to_graph_representation = node_to_graph_representation
+        self.__log_node_readout = log_node_readout
+        self.__prune_gnn = prune_gnn
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Modules pickled before the LOG node readout and the GNN pruning were added summarize all nodes.
+        state.setdefault("_Graph2SeqModule__log_node_readout", False)
+        state.setdefault("_Graph2SeqModule__prune_gnn", False)
+        super().__setstate__(state)
 
     def _reset_module_metrics(self) -> None:
         self.__loss_sum = 0.0
@@ -52,8 +116,56 @@ class Graph2SeqModule(ModuleWithMetrics):
     def _module_metrics(self) -> Dict[str, Any]:
         return {"loss": self.__loss_sum / self.__num_mbs}
 
+    def _run_gnn(self, encoder_mb_data: Dict[str, Any]) -> GnnOutput:
+        if self.__prune_gnn:
+            return self._gnn(
+                **encoder_mb_data, prune_to_references=("log_node", "backbone_nodes")
+            )
+        return self._gnn(**encoder_mb_data)
+
+    def _get_input_memories(self, gnn_output: GnnOutput) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        The representations of the backbone nodes the decoder reads, along with the index of the target each of them
+        belongs to. When the graphs have LOG node references, each LOG node is a target of its own, and reads the
+        backbone of its graph. Otherwise, each graph is a target.
+        """
+        backbone_nodes = gnn_output.node_idx_references["backbone_nodes"]
+        backbone_graph_idx = gnn_output.node_graph_idx_reference["backbone_nodes"]
+        if "log_node" not in gnn_output.node_graph_idx_reference:
+            return gnn_output.output_node_representations[backbone_nodes], backbone_graph_idx
+
+        # The backbone nodes are grouped by graph. Repeat the backbone of each graph for every LOG node in it.
+        target_graph_idx = gnn_output.node_graph_idx_reference["log_node"]
+        backbone_lengths = torch.bincount(backbone_graph_idx, minlength=gnn_output.num_graphs)
+        backbone_starts = torch.cumsum(backbone_lengths, dim=0) - backbone_lengths
+        target_lengths = backbone_lengths[target_graph_idx]
+        memory_target_idx = torch.repeat_interleave(
+            torch.arange(target_graph_idx.shape[0], device=target_lengths.device), target_lengths
+        )
+        target_starts = torch.cumsum(target_lengths, dim=0) - target_lengths
+        idx_in_backbone = (
+            torch.arange(memory_target_idx.shape[0], device=target_lengths.device)
+            - target_starts[memory_target_idx]
+        )
+        memory_nodes = backbone_nodes[
+            backbone_starts[target_graph_idx][memory_target_idx] + idx_in_backbone
+        ]
+        return gnn_output.output_node_representations[memory_nodes], memory_target_idx
+
     def _get_initial_decoder_states(self, gnn_output: GnnOutput):
-        return self.__node_to_graph_representation(
+        if self.__log_node_readout:
+            # One initial state per LOG node, in the order of the graphs.
+            log_nodes = gnn_output.node_idx_references["log_node"]
+            return self.__node_to_graph_representation(
+                torch.cat(
+                    (
+                        gnn_output.input_node_representations[log_nodes],
+                        gnn_output.output_node_representations[log_nodes],
+                    ),
+                    dim=-1,
+                )
+            )
+        graph_representations = self.__node_to_graph_representation(
             ElementsToSummaryRepresentationInput(
                 element_embeddings=torch.cat(
                     (gnn_output.input_node_representations, gnn_output.output_node_representations),
@@ -63,16 +175,19 @@ class Graph2SeqModule(ModuleWithMetrics):
                 num_samples=gnn_output.num_graphs,
             )
         )
+        if "log_node" in gnn_output.node_graph_idx_reference:
+            # All LOG nodes of a graph start from the representation of their graph.
+            return graph_representations[gnn_output.node_graph_idx_reference["log_node"]]
+        return graph_representations
 
-    def forward(self, *, encoder_mb_data: Dict[str, Any], decoder_mb_data: Dict[str, Any]):
-        gnn_output: GnnOutput = self._gnn(**encoder_mb_data)
-
+    def _decoder_loss(
+        self, gnn_output: GnnOutput, initial_states: torch.Tensor, decoder_mb_data: Dict[str, Any]
+    ) -> torch.Tensor:
+        input_memories, input_memories_origin_idx = self._get_input_memories(gnn_output)
         loss = self._decoder(
-            input_memories=gnn_output.output_node_representations[
-                gnn_output.node_idx_references["backbone_nodes"]
-            ],
-            input_memories_origin_idx=gnn_output.node_graph_idx_reference["backbone_nodes"],
-            initial_states=self._get_initial_decoder_states(gnn_output),
+            input_memories=input_memories,
+            input_memories_origin_idx=input_memories_origin_idx,
+            initial_states=initial_states,
             **decoder_mb_data
         )
         with torch.no_grad():
@@ -80,6 +195,12 @@ class Graph2SeqModule(ModuleWithMetrics):
             self.__num_mbs += 1
         return loss
 
+    def forward(self, *, encoder_mb_data: Dict[str, Any], decoder_mb_data: Dict[str, Any]):
+        gnn_output: GnnOutput = self._run_gnn(encoder_mb_data)
+        return self._decoder_loss(
+            gnn_output, self._get_initial_decoder_states(gnn_output), decoder_mb_data
+        )
+
 
 class Graph2Seq(AbstractNeuralModel[CodeGraph2Seq, TensorizedGraph2Seq, Graph2SeqModule]):
     def __init__(
@@ -87,11 +208,34 @@ class Graph2Seq(AbstractNeuralModel[CodeGraph2Seq, TensorizedGraph2Seq, Graph2Se
         gnn_model: GraphNeuralNetworkModel,
         decoder: GruCopyingDecoderModel,
         num_summarization_heads: int = 8,
+        log_node_readout: bool = False,
+        prune_gnn: bool = False,
     ):
+        """
+        :param log_node_readout: initialize the decoder from the representation of the LOG node (`log_node`)
+            instead of summarizing all nodes of the graph. Graphs without a LOG node are discarded. Multi-log graphs
+            (with `log_nodes` and `method_names`) always have a target per LOG node, this only selects how the
+            decoder of each of them is initialized.
+        :param prune_gnn: only run the GNN on the part of the graph the LOG node and the backbone nodes depend on.
+            Gives the same results with less computation. Requires `log_node_readout`.
+        """
         super().__init__()
+        assert log_node_readout or not prune_gnn, "Pruning the GNN requires the LOG node readout."
         self.__gnn_model = gnn_model
         self.__decoder_model = decoder
         self.num_summarization_heads: Final = num_summarization_heads
+        self.log_node_readout: Final = log_node_readout
+        self.prune_gnn: Final = prune_gnn
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Models pickled before the LOG node readout and the GNN pruning were added summarize all nodes.
+        state.setdefault("log_node_readout", False)
+        state.setdefault("prune_gnn", False)
+        self.__dict__.update(state)
+
+    @property
+    def gnn_model(self) -> GraphNeuralNetworkModel:
+        return self.__gnn_model
 
     def update_metadata_from(self, datapoint: CodeGraph2Seq) -> None:
         graph_nodes = [l.lower() for l in datapoint["node_labels"]]
@@ -103,43 +247,70 @@ class Graph2Seq(AbstractNeuralModel[CodeGraph2Seq, TensorizedGraph2Seq, Graph2Se
             )
         )
 
-        self.__decoder_model.update_metadata_from(
-            DecoderData(
-                input_elements=[graph_nodes[k] for k in datapoint["backbone_sequence"]],
-                target_data=datapoint["method_name"],
-            ),
-        )
+        input_elements = [graph_nodes[k] for k in datapoint["backbone_sequence"]]
+        for target in graph_targets(datapoint):
+            self.__decoder_model.update_metadata_from(
+                DecoderData(input_elements=input_elements, target_data=target),
+            )
 
     def build_neural_module(self) -> Graph2SeqModule:
         gnn = self.__gnn_model.build_neural_module()
         decoder = self.__decoder_model.build_neural_module()
-        node_to_graph_representation = MultiheadSelfAttentionVarSizedElementReduce(
-            input_representation_size=gnn.input_node_state_dim + gnn.output_node_state_dim,
-            hidden_size=gnn.input_node_state_dim + gnn.output_node_state_dim,
-            output_representation_size=gnn.output_node_state_dim,
-            num_heads=self.num_summarization_heads,
-            query_representation_summarizer=SimpleVarSizedElementReduce("max"),
+        if self.log_node_readout:
+            node_to_graph_representation = nn.Linear(
+                gnn.input_node_state_dim + gnn.output_node_state_dim, gnn.output_node_state_dim
+            )
+        else:
+            node_to_graph_representation = MultiheadSelfAttentionVarSizedElementReduce(
+                input_representation_size=gnn.input_node_state_dim + gnn.output_node_state_dim,
+                hidden_size=gnn.input_node_state_dim + gnn.output_node_state_dim,
+                output_representation_size=gnn.output_node_state_dim,
+                num_heads=self.num_summarization_heads,
+                query_representation_summarizer=SimpleVarSizedElementReduce("max"),
+            )
+        return self._create_neural_module(gnn, decoder, node_to_graph_representation)
+
+    def _create_neural_module(
+        self,
+        gnn: GraphNeuralNetwork,
+        decoder: GruCopyingDecoder,
+        node_to_graph_representation: Union[AbstractVarSizedElementReduce, nn.Linear],
+    ) -> Graph2SeqModule:
+        return Graph2SeqModule(
+            gnn,
+            decoder,
+            node_to_graph_representation,
+            log_node_readout=self.log_node_readout,
+            prune_gnn=self.prune_gnn,
         )
-        return Graph2SeqModule(gnn, decoder, node_to_graph_representation)
 
     def tensorize(self, datapoint: CodeGraph2Seq) -> Optional[TensorizedGraph2Seq]:
         graph_nodes = [l.lower() for l in datapoint["node_labels"]]
+        reference_nodes = {"backbone_nodes": datapoint["backbone_sequence"]}
+        targets = graph_targets(datapoint)
+        if "log_nodes" in datapoint:
+            if len(datapoint["log_nodes"]) == 0 or len(datapoint["log_nodes"]) != len(targets):
+                return None  # Discard example, the LOG nodes do not match the targets
+            reference_nodes["log_node"] = datapoint["log_nodes"]
+        elif self.log_node_readout:
+            if datapoint.get("log_node", -1) < 0:
+                return None  # Discard example, there is no LOG node to read out
+            reference_nodes["log_node"] = [datapoint["log_node"]]
         graph_data = self.__gnn_model.tensorize(
             GraphData(
                 node_information=graph_nodes,
                 edges=datapoint["edges"],
-                reference_nodes={"backbone_nodes": datapoint["backbone_sequence"]},
+                reference_nodes=reference_nodes,
             )
         )
         if graph_data is None:
             return None  # Discard example
 
-        target_data = self.__decoder_model.tensorize(
-            DecoderData(
-                input_elements=[graph_nodes[k] for k in datapoint["backbone_sequence"]],
-                target_data=datapoint["method_name"],
-            )
-        )
+        input_elements = [graph_nodes[k] for k in datapoint["backbone_sequence"]]
+        target_data = [
+            self.__decoder_model.tensorize(DecoderData(input_elements=input_elements, target_data=target))
+            for target in targets
+        ]
 
         return TensorizedGraph2Seq(encoder_data=graph_data, decoder_data=target_data)
 
@@ -155,9 +326,10 @@ class Graph2Seq(AbstractNeuralModel[CodeGraph2Seq, TensorizedGraph2Seq, Graph2Se
         continue_adding = self.__gnn_model.extend_minibatch_with(
             tensorized_datapoint.encoder_data, partial_minibatch["encoder_mb_data"]
         )
-        continue_adding &= self.__decoder_model.extend_minibatch_with(
-            tensorized_datapoint.decoder_data, partial_minibatch["decoder_mb_data"]
-        )
+        for target_data in tensorized_datapoint.decoder_data:
+            continue_adding &= self.__decoder_model.extend_minibatch_with(
+                target_data, partial_minibatch["decoder_mb_data"]
+            )
         return continue_adding
 
     def finalize_minibatch(
@@ -174,32 +346,90 @@ class Graph2Seq(AbstractNeuralModel[CodeGraph2Seq, TensorizedGraph2Seq, Graph2Se
 
     def greedy_decode(
         self, data: List[CodeGraph2Seq], trained_network: Graph2SeqModule, device: Any
-    ) -> List[Tuple[List[str], float]]:
-        decoded_sequences = []
-        for mb_data, input_data in self.minibatch_iterator(
-            self.tensorize_dataset(iter(data), return_input_data=True),
+    ) -> List[Optional[Tuple[List[str], float]]]:
+        """
+        The decoded sequences, one per target of each graph (see `graph_targets`). None for the targets of the graphs
+        the model discards.
+        """
+        return self.__decode(data, trained_network, device, beam_size=1)
+
+    def beam_decode(
+        self,
+        data: List[CodeGraph2Seq],
+        trained_network: Graph2SeqModule,
+        device: Any,
+        beam_size: int = 5,
+    ) -> List[Optional[Tuple[List[str], float]]]:
+        """
+        The most likely sequence found by beam search, one per target of each graph (see `graph_targets`). None for
+        the targets of the graphs the model discards.
+        """
+        return self.__decode(data, trained_network, device, beam_size=beam_size)
+
+    def _decoding_minibatches(
+        self, data: List[CodeGraph2Seq], device: Any
+    ) -> Iterator[Tuple[Dict[str, Any], List[CodeGraph2Seq]]]:
+        """
+        The minibatches of the graphs of `data` that are not discarded, along with these graphs. They are tensorized
+        in threads, so the graphs are the objects of `data` (see `align_with_targets`).
+        """
+        return self.minibatch_iterator(
+            self.tensorize_dataset(iter(data), use_multiprocessing=False, return_input_data=True),
             device,
             max_minibatch_size=50,
-        ):
-            input_concrete_values: List[str] = []
-            for sample in input_data:
-                sample = enforce_not_None(sample)
-                input_concrete_values.extend(
-                    sample["node_labels"][k].lower() for k in sample["backbone_sequence"]
-                )
+        )
 
+    def __decode(
+        self, data: List[CodeGraph2Seq], trained_network: Graph2SeqModule, device: Any, beam_size: int
+    ) -> List[Optional[Tuple[List[str], float]]]:
+        decoded_graphs, decoded_sequences = [], []
+        for mb_data, input_data in self._decoding_minibatches(data, device):
+            decoded_graphs.extend(input_data)
             with torch.no_grad():
-                gnn_output = trained_network._gnn(**mb_data["encoder_mb_data"])  # type: GnnOutput
-                mb_outputs = self.__decoder_model.greedy_decode(
-                    input_concrete_values=input_concrete_values,
-                    input_memories=gnn_output.output_node_representations[
-                        gnn_output.node_idx_references["backbone_nodes"]
-                    ],
-                    input_memories_origin_idx=gnn_output.node_graph_idx_reference["backbone_nodes"],
-                    initial_states=trained_network._get_initial_decoder_states(gnn_output),
-                    neural_model=trained_network._decoder,
+                gnn_output = trained_network._run_gnn(mb_data["encoder_mb_data"])  # type: GnnOutput
+                decoded_sequences.extend(
+                    self._decode_minibatch(
+                        input_data,
+                        gnn_output,
+                        trained_network._get_initial_decoder_states(gnn_output),
+                        trained_network,
+                        beam_size=beam_size,
+                    )
                 )
-                decoded_sequences.extend(mb_outputs)
 
-        assert len(decoded_sequences) == len(data)
-        return decoded_sequences
+        return align_with_targets(data, decoded_graphs, decoded_sequences)
+
+    def _decode_minibatch(
+        self,
+        input_data: List[Optional[CodeGraph2Seq]],
+        gnn_output: GnnOutput,
+        initial_states: torch.Tensor,
+        trained_network: Graph2SeqModule,
+        beam_size: int = 1,
+    ) -> List[Tuple[List[str], float]]:
+        """Decode the targets of a minibatch, greedily if `beam_size` is 1 and with beam search otherwise."""
+        input_concrete_values: List[str] = []
+        for sample in input_data:
+            sample = enforce_not_None(sample)
+            backbone_values = [sample["node_labels"][k].lower() for k in sample["backbone_sequence"]]
+            for _ in graph_targets(sample):
+                input_concrete_values.extend(backbone_values)
+
+        input_memories, input_memories_origin_idx = trained_network._get_input_memories(gnn_output)
+        if beam_size == 1:
+            return self.__decoder_model.greedy_decode(
+                input_concrete_values=input_concrete_values,
+                input_memories=input_memories,
+                input_memories_origin_idx=input_memories_origin_idx,
+                initial_states=initial_states,
+                neural_model=trained_network._decoder,
+            )
+        beams = self.__decoder_model.beam_decode(
+            input_concrete_values=input_concrete_values,
+            input_memories=input_memories,
+            input_memories_origin_idx=input_memories_origin_idx,
+            initial_states=initial_states,
+            neural_model=trained_network._decoder,
+            beam_size=beam_size,
+        )
+        return [target_beams[0] for target_beams in beams]
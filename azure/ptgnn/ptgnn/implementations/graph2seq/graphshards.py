@@ -0,0 +1,209 @@
+"""
+Data source for the sharded binary graph format written by `convertCorpusForML.py --binary`.
+
+A split is a folder (e.g. `trainLogs.shards`) with an `index.json` listing its shards. Each shard is a folder of `.npy`
+arrays that are memory-mapped, so graphs are read without any gunzipping or JSON parsing.
+"""
+import json
+import random
+import zlib
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+from dpu_utils.utils import RichPath
+
+from ptgnn.implementations.graph2seq.graph2seq import CodeGraph2Seq
+from ptgnn.implementations.graph2seq.sizeindex import load_size_index
+
+
+class GraphShard:
+    """
+    A single memory-mapped shard. The values of all graphs are stored one after the other in one array per field,
+    `<field>_offsets.npy` holds where the values of each graph start and end.
+    """
+
+    def __init__(self, shard_folder: Path):
+        with open(shard_folder / "shard.json") as f:
+            metadata = json.load(f)
+        self.__num_graphs: int = metadata["num_graphs"]
+        self.__strings = np.array(metadata["strings"], dtype=object)
+        self.__multi_log: bool = metadata.get("multi_log", False)
+        self.__has_severity: bool = metadata.get("severity", False)
+
+        def load_ragged(name: str):
+            return (
+                np.load(shard_folder / f"{name}.npy", mmap_mode="r"),
+                np.load(shard_folder / f"{name}_offsets.npy", mmap_mode="r"),
+            )
+
+        if self.__multi_log:
+            self.__log_nodes = load_ragged("log_nodes")
+            self.__method_name_lengths = load_ragged("method_name_lengths")
+        else:
+            self.__log_nodes = np.load(shard_folder / "log_node.npy", mmap_mode="r")
+        if self.__has_severity:
+            self.__severities = load_ragged("severity")
+        self.__node_labels = load_ragged("node_labels")
+        self.__method_names = load_ragged("method_name")
+        self.__backbone_sequences = load_ragged("backbone_sequence")
+        self.__edges = {
+            edge_type: load_ragged("edges_" + edge_type) for edge_type in metadata["edge_types"]
+        }
+
+    def __len__(self) -> int:
+        return self.__num_graphs
+
+    @staticmethod
+    def __graph_values(ragged, idx: int) -> np.ndarray:
+        values, offsets = ragged
+        # np.asarray drops the memmap subclass, the result is a plain view that pickles like any array.
+        return np.asarray(values[offsets[idx] : offsets[idx + 1]])
+
+    def __getitem__(self, idx: int) -> CodeGraph2Seq:
+        """
+        The graph at the given index, in the same format as the jsonl files. The backbone sequence and the edges are
+        numpy views into the shard instead of lists. Multi-log graphs have `log_nodes`, `method_names` and `severities`
+        instead of `log_node`, `method_name` and `severity`. The severities are only there in statement mode.
+        """
+        edges: Dict[str, Any] = {}
+        for edge_type, ragged in self.__edges.items():
+            type_edges = self.__graph_values(ragged, idx)
+            if len(type_edges) > 0:
+                edges[edge_type] = type_edges
+        graph = {
+            "backbone_sequence": self.__graph_values(self.__backbone_sequences, idx),
+            "node_labels": self.__strings[self.__graph_values(self.__node_labels, idx)].tolist(),
+            "edges": edges,
+        }
+        method_name = self.__strings[self.__graph_values(self.__method_names, idx)].tolist()
+        if self.__multi_log:
+            # the tokens of all logs are stored one after the other
+            lengths = self.__graph_values(self.__method_name_lengths, idx).tolist()
+            starts = np.cumsum([0] + lengths).tolist()
+            graph["method_names"] = [
+                method_name[start : start + length] for start, length in zip(starts, lengths)
+            ]
+            graph["log_nodes"] = self.__graph_values(self.__log_nodes, idx).tolist()
+        else:
+            graph["method_name"] = method_name
+            graph["log_node"] = int(self.__log_nodes[idx])
+        if self.__has_severity:
+            severities = self.__strings[self.__graph_values(self.__severities, idx)].tolist()
+            if self.__multi_log:
+                graph["severities"] = severities
+            else:
+                graph["severity"] = severities[0]
+        return graph
+
+
+def is_graph_shards(path: Union[str, Path]) -> bool:
+    return (Path(path) / "index.json").exists()
+
+
+def read_graph_shards(path: Union[str, Path], shuffle: bool = False) -> Iterator[CodeGraph2Seq]:
+    """
+    Yield all graphs of a sharded split, one shard at a time.
+
+    :param path: the folder of the split, containing `index.json`.
+    :param shuffle: shuffle the order of the shards and of the graphs within each shard.
+    """
+    path = Path(path)
+    with open(path / "index.json") as f:
+        shard_names: List[str] = [s["name"] for s in json.load(f)["shards"]]
+    if shuffle:
+        random.shuffle(shard_names)
+    for shard_name in shard_names:
+        shard = GraphShard(path / shard_name)
+        graph_order = list(range(len(shard)))
+        if shuffle:
+            random.shuffle(graph_order)
+        for idx in graph_order:
+            yield shard[idx]
+
+
+def read_graph_shards_at(path: Union[str, Path], positions: Sequence[int]) -> Iterator[CodeGraph2Seq]:
+    """Yield the graphs at the given positions of a sharded split, in the order of `positions`."""
+    path = Path(path)
+    with open(path / "index.json") as f:
+        shards = json.load(f)["shards"]
+    shard_starts = np.cumsum([0] + [s["num_graphs"] for s in shards])
+    opened_shards: Dict[int, GraphShard] = {}
+    for position in positions:
+        shard_idx = int(np.searchsorted(shard_starts, position, side="right")) - 1
+        if shard_idx not in opened_shards:
+            opened_shards[shard_idx] = GraphShard(path / shards[shard_idx]["name"])
+        yield opened_shards[shard_idx][position - int(shard_starts[shard_idx])]
+
+
+class GzipMember:
+    """
+    A gzip member of a file, starting at a known byte offset. It is only decompressed as far as it is read, so reading
+    a line near its start does not decompress the whole member.
+    """
+
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, f: BinaryIO, member_offset: int):
+        self.__f = f
+        self.__next_read_offset = member_offset
+        self.__decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)  # gzip header and trailer
+        self.__data = bytearray()
+
+    def read(self, start: int, length: int) -> bytes:
+        """The `length` bytes at `start` of the decompressed member."""
+        while len(self.__data) < start + length and not self.__decompressor.eof:
+            self.__f.seek(self.__next_read_offset)
+            compressed = self.__f.read(self.READ_SIZE)
+            if len(compressed) == 0:
+                break
+            self.__next_read_offset += len(compressed)
+            self.__data += self.__decompressor.decompress(compressed)
+        return bytes(self.__data[start : start + length])
+
+
+def read_jsonl_at(
+    path: Union[str, Path], positions: Sequence[int], index: List[Dict[str, Any]]
+) -> Iterator[CodeGraph2Seq]:
+    """
+    Yield the graphs at the given positions of a (gzipped) jsonl split, using the offsets of the size index. Lines
+    that are not selected are skipped without being parsed. In a gzipped file, each graph is read from the gzip member
+    holding it (`member` in the size index), which is decompressed up to the graph.
+    """
+    with open(path, "rb") as f:
+        if not str(path).endswith(".gz"):
+            for position in positions:
+                f.seek(index[position]["offset"])
+                yield json.loads(f.read(index[position]["length"]))
+            return
+
+        # The offsets count the bytes of the whole decompressed file, the first line of a member starts the member.
+        member_starts: Dict[int, int] = {}
+        for entry in index:
+            member_starts.setdefault(entry["member"], entry["offset"])
+        member_offset, member = None, None
+        for position in positions:
+            entry = index[position]
+            if entry["member"] != member_offset:
+                member_offset, member = entry["member"], GzipMember(f, entry["member"])
+            yield json.loads(member.read(entry["offset"] - member_starts[member_offset], entry["length"]))
+
+
+def read_graph_data(
+    path: str, azure_info_path: Optional[str] = None, positions: Optional[Sequence[int]] = None
+) -> Iterator[CodeGraph2Seq]:
+    """
+    Yield the graphs of a split, either from a sharded folder or from a (gzipped) jsonl file.
+
+    :param positions: only yield the graphs at these positions of the split, in this order (see `sizeindex`). Needs
+        the size index of the split.
+    """
+    if positions is not None:
+        if is_graph_shards(path):
+            return read_graph_shards_at(path, positions)
+        index = load_size_index(path)
+        assert index is not None, f"No size index was found for {path}."
+        return read_jsonl_at(path, positions, index)
+    if is_graph_shards(path):
+        return read_graph_shards(path)
+    return RichPath.create(path, azure_info_path).read_as_jsonl()
@@ -0,0 +1,227 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+from typing_extensions import Final
+
+import torch
+from torch import nn
+
+from ptgnn.implementations.graph2seq.graph2seq import (
+    CodeGraph2Seq,
+    Graph2Seq,
+    Graph2SeqModule,
+    TensorizedGraph2Seq,
+    align_with_targets,
+    graph_targets,
+)
+from ptgnn.implementations.severity.severityclassifier import (
+    SEVERITY_LEVELS,
+    graph_severities,
+    severity_class,
+)
+from ptgnn.neuralmodels.gnn.graphneuralnetwork import GraphNeuralNetwork, GraphNeuralNetworkModel
+from ptgnn.neuralmodels.gnn.structs import GnnOutput, TensorizedGraphData
+from ptgnn.neuralmodels.reduceops import AbstractVarSizedElementReduce
+from ptgnn.neuralmodels.sequence.grucopydecoder import (
+    GruCopyingDecoder,
+    GruCopyingDecoderModel,
+    TokenizedOutput,
+)
+
+# The class of the logs without a known severity, they do not count towards the severity loss.
+UNKNOWN_SEVERITY_CLASS: Final = -100
+
+
+class TensorizedMultiTaskGraph2Seq(NamedTuple):
+    encoder_data: TensorizedGraphData
+    # One per target
+    decoder_data: List[TokenizedOutput]
+    severity_classes: List[int]
+
+
+class MultiTaskGraph2SeqModule(Graph2SeqModule):
+    def __init__(
+        self,
+        gnn: GraphNeuralNetwork,
+        decoder: GruCopyingDecoder,
+        node_to_graph_representation: Union[AbstractVarSizedElementReduce, nn.Linear],
+        log_node_readout: bool = False,
+        prune_gnn: bool = False,
+        message_loss_weight: float = 1.0,
+        severity_loss_weight: float = 1.0,
+    ):
+        super().__init__(
+            gnn,
+            decoder,
+            node_to_graph_representation,
+            log_node_readout=log_node_readout,
+            prune_gnn=prune_gnn,
+        )
+        # The severity is classified from the initial decoder state of each log.
+        self.__severity_head = nn.Linear(gnn.output_node_state_dim, len(SEVERITY_LEVELS))
+        self.__severity_loss = nn.CrossEntropyLoss(ignore_index=UNKNOWN_SEVERITY_CLASS)
+        self.__message_loss_weight = message_loss_weight
+        self.__severity_loss_weight = severity_loss_weight
+
+    def _reset_module_metrics(self) -> None:
+        super()._reset_module_metrics()
+        self.__num_severities = 0
+        self.__num_correct_severities = 0
+
+    def _module_metrics(self) -> Dict[str, Any]:
+        return {
+            **super()._module_metrics(),
+            "severity_accuracy": self.__num_correct_severities / max(self.__num_severities, 1),
+        }
+
+    def predict_severities(self, initial_states: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """The probability and the class of the most likely severity of each log."""
+        probs = torch.softmax(self.__severity_head(initial_states), dim=-1)
+        return torch.max(probs, dim=-1)
+
+    def forward(
+        self,
+        *,
+        encoder_mb_data: Dict[str, Any],
+        decoder_mb_data: Dict[str, Any],
+        severity_classes: torch.Tensor
+    ):
+        gnn_output: GnnOutput = self._run_gnn(encoder_mb_data)
+        initial_states = self._get_initial_decoder_states(gnn_output)
+        message_loss = self._decoder_loss(gnn_output, initial_states, decoder_mb_data)
+
+        severity_logits = self.__severity_head(initial_states)
+        with torch.no_grad():
+            known_severities = severity_classes != UNKNOWN_SEVERITY_CLASS
+            self.__num_correct_severities += int(
+                (torch.argmax(severity_logits, dim=-1) == severity_classes)[known_severities].sum()
+            )
+            self.__num_severities += int(known_severities.sum())
+        if bool(known_severities.any()):
+            severity_loss = self.__severity_loss(severity_logits, severity_classes)
+        else:
+            severity_loss = severity_logits.sum() * 0.0
+
+        return (
+            self.__message_loss_weight * message_loss + self.__severity_loss_weight * severity_loss
+        )
+
+
+class MultiTaskGraph2Seq(Graph2Seq):
+    """
+    A `Graph2Seq` that also classifies the severity of each log, from the same GNN pass. Trains on the statement mode
+    files of `convertCorpusForML.py`, which have both the tokenized msg (`method_name`) and the `severity` of each log.
+    Logs with an unknown severity are only used for the msg.
+    """
+
+    def __init__(
+        self,
+        gnn_model: GraphNeuralNetworkModel,
+        decoder: GruCopyingDecoderModel,
+        num_summarization_heads: int = 8,
+        log_node_readout: bool = False,
+        prune_gnn: bool = False,
+        message_loss_weight: float = 1.0,
+        severity_loss_weight: float = 1.0,
+    ):
+        """
+        :param message_loss_weight: the weight of the msg decoder's loss in the training loss.
+        :param severity_loss_weight: the weight of the severity classifier's loss in the training loss.
+        """
+        super().__init__(
+            gnn_model,
+            decoder,
+            num_summarization_heads=num_summarization_heads,
+            log_node_readout=log_node_readout,
+            prune_gnn=prune_gnn,
+        )
+        self.message_loss_weight: Final = message_loss_weight
+        self.severity_loss_weight: Final = severity_loss_weight
+
+    def _create_neural_module(
+        self,
+        gnn: GraphNeuralNetwork,
+        decoder: GruCopyingDecoder,
+        node_to_graph_representation: Union[AbstractVarSizedElementReduce, nn.Linear],
+    ) -> MultiTaskGraph2SeqModule:
+        return MultiTaskGraph2SeqModule(
+            gnn,
+            decoder,
+            node_to_graph_representation,
+            log_node_readout=self.log_node_readout,
+            prune_gnn=self.prune_gnn,
+            message_loss_weight=self.message_loss_weight,
+            severity_loss_weight=self.severity_loss_weight,
+        )
+
+    def tensorize(self, datapoint: CodeGraph2Seq) -> Optional[TensorizedMultiTaskGraph2Seq]:
+        if "severity" not in datapoint and "severities" not in datapoint:
+            return None  # Discard example, it is not from a statement mode file
+        severities = graph_severities(datapoint)
+        if len(severities) != len(graph_targets(datapoint)):
+            return None  # Discard example, the severities do not match the targets
+
+        tensorized_datapoint = super().tensorize(datapoint)
+        if tensorized_datapoint is None:
+            return None  # Discard example
+
+        severity_classes = [severity_class(severity) for severity in severities]
+        return TensorizedMultiTaskGraph2Seq(
+            encoder_data=tensorized_datapoint.encoder_data,
+            decoder_data=tensorized_datapoint.decoder_data,
+            severity_classes=[
+                UNKNOWN_SEVERITY_CLASS if cls is None else cls for cls in severity_classes
+            ],
+        )
+
+    def initialize_minibatch(self) -> Dict[str, Any]:
+        return {**super().initialize_minibatch(), "severity_classes": []}
+
+    def extend_minibatch_with(
+        self, tensorized_datapoint: TensorizedMultiTaskGraph2Seq, partial_minibatch: Dict[str, Any]
+    ) -> bool:
+        partial_minibatch["severity_classes"].extend(tensorized_datapoint.severity_classes)
+        return super().extend_minibatch_with(
+            TensorizedGraph2Seq(
+                encoder_data=tensorized_datapoint.encoder_data,
+                decoder_data=tensorized_datapoint.decoder_data,
+            ),
+            partial_minibatch,
+        )
+
+    def finalize_minibatch(
+        self, accumulated_minibatch_data: Dict[str, Any], device: Union[str, torch.device]
+    ) -> Dict[str, Any]:
+        return {
+            **super().finalize_minibatch(accumulated_minibatch_data, device),
+            "severity_classes": torch.tensor(
+                accumulated_minibatch_data["severity_classes"], dtype=torch.int64, device=device
+            ),
+        }
+
+    def decode_with_severities(
+        self,
+        data: List[CodeGraph2Seq],
+        trained_network: MultiTaskGraph2SeqModule,
+        device: Any,
+        beam_size: int = 1,
+    ) -> List[Optional[Tuple[List[str], float, str, float]]]:
+        """
+        The decoded msg of each log along with its log probability, and the predicted severity along with its
+        probability. Both come from one GNN pass. The msgs are decoded greedily if `beam_size` is 1, and with beam
+        search otherwise. None for the logs of the graphs the model discards.
+        """
+        decoded_graphs, predictions = [], []
+        for mb_data, input_data in self._decoding_minibatches(data, device):
+            decoded_graphs.extend(input_data)
+            with torch.no_grad():
+                gnn_output = trained_network._run_gnn(mb_data["encoder_mb_data"])  # type: GnnOutput
+                initial_states = trained_network._get_initial_decoder_states(gnn_output)
+                decoded_sequences = self._decode_minibatch(
+                    input_data, gnn_output, initial_states, trained_network, beam_size=beam_size
+                )
+                severity_probs, severity_classes = trained_network.predict_severities(initial_states)
+            for (tokens, logprob), severity, severity_prob in zip(
+                decoded_sequences, severity_classes.tolist(), severity_probs.tolist()
+            ):
+                predictions.append((tokens, logprob, SEVERITY_LEVELS[severity], severity_prob))
+
+        return align_with_targets(data, decoded_graphs, predictions)
@@ -0,0 +1,91 @@
+"""
+The per-graph size index written by `convertCorpusForML.py` next to each split, e.g.
+`trainLogs.jsonl.gz.index.jsonl` for `trainLogs.jsonl.gz`.
+
+Each line holds the sizes of one graph, in the same order as the split:
+`{"nodes": 535, "edges": {"AST_CHILD": 456, ...}, "backbone": 456, "target": 1, "offset": 0, ...}`
+This allows filtering out oversized graphs, grouping graphs of similar size and estimating the length of an epoch
+without reading the graphs themselves.
+"""
+import json
+import random
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+SizeIndex = List[Dict[str, Any]]
+
+
+def size_index_path(data_path: Union[str, Path]) -> Path:
+    data_path = Path(data_path)
+    return data_path.parent / (data_path.name + ".index.jsonl")
+
+
+def load_size_index(data_path: Union[str, Path]) -> Optional[SizeIndex]:
+    """The size index of the split at `data_path`, or None if the split has no (local) index."""
+    index_path = size_index_path(data_path)
+    if not index_path.exists():
+        return None
+    with open(index_path) as f:
+        return [json.loads(line) for line in f]
+
+
+def num_edges(entry: Dict[str, Any]) -> int:
+    return sum(entry["edges"].values())
+
+
+def select_graphs(
+    index: SizeIndex, max_nodes: Optional[int] = None, max_edges: Optional[int] = None
+) -> List[int]:
+    """The positions of the graphs that have at most `max_nodes` nodes and `max_edges` edges."""
+    return [
+        position
+        for position, entry in enumerate(index)
+        if (max_nodes is None or entry["nodes"] <= max_nodes)
+        and (max_edges is None or num_edges(entry) <= max_edges)
+    ]
+
+
+def size_bucketed_order(
+    index: SizeIndex, positions: List[int], bucket_size: int, rng: Optional[random.Random] = None
+) -> List[int]:
+    """
+    Order `positions` so that graphs of similar size follow each other: the graphs are sorted by their number of
+    nodes and cut into buckets of `bucket_size` graphs. Both the buckets and the graphs within each bucket are
+    shuffled, so every call gives a new order.
+    """
+    if rng is None:
+        rng = random
+    by_size = sorted(positions, key=lambda position: index[position]["nodes"])
+    buckets = [by_size[start : start + bucket_size] for start in range(0, len(by_size), bucket_size)]
+    rng.shuffle(buckets)
+    order = []
+    for bucket in buckets:
+        rng.shuffle(bucket)
+        order.extend(bucket)
+    return order
+
+
+def estimate_num_minibatches(
+    index: SizeIndex,
+    positions: List[int],
+    max_minibatch_size: int,
+    max_nodes_per_minibatch: Optional[int] = None,
+    yield_partial_minibatches: bool = False,
+) -> int:
+    """
+    Estimate the number of minibatches of an epoch over the graphs at `positions`, in that order. A minibatch is
+    complete when it holds `max_minibatch_size` graphs, or once it reaches `max_nodes_per_minibatch` nodes (see
+    `GraphNeuralNetworkModel.stop_extending_minibatch_after_num_nodes`).
+    """
+    num_minibatches, graphs_in_mb, nodes_in_mb = 0, 0, 0
+    for position in positions:
+        graphs_in_mb += 1
+        nodes_in_mb += index[position]["nodes"]
+        if graphs_in_mb >= max_minibatch_size or (
+            max_nodes_per_minibatch is not None and nodes_in_mb >= max_nodes_per_minibatch
+        ):
+            num_minibatches += 1
+            graphs_in_mb, nodes_in_mb = 0, 0
+    if yield_partial_minibatches and graphs_in_mb > 0:
+        num_minibatches += 1
+    return num_minibatches
@@ -12,6 +12,7 @@ Options:
     -h --help                  Show this screen.
     --debug                    Enable debug routines. [default: False]
     --predicting-statement     Set this if you are trying to predict statements instead of severity
+    --beam-size=<size>         Decode with beam search, keeping this many sequences per log. [default: 1]
 """
 import logging
 from pathlib import Path
@@ -19,10 +20,13 @@ from typing import Tuple
 
 import numpy as np
 from docopt import docopt
-from dpu_utils.utils import RichPath, run_and_debug
+from dpu_utils.utils import run_and_debug
 from jellyfish import jaro_winkler
 
-from ptgnn.implementations.graph2seq.graph2seq import Graph2Seq, Graph2SeqModule
+from ptgnn.implementations.graph2seq.graph2seq import Graph2Seq, Graph2SeqModule, graph_targets
+from ptgnn.implementations.graph2seq.graphshards import read_graph_data
+from ptgnn.implementations.graph2seq.multitask import MultiTaskGraph2Seq
+from ptgnn.implementations.severity.severityclassifier import graph_severities
 from nltk.translate.bleu_score import sentence_bleu
 from nltk.translate.bleu_score import SmoothingFunction
 
@@ -31,8 +35,7 @@ def run(arguments):
 
     azure_info_path = arguments.get("--azure-info", None)
 
-    data_path = RichPath.create(arguments["TEST_DATA_PATH"], azure_info_path)
-    data = list(data_path.read_as_jsonl())
+    data = list(read_graph_data(arguments["TEST_DATA_PATH"], azure_info_path))
 
     model_path = Path(arguments["MODEL_FILENAME"])
     model, nn = Graph2Seq.restore_model(
@@ -40,19 +43,49 @@ def run(arguments):
     )  # type: Tuple[Graph2Seq, Graph2SeqModule]
     nn.reset_metrics()
 
-    all_responses = model.greedy_decode(data, nn, device="cpu")
+    beam_size = int(arguments.get("--beam-size") or 1)
+    multiTask = isinstance(model, MultiTaskGraph2Seq)
+    if multiTask:
+        # The severities come from the same GNN pass as the statements
+        all_responses, all_severity_responses = [], []
+        for prediction in model.decode_with_severities(data, nn, device="cpu", beam_size=beam_size):
+            if prediction is None:
+                all_responses.append(None)
+                all_severity_responses.append(None)
+                continue
+            tokens, logprob, severity, severity_prob = prediction
+            all_responses.append((tokens, logprob))
+            all_severity_responses.append((severity, severity_prob))
+        all_severities = [severity for graph in data for severity in graph_severities(graph)]
+        correct_severities = sum(
+            response is not None and response[0] == actual
+            for response, actual in zip(all_severity_responses, all_severities)
+        )
+    elif beam_size > 1:
+        all_responses = model.beam_decode(data, nn, device="cpu", beam_size=beam_size)
+    else:
+        all_responses = model.greedy_decode(data, nn, device="cpu")
+    # Multi-log graphs have one response per log
+    all_targets = [target for graph in data for target in graph_targets(graph)]
+    # The model discards some graphs, e.g. the graphs without a LOG node when reading out the LOG node
+    num_skipped = sum(response is None for response in all_responses)
+    if num_skipped > 0:
+        print(f"Skipped {num_skipped} of {len(all_targets)} logs, their graphs were discarded by the model")
     correct_elements, jw_sim, num_elements = 0, 0, 0
     sum_f1, sum_precision, sum_recall = 0.0, 0.0, 0.0
 
 
     bleuScores1 = []
     bleuScores4 = []
-    for (res_tokens, res_logprob), actual_data in zip(all_responses, data):
+    for response, actual_method_name in zip(all_responses, all_targets):
+        if response is None:
+            continue
+        res_tokens, res_logprob = response
         num_elements += 1
 
         if predictingStatement:
             smoother = SmoothingFunction()
-            reference = [actual_data["method_name"]]
+            reference = [actual_method_name]
             candidate = res_tokens
             #Anything less than 2 will cause the smoother function to crash (division by 0). Use method 0, no smoothing
             #if this occurs.
@@ -65,16 +98,16 @@ def run(arguments):
             bleuScores1.append(bleuScore1)
             bleuScores4.append(bleuScore4)
 
-            print(f'{actual_data["method_name"]} -> {res_tokens} ({np.exp(res_logprob):.2f}, B1:{bleuScore1}, B4:{bleuScore4})')
+            print(f'{actual_method_name} -> {res_tokens} ({np.exp(res_logprob):.2f}, B1:{bleuScore1}, B4:{bleuScore4})')
         else:
-            print(f'{actual_data["method_name"]} -> {res_tokens} ({np.exp(res_logprob):.2f})')
+            print(f'{actual_method_name} -> {res_tokens} ({np.exp(res_logprob):.2f})')
 
-        jw_sim += jaro_winkler("".join(actual_data["method_name"]), "".join(res_tokens))
-        if actual_data["method_name"] == res_tokens:
+        jw_sim += jaro_winkler("".join(actual_method_name), "".join(res_tokens))
+        if actual_method_name == res_tokens:
             correct_elements += 1
         res_tokens = set(res_tokens)
         res_tokens.discard("%UNK%")
-        ground_tokens = set(actual_data["method_name"])
+        ground_tokens = set(actual_method_name)
         if len(res_tokens) > 0:
             precision = len(res_tokens & ground_tokens) / len(res_tokens)
         else:
@@ -98,6 +131,9 @@ def run(arguments):
         print(f"Average bleu1 score: {np.average(bleuScores1)}")
         print(f"Average bleu4 score: {np.average(bleuScores4)}")
 
+    if multiTask:
+        print(f"Severity Acc {correct_severities / num_elements: %}  ({correct_severities}/{num_elements})")
+
 
 if __name__ == "__main__":
     args = docopt(__doc__)
@@ -3,27 +3,51 @@
 Usage:
     train.py [options] TRAIN_DATA_PATH VALID_DATA_PATH MODEL_FILENAME
 
+The data paths are either jsonl(.gz) files or folders of binary shards (convertCorpusForML.py --binary).
+When a split has a local size index (e.g. trainLogs.jsonl.gz.index.jsonl), it is used to filter out graphs before reading them,
+to order the graphs by size and to show the expected number of minibatches.
+
 Options:
     --aml                      Run this in Azure ML
     --azure-info=<path>        Azure authentication information file (JSON). Used to load data from Azure storage.
     --max-num-epochs=<epochs>  The maximum number of epochs to run training for. [default: 100]
     --minibatch-size=<size>    The minibatch size. [default: 300]
+    --max-nodes=<num>          Skip the graphs with more nodes. Needs the size index.
+    --max-edges=<num>          Skip the graphs with more edges. Needs the size index.
+    --size-buckets=<size>      Train on buckets of this many graphs of similar size, shuffling the buckets every epoch
+                               instead of the graphs. Needs the size index.
     --restore-path=<path>      The path to previous model file for starting from previous checkpoint.
     --sequential-run           Do not parallelize data loading. Makes debugging easier.
     --quiet                    Do not show progress bar.
     -h --help                  Show this screen.
     --debug                    Enable debug routines. [default: False]
     --predicting-statement     Set this if you are trying to predict statements instead of severity
+    --log-node-readout         Initialize the decoder from the LOG node instead of summarizing the whole graph.
+    --prune-gnn                Only compute the node states the LOG node and the backbone depend on. Same results,
+                               less computation. Requires --log-node-readout.
+    --multi-task               Also classify the severity of each log, from the same GNN pass as the statement. Needs
+                               the statement files (convertCorpusForML.py -s) and --predicting-statement.
+    --message-loss-weight=<w>  The weight of the statement loss with --multi-task. [default: 1.0]
+    --severity-loss-weight=<w>
+                               The weight of the severity loss with --multi-task. [default: 1.0]
 """
 from pathlib import Path
 
 from docopt import docopt
-from dpu_utils.utils import RichPath, run_and_debug
+from dpu_utils.utils import run_and_debug
 
 from ptgnn.baseneuralmodel import AbstractNeuralModel, ModelTrainer
 from ptgnn.baseneuralmodel.utils.amlutils import configure_logging, log_run
 from ptgnn.baseneuralmodel.utils.data import LazyDataIterable
 from ptgnn.implementations.graph2seq.graph2seq import Graph2Seq
+from ptgnn.implementations.graph2seq.graphshards import read_graph_data
+from ptgnn.implementations.graph2seq.multitask import MultiTaskGraph2Seq
+from ptgnn.implementations.graph2seq.sizeindex import (
+    estimate_num_minibatches,
+    load_size_index,
+    select_graphs,
+    size_bucketed_order,
+)
 from ptgnn.neuralmodels.embeddings.strelementrepresentationmodel import (
     StrElementRepresentationModel,
 )
@@ -46,11 +70,43 @@ def run(arguments):
     log_path = configure_logging(aml_ctx)
     azure_info_path = arguments.get("--azure-info", None)
 
-    training_data_path = RichPath.create(arguments["TRAIN_DATA_PATH"], azure_info_path)
-    training_data = LazyDataIterable(lambda: training_data_path.read_as_jsonl())
+    training_data = LazyDataIterable(
+        lambda: read_graph_data(arguments["TRAIN_DATA_PATH"], azure_info_path)
+    )
+    validation_data = LazyDataIterable(
+        lambda: read_graph_data(arguments["VALID_DATA_PATH"], azure_info_path)
+    )
 
-    validation_data_path = RichPath.create(arguments["VALID_DATA_PATH"], azure_info_path)
-    validation_data = LazyDataIterable(lambda: validation_data_path.read_as_jsonl())
+    # Optional, like --predicting-statement: run() is also called by trainandtest.py with its own options.
+    max_nodes = int(arguments["--max-nodes"]) if arguments.get("--max-nodes") else None
+    max_edges = int(arguments["--max-edges"]) if arguments.get("--max-edges") else None
+    bucket_size = int(arguments["--size-buckets"]) if arguments.get("--size-buckets") else None
+    filter_graphs = max_nodes is not None or max_edges is not None
+
+    training_index = load_size_index(arguments["TRAIN_DATA_PATH"])
+    validation_index = load_size_index(arguments["VALID_DATA_PATH"])
+    assert training_index is not None or not (
+        filter_graphs or bucket_size
+    ), "--max-nodes, --max-edges and --size-buckets need the size index of the training data."
+    if training_index is not None:
+        training_graphs = select_graphs(training_index, max_nodes, max_edges)
+        if bucket_size:
+            training_data = LazyDataIterable(
+                lambda: read_graph_data(
+                    arguments["TRAIN_DATA_PATH"],
+                    positions=size_bucketed_order(training_index, training_graphs, bucket_size),
+                )
+            )
+        elif filter_graphs:
+            training_data = LazyDataIterable(
+                lambda: read_graph_data(arguments["TRAIN_DATA_PATH"], positions=training_graphs)
+            )
+    if validation_index is not None:
+        validation_graphs = select_graphs(validation_index, max_nodes, max_edges)
+        if filter_graphs:
+            validation_data = LazyDataIterable(
+                lambda: read_graph_data(arguments["VALID_DATA_PATH"], positions=validation_graphs)
+            )
 
     model_path = Path(arguments["MODEL_FILENAME"])
     assert model_path.name.endswith(".pkl.gz"), "MODEL_FILENAME must have a `.pkl.gz` suffix."
@@ -99,7 +155,17 @@ def run(arguments):
         else:
             vocabulary_count_threshold = 5
         print(f"Using {vocabulary_count_threshold} vocab threshold")
-        model = Graph2Seq(
+        model_kwargs = {}
+        if arguments.get("--multi-task"):
+            assert predictingStatement, "--multi-task needs --predicting-statement."
+            model_class = MultiTaskGraph2Seq
+            model_kwargs = dict(
+                message_loss_weight=float(arguments["--message-loss-weight"]),
+                severity_loss_weight=float(arguments["--severity-loss-weight"]),
+            )
+        else:
+            model_class = Graph2Seq
+        model = model_class(
             gnn_model=GraphNeuralNetworkModel(
                 node_representation_model=StrElementRepresentationModel(
                     token_splitting="token", embedding_size=embedding_size,
@@ -110,17 +176,37 @@ def run(arguments):
                 hidden_size=128, embedding_size=256, memories_hidden_dim=embedding_size,
                 vocabulary_count_threshold=vocabulary_count_threshold
             ),
+            log_node_readout=arguments.get("--log-node-readout", False),
+            prune_gnn=arguments.get("--prune-gnn", False),
+            **model_kwargs,
         )
 
+    minibatch_size = int(arguments["--minibatch-size"])
     trainer = ModelTrainer(
         model,
         model_path,
         max_num_epochs=int(arguments["--max-num-epochs"]),
-        minibatch_size=int(arguments["--minibatch-size"]),
+        minibatch_size=minibatch_size,
     )
     if nn is not None:
         trainer.neural_module = nn
 
+    max_nodes_per_minibatch = model.gnn_model.stop_extending_minibatch_after_num_nodes
+    expected_num_training_minibatches, expected_num_validation_minibatches = None, None
+    if training_index is not None:
+        # The graphs are shuffled while minibatching, the estimate assumes the order of the index.
+        expected_num_training_minibatches = estimate_num_minibatches(
+            training_index, training_graphs, minibatch_size, max_nodes_per_minibatch
+        )
+    if validation_index is not None:
+        expected_num_validation_minibatches = estimate_num_minibatches(
+            validation_index,
+            validation_graphs,
+            minibatch_size,
+            max_nodes_per_minibatch,
+            yield_partial_minibatches=True,
+        )
+
     trainer.register_train_epoch_end_hook(
         lambda model, nn, epoch, metrics: log_run(aml_ctx, "train", model, epoch, metrics)
     )
@@ -134,6 +220,9 @@ def run(arguments):
         show_progress_bar=not arguments["--quiet"],
         initialize_metadata=initialize_metadata,
         parallelize=not arguments["--sequential-run"],
+        shuffle_training_data=not bucket_size,
+        expected_num_training_minibatches=expected_num_training_minibatches,
+        expected_num_validation_minibatches=expected_num_validation_minibatches,
     )
 
     if aml_ctx is not None:
@@ -8,12 +8,25 @@ Options:
     --azure-info=<path>        Azure authentication information file (JSON). Used to load data from Azure storage.
     --max-num-epochs=<epochs>  The maximum number of epochs to run training for. [default: 100]
     --minibatch-size=<size>    The minibatch size. [default: 300]
+    --max-nodes=<num>          Skip the graphs with more nodes. Needs the size index.
+    --max-edges=<num>          Skip the graphs with more edges. Needs the size index.
+    --size-buckets=<size>      Train on buckets of this many graphs of similar size, shuffling the buckets every epoch
+                               instead of the graphs. Needs the size index.
     --restore-path=<path>      The path to previous model file for starting from previous checkpoint.
     --sequential-run           Do not parallelize data loading. Makes debugging easier.
     --quiet                    Do not show progress bar.
     -h --help                  Show this screen.
     --debug                    Enable debug routines. [default: False]
     --predicting-statement     Set this if you are trying to predict statements instead of severity
+    --beam-size=<size>         Test with beam search, keeping this many sequences per log. [default: 1]
+    --log-node-readout         Initialize the decoder from the LOG node instead of summarizing the whole graph.
+    --prune-gnn                Only compute the node states the LOG node and the backbone depend on. Same results,
+                               less computation. Requires --log-node-readout.
+    --multi-task               Also classify the severity of each log, from the same GNN pass as the statement. Needs
+                               the statement files (convertCorpusForML.py -s) and --predicting-statement.
+    --message-loss-weight=<w>  The weight of the statement loss with --multi-task. [default: 1.0]
+    --severity-loss-weight=<w>
+                               The weight of the severity loss with --multi-task. [default: 1.0]
 """
 
 from docopt import docopt
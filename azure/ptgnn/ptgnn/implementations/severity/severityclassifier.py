@@ -0,0 +1,258 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+from typing_extensions import Final
+
+import torch
+from torch import nn
+
+from ptgnn.baseneuralmodel import AbstractNeuralModel, ModuleWithMetrics
+from ptgnn.implementations.graph2seq.graph2seq import CodeGraph2Seq, graph_targets
+from ptgnn.neuralmodels.gnn.graphneuralnetwork import GraphNeuralNetwork, GraphNeuralNetworkModel
+from ptgnn.neuralmodels.gnn.structs import GnnOutput, GraphData, TensorizedGraphData
+from ptgnn.neuralmodels.reduceops import (
+    AbstractVarSizedElementReduce,
+    ElementsToSummaryRepresentationInput,
+    MultiheadSelfAttentionVarSizedElementReduce,
+    SimpleVarSizedElementReduce,
+)
+
+# The log levels found by retrieveLogs.py, from the least to the most severe.
+SEVERITY_LEVELS: Final = ("trace", "debug", "info", "warn", "error", "fatal")
+
+
+def graph_severities(datapoint: CodeGraph2Seq) -> List[Optional[str]]:
+    """
+    The severity of each log of a graph, in the order of `graph_targets`: the `severity` (`severities`) of statement
+    mode files, or the target itself in severity mode.
+    """
+    if "severities" in datapoint:
+        return datapoint["severities"]
+    if "severity" in datapoint:
+        return [datapoint["severity"]]
+    return [target[0] if len(target) == 1 else None for target in graph_targets(datapoint)]
+
+
+def severity_class(severity: Optional[str]) -> Optional[int]:
+    """The class of a severity, or None if it is not a known log level."""
+    if severity not in SEVERITY_LEVELS:
+        return None
+    return SEVERITY_LEVELS.index(severity)
+
+
+class TensorizedSeverityClassifierSample(NamedTuple):
+    graph: TensorizedGraphData
+    # One per classified log
+    target_classes: List[int]
+
+
+class SeverityClassifierModule(ModuleWithMetrics):
+    def __init__(
+        self,
+        gnn: GraphNeuralNetwork,
+        node_to_graph_representation: Optional[AbstractVarSizedElementReduce],
+        prune_gnn: bool = False,
+    ):
+        """
+        :param node_to_graph_representation: summarizes all nodes of a graph into the representation that is
+            classified. If None, the representation of the LOG node is classified instead.
+        :param prune_gnn: only compute the node states that the LOG nodes depend on, see
+            `GraphNeuralNetwork.pruned_gnn`. Requires the LOG node readout.
+        """
+        super().__init__()
+        assert (
+            node_to_graph_representation is None or not prune_gnn
+        ), "Pruning the GNN requires the LOG node readout."
+        self.__gnn = gnn
+        self.__node_to_graph_representation = node_to_graph_representation
+        self.__prune_gnn = prune_gnn
+        if node_to_graph_representation is None:
+            representation_size = gnn.input_node_state_dim + gnn.output_node_state_dim
+        else:
+            representation_size = gnn.output_node_state_dim
+        self.__representation_to_class = nn.Linear(representation_size, len(SEVERITY_LEVELS))
+        self.__loss = nn.CrossEntropyLoss()
+
+    def _reset_module_metrics(self) -> None:
+        self.__num_samples = 0
+        self.__sum_accuracy = 0
+
+    def _module_metrics(self) -> Dict[str, Any]:
+        return {"Accuracy": self.__sum_accuracy / self.__num_samples}
+
+    def _logits(self, graph_mb_data: Dict[str, Any]) -> torch.Tensor:
+        """The logits of the severity of every classified log in the minibatch. [num_logs_in_mb, num_levels]"""
+        if self.__prune_gnn:
+            gnn_output: GnnOutput = self.__gnn(**graph_mb_data, prune_to_references=("log_node",))
+        else:
+            gnn_output = self.__gnn(**graph_mb_data)
+        node_representations = torch.cat(
+            (gnn_output.input_node_representations, gnn_output.output_node_representations), dim=-1
+        )
+
+        if self.__node_to_graph_representation is None:
+            log_representations = node_representations[gnn_output.node_idx_references["log_node"]]
+        else:
+            log_representations = self.__node_to_graph_representation(
+                ElementsToSummaryRepresentationInput(
+                    element_embeddings=node_representations,
+                    element_to_sample_map=gnn_output.node_to_graph_idx,
+                    num_samples=gnn_output.num_graphs,
+                )
+            )
+            if "log_node" in gnn_output.node_graph_idx_reference:
+                # All logs of a multi-log graph are classified from the representation of their graph.
+                log_representations = log_representations[
+                    gnn_output.node_graph_idx_reference["log_node"]
+                ]
+        return self.__representation_to_class(log_representations)
+
+    def predict(self, graph_mb_data: Dict[str, Any]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """The probability and the class of the most likely severity of every classified log in the minibatch."""
+        with torch.no_grad():
+            probs = torch.softmax(self._logits(graph_mb_data), dim=-1)
+            return torch.max(probs, dim=-1)
+
+    def forward(self, graph_mb_data, target_classes):
+        logits = self._logits(graph_mb_data)
+        with torch.no_grad():
+            self.__sum_accuracy += int((torch.argmax(logits, dim=-1) == target_classes).sum())
+            self.__num_samples += int(target_classes.shape[0])
+        return self.__loss(logits, target_classes)
+
+
+class SeverityClassifier(
+    AbstractNeuralModel[CodeGraph2Seq, TensorizedSeverityClassifierSample, SeverityClassifierModule]
+):
+    """
+    Predicts the log level of each LOG node with a softmax over `SEVERITY_LEVELS`, instead of decoding it as a
+    sequence like `Graph2Seq` does. Reads both the severity and the statement mode files of `convertCorpusForML.py`,
+    including multi-log graphs.
+    """
+
+    def __init__(
+        self,
+        gnn_model: GraphNeuralNetworkModel,
+        log_node_readout: bool = True,
+        prune_gnn: bool = False,
+        num_summarization_heads: int = 8,
+    ):
+        """
+        :param log_node_readout: classify the representation of the LOG node. Otherwise, all nodes of the graph are
+            summarized. Graphs without a LOG node are discarded in this mode.
+        :param prune_gnn: only run the GNN on the part of the graph the LOG nodes depend on. Gives the same results
+            with less computation. Requires `log_node_readout`.
+        """
+        super().__init__()
+        assert log_node_readout or not prune_gnn, "Pruning the GNN requires the LOG node readout."
+        self.__gnn_model = gnn_model
+        self.log_node_readout: Final = log_node_readout
+        self.prune_gnn: Final = prune_gnn
+        self.num_summarization_heads: Final = num_summarization_heads
+
+    @property
+    def gnn_model(self) -> GraphNeuralNetworkModel:
+        return self.__gnn_model
+
+    def __convert(self, datapoint: CodeGraph2Seq) -> Tuple[GraphData, List[int]]:
+        """The graph of a datapoint, along with the class of each of its logs. Logs without a known level are dropped."""
+        reference_nodes = {"backbone_nodes": datapoint["backbone_sequence"]}
+        classes = [severity_class(severity) for severity in graph_severities(datapoint)]
+        if "log_nodes" in datapoint:
+            if len(datapoint["log_nodes"]) != len(classes):
+                classes = []  # The LOG nodes do not match the targets
+            reference_nodes["log_node"] = [
+                log_node for log_node, cls in zip(datapoint["log_nodes"], classes) if cls is not None
+            ]
+        elif self.log_node_readout:
+            if datapoint.get("log_node", -1) < 0:
+                classes = []  # There is no LOG node to read out
+            else:
+                reference_nodes["log_node"] = [datapoint["log_node"]]
+
+        return (
+            GraphData(
+                node_information=[l.lower() for l in datapoint["node_labels"]],
+                edges=datapoint["edges"],
+                reference_nodes=reference_nodes,
+            ),
+            [cls for cls in classes if cls is not None],
+        )
+
+    def update_metadata_from(self, datapoint: CodeGraph2Seq) -> None:
+        graph_data, _ = self.__convert(datapoint)
+        self.__gnn_model.update_metadata_from(graph_data)
+
+    def build_neural_module(self) -> SeverityClassifierModule:
+        gnn = self.__gnn_model.build_neural_module()
+        if self.log_node_readout:
+            node_to_graph_representation = None
+        else:
+            node_to_graph_representation = MultiheadSelfAttentionVarSizedElementReduce(
+                input_representation_size=gnn.input_node_state_dim + gnn.output_node_state_dim,
+                hidden_size=gnn.input_node_state_dim + gnn.output_node_state_dim,
+                output_representation_size=gnn.output_node_state_dim,
+                num_heads=self.num_summarization_heads,
+                query_representation_summarizer=SimpleVarSizedElementReduce("max"),
+            )
+        return SeverityClassifierModule(gnn, node_to_graph_representation, prune_gnn=self.prune_gnn)
+
+    def tensorize(self, datapoint: CodeGraph2Seq) -> Optional[TensorizedSeverityClassifierSample]:
+        graph_data, target_classes = self.__convert(datapoint)
+        if len(target_classes) == 0:
+            return None  # Discard example, there is no log to classify
+
+        graph_tensorized_data = self.__gnn_model.tensorize(graph_data)
+        if graph_tensorized_data is None:
+            return None  # Discard example
+
+        return TensorizedSeverityClassifierSample(
+            graph=graph_tensorized_data, target_classes=target_classes
+        )
+
+    # region Minibatching
+    def initialize_minibatch(self) -> Dict[str, Any]:
+        return {"graph_mb_data": self.__gnn_model.initialize_minibatch(), "target_classes": []}
+
+    def extend_minibatch_with(
+        self,
+        tensorized_datapoint: TensorizedSeverityClassifierSample,
+        partial_minibatch: Dict[str, Any],
+    ) -> bool:
+        partial_minibatch["target_classes"].extend(tensorized_datapoint.target_classes)
+        return self.__gnn_model.extend_minibatch_with(
+            tensorized_datapoint.graph, partial_minibatch["graph_mb_data"]
+        )
+
+    def finalize_minibatch(
+        self, accumulated_minibatch_data: Dict[str, Any], device: Union[str, torch.device]
+    ) -> Dict[str, Any]:
+        return {
+            "graph_mb_data": self.__gnn_model.finalize_minibatch(
+                accumulated_minibatch_data["graph_mb_data"], device
+            ),
+            "target_classes": torch.tensor(
+                accumulated_minibatch_data["target_classes"], dtype=torch.int64, device=device
+            ),
+        }
+
+    # endregion
+
+    def predict(
+        self,
+        data: List[CodeGraph2Seq],
+        trained_network: SeverityClassifierModule,
+        device: Union[str, torch.device],
+    ) -> List[Tuple[str, str, float]]:
+        """The actual severity, the predicted severity and its probability of every classified log in `data`."""
+        trained_network.eval()
+        predictions = []
+        for mb_data, _ in self.minibatch_iterator(
+            self.tensorize_dataset(iter(data)), device, max_minibatch_size=50
+        ):
+            probs, predicted_classes = trained_network.predict(mb_data["graph_mb_data"])
+            for actual_class, predicted_class, prob in zip(
+                mb_data["target_classes"].tolist(), predicted_classes.tolist(), probs.tolist()
+            ):
+                predictions.append(
+                    (SEVERITY_LEVELS[actual_class], SEVERITY_LEVELS[predicted_class], prob)
+                )
+        return predictions
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Usage:
+    test.py [options] MODEL_FILENAME TEST_DATA_PATH
+
+Options:
+    --azure-info=<path>        Azure authentication information file (JSON). Used to load data from Azure storage.
+    --quiet                    Only print the scores, not the prediction of every log.
+    -h --help                  Show this screen.
+    --debug                    Enable debug routines. [default: False]
+"""
+import logging
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+from docopt import docopt
+from dpu_utils.utils import run_and_debug
+
+from ptgnn.implementations.graph2seq.graphshards import read_graph_data
+from ptgnn.implementations.severity.severityclassifier import (
+    SEVERITY_LEVELS,
+    SeverityClassifier,
+    SeverityClassifierModule,
+)
+
+
+def run(arguments):
+    azure_info_path = arguments.get("--azure-info", None)
+
+    data = list(read_graph_data(arguments["TEST_DATA_PATH"], azure_info_path))
+
+    model_path = Path(arguments["MODEL_FILENAME"])
+    model, nn = SeverityClassifier.restore_model(
+        model_path, device="cpu"
+    )  # type: Tuple[SeverityClassifier, SeverityClassifierModule]
+
+    predictions = model.predict(data, nn, device="cpu")
+    # Rows are the actual levels, columns the predicted ones
+    confusion = np.zeros((len(SEVERITY_LEVELS), len(SEVERITY_LEVELS)), dtype=np.int64)
+    for actual, predicted, prob in predictions:
+        confusion[SEVERITY_LEVELS.index(actual), SEVERITY_LEVELS.index(predicted)] += 1
+        if not arguments["--quiet"]:
+            print(f"{actual} -> {predicted} ({prob:.2f})")
+
+    num_correct, num_elements = int(np.trace(confusion)), int(confusion.sum())
+    print(f"Acc {num_correct / num_elements: %}  ({num_correct}/{num_elements})")
+    # How far the predicted levels are from the actual ones, e.g. 1 when predicting "warn" for "error"
+    distances = np.abs(
+        np.arange(len(SEVERITY_LEVELS))[:, None] - np.arange(len(SEVERITY_LEVELS))[None, :]
+    )
+    print(f"Mean level distance {(confusion * distances).sum() / num_elements}")
+    print("Confusion matrix (rows: actual, columns: predicted)")
+    print(" " * 8 + "".join(f"{level:>8}" for level in SEVERITY_LEVELS))
+    for level, row in zip(SEVERITY_LEVELS, confusion):
+        print(f"{level:>8}" + "".join(f"{count:>8}" for count in row))
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)-15s %(name)-5s %(levelname)-8s %(message)s"
+    )
+    run_and_debug(lambda: run(args), args.get("--debug", False))
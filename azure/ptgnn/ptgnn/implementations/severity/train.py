@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Usage:
+    train.py [options] TRAIN_DATA_PATH VALID_DATA_PATH MODEL_FILENAME
+
+The data paths are the files of convertCorpusForML.py, either jsonl(.gz) files or folders of binary shards (--binary).
+Both the severity and the statement (-s) mode files have the severities. Multi-log graphs (nodeParsing.py --multi_log)
+are supported.
+
+Options:
+    --aml                      Run this in Azure ML
+    --azure-info=<path>        Azure authentication information file (JSON). Used to load data from Azure storage.
+    --max-num-epochs=<epochs>  The maximum number of epochs to run training for. [default: 100]
+    --minibatch-size=<size>    The minibatch size. [default: 300]
+    --restore-path=<path>      The path to previous model file for starting from previous checkpoint.
+    --sequential-run           Do not parallelize data loading. Makes debugging easier.
+    --quiet                    Do not show progress bar.
+    -h --help                  Show this screen.
+    --debug                    Enable debug routines. [default: False]
+    --graph-readout            Classify a summary of all nodes of the graph instead of the LOG node.
+    --prune-gnn                Only compute the node states the LOG nodes depend on. Same results, less computation.
+                               Cannot be combined with --graph-readout.
+"""
+from pathlib import Path
+
+from docopt import docopt
+from dpu_utils.utils import run_and_debug
+
+from ptgnn.baseneuralmodel import ModelTrainer
+from ptgnn.baseneuralmodel.utils.amlutils import configure_logging, log_run
+from ptgnn.baseneuralmodel.utils.data import LazyDataIterable
+from ptgnn.implementations.graph2seq.graphshards import read_graph_data
+from ptgnn.implementations.severity.severityclassifier import SeverityClassifier
+from ptgnn.neuralmodels.embeddings.strelementrepresentationmodel import (
+    StrElementRepresentationModel,
+)
+from ptgnn.neuralmodels.gnn.graphneuralnetwork import GraphNeuralNetworkModel
+from ptgnn.neuralmodels.gnn.messagepassing.gatedmessagepassing import GatedMessagePassingLayer
+from ptgnn.neuralmodels.gnn.messagepassing.residuallayers import MeanResidualLayer
+
+
+def create_severity_classifier_model(
+    log_node_readout: bool = True,
+    prune_gnn: bool = False,
+    hidden_state_size: int = 128,
+    dropout_rate: float = 0.1,
+) -> SeverityClassifier:
+    def create_mp_layers(num_edges: int):
+        ggnn_mp = GatedMessagePassingLayer(
+            state_dimension=hidden_state_size,
+            message_dimension=hidden_state_size,
+            num_edge_types=num_edges,
+            message_aggregation_function="sum",
+            dropout_rate=dropout_rate,
+        )
+        r1 = MeanResidualLayer(hidden_state_size)
+        return [
+            r1.pass_through_dummy_layer(),
+            ggnn_mp,
+            ggnn_mp,
+            ggnn_mp,
+            ggnn_mp,
+            ggnn_mp,
+            ggnn_mp,
+            ggnn_mp,
+            r1,
+            GatedMessagePassingLayer(
+                state_dimension=hidden_state_size,
+                message_dimension=hidden_state_size,
+                num_edge_types=num_edges,
+                message_aggregation_function="sum",
+                dropout_rate=dropout_rate,
+            ),
+        ]
+
+    return SeverityClassifier(
+        gnn_model=GraphNeuralNetworkModel(
+            node_representation_model=StrElementRepresentationModel(
+                token_splitting="token", embedding_size=hidden_state_size,
+            ),
+            message_passing_layer_creator=create_mp_layers,
+        ),
+        log_node_readout=log_node_readout,
+        prune_gnn=prune_gnn,
+    )
+
+
+def run(arguments):
+    if arguments["--aml"]:
+        from azureml.core.run import Run
+        import torch
+
+        aml_ctx = Run.get_context()
+        assert torch.cuda.is_available(), "No CUDA available. Aborting training."
+    else:
+        aml_ctx = None
+
+    log_path = configure_logging(aml_ctx)
+    azure_info_path = arguments.get("--azure-info", None)
+
+    training_data = LazyDataIterable(
+        lambda: read_graph_data(arguments["TRAIN_DATA_PATH"], azure_info_path)
+    )
+    validation_data = LazyDataIterable(
+        lambda: read_graph_data(arguments["VALID_DATA_PATH"], azure_info_path)
+    )
+
+    model_path = Path(arguments["MODEL_FILENAME"])
+    assert model_path.name.endswith(".pkl.gz"), "MODEL_FILENAME must have a `.pkl.gz` suffix."
+
+    initialize_metadata = True
+    restore_path = arguments.get("--restore-path", None)
+    if restore_path:
+        initialize_metadata = False
+        model, nn = SeverityClassifier.restore_model(Path(restore_path))
+    else:
+        nn = None
+        model = create_severity_classifier_model(
+            log_node_readout=not arguments["--graph-readout"], prune_gnn=arguments["--prune-gnn"]
+        )
+
+    trainer = ModelTrainer(
+        model,
+        model_path,
+        max_num_epochs=int(arguments["--max-num-epochs"]),
+        minibatch_size=int(arguments["--minibatch-size"]),
+        target_validation_metric="Accuracy",
+        target_validation_metric_higher_is_better=True,
+    )
+    if nn is not None:
+        trainer.neural_module = nn
+
+    trainer.register_train_epoch_end_hook(
+        lambda model, nn, epoch, metrics: log_run(aml_ctx, "train", model, epoch, metrics)
+    )
+    trainer.register_validation_epoch_end_hook(
+        lambda model, nn, epoch, metrics: log_run(aml_ctx, "valid", model, epoch, metrics)
+    )
+
+    trainer.train(
+        training_data,
+        validation_data,
+        show_progress_bar=not arguments["--quiet"],
+        initialize_metadata=initialize_metadata,
+        parallelize=not arguments["--sequential-run"],
+    )
+
+    if aml_ctx is not None:
+        aml_ctx.upload_file(name="model.pkl.gz", path_or_stream=str(model_path))
+        aml_ctx.upload_file(name="full.log", path_or_stream=log_path)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    run_and_debug(lambda: run(args), args.get("--debug", False))
@@ -78,6 +78,7 @@ class GraphNeuralNetwork(ModuleWithMetrics):
         reference_node_ids: Dict[str, torch.Tensor],
         reference_node_graph_idx: Dict[str, torch.Tensor],
         return_all_states: bool = False,
+        prune_to_references: Optional[Iterable[str]] = None,
     ) -> torch.Tensor:
         """
         :param node_representations: A [num_nodes, hidden_dimension] matrix of node representations.
@@ -88,8 +89,22 @@ class GraphNeuralNetwork(ModuleWithMetrics):
         :param reference_node_ids: A dictionary indicating the reference node index
         :param reference_node_graph_idx: A dictionary indicating the graph index for reference node
         :param return_all_states: Whether to return all states
+        :param prune_to_references: If given, only the output states of the nodes in these references are
+            computed, see `pruned_gnn`.
         :return: a [num_nodes, output_hidden_dimension] matrix of the output representations
         """
+        if prune_to_references is not None:
+            target_nodes = torch.cat([reference_node_ids[r] for r in prune_to_references])
+            return self.pruned_gnn(
+                node_representations,
+                adjacency_lists,
+                node_to_graph_idx,
+                reference_node_ids,
+                reference_node_graph_idx,
+                target_nodes,
+                return_all_states,
+            )
+
         all_states = [node_representations]
         for mp_layer_idx, mp_layer in enumerate(self.__message_passing_layers):
             node_representations = mp_layer(
@@ -104,6 +119,101 @@ class GraphNeuralNetwork(ModuleWithMetrics):
             node_representations = torch.cat(all_states, dim=-1)
         return node_representations
 
+    def receptive_fields(
+        self, num_nodes: int, adjacency_lists: List[Tuple[torch.Tensor, torch.Tensor]], target_nodes: torch.Tensor
+    ) -> List[torch.Tensor]:
+        """
+        The nodes whose states can still reach `target_nodes` through the remaining message passing layers.
+
+        :return: a list of [num_nodes] boolean masks, one for the input states and one for the output states of
+            each layer. The masks shrink from layer to layer, the last one only holds the `target_nodes`.
+        """
+        needed_nodes = torch.zeros(num_nodes, dtype=torch.bool, device=target_nodes.device)
+        needed_nodes[target_nodes] = True
+        receptive_fields = [needed_nodes]
+        for mp_layer in reversed(self.__message_passing_layers):
+            if mp_layer.propagation_hops is None:
+                raise ValueError(
+                    f"{mp_layer.__class__.__name__} uses the states of all nodes, its receptive field cannot be pruned."
+                )
+            for _ in range(mp_layer.propagation_hops):
+                needed_sources = needed_nodes.clone()
+                for edge_sources, edge_targets in adjacency_lists:
+                    needed_sources[edge_sources[needed_nodes[edge_targets]]] = True
+                needed_nodes = needed_sources
+            receptive_fields.append(needed_nodes)
+        receptive_fields.reverse()
+        return receptive_fields
+
+    def pruned_gnn(
+        self,
+        node_representations: torch.Tensor,
+        adjacency_lists: List[Tuple[torch.Tensor, torch.Tensor]],
+        node_to_graph_idx: torch.Tensor,
+        reference_node_ids: Dict[str, torch.Tensor],
+        reference_node_graph_idx: Dict[str, torch.Tensor],
+        target_nodes: torch.Tensor,
+        return_all_states: bool = False,
+    ) -> torch.Tensor:
+        """
+        Like `gnn`, but only computes what the output states of `target_nodes` depend on: the nodes that cannot reach
+        the target nodes within the message passing layers are left out, and each layer only passes the messages
+        towards the nodes that can still reach the target nodes within the remaining layers. The output states of
+        the target nodes are the same as with `gnn`. All other rows of the output are zeros or partial results.
+
+        All message passing layers must have a `propagation_hops`, i.e. only pass messages along the edges.
+
+        :param target_nodes: the indices of the nodes whose output states are needed.
+        """
+        num_nodes = node_representations.shape[0]
+        receptive_fields = self.receptive_fields(num_nodes, adjacency_lists, target_nodes)
+
+        # Only the nodes of the largest (first) receptive field take part, renumbered from 0.
+        kept_nodes = receptive_fields[0]
+        kept_node_idxs = kept_nodes.nonzero(as_tuple=True)[0]
+        new_node_idxs = torch.cumsum(kept_nodes, dim=0) - 1
+
+        def kept_references(references: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+            return {
+                name: node_idxs[kept_nodes[reference_node_ids[name]]]
+                for name, node_idxs in references.items()
+            }
+
+        pruned_reference_node_ids = {
+            name: new_node_idxs[node_idxs]
+            for name, node_idxs in kept_references(reference_node_ids).items()
+        }
+        pruned_reference_node_graph_idx = kept_references(reference_node_graph_idx)
+
+        node_representations = node_representations[kept_node_idxs]
+        pruned_node_to_graph_idx = node_to_graph_idx[kept_node_idxs]
+        all_states = [node_representations]
+        for mp_layer, layer_outputs in zip(self.__message_passing_layers, receptive_fields[1:]):
+            # The messages towards the nodes whose outputs of this layer are needed. Their sources are always needed
+            # inputs of this layer.
+            layer_adjacency_lists = []
+            for edge_sources, edge_targets in adjacency_lists:
+                needed_edges = layer_outputs[edge_targets]
+                layer_adjacency_lists.append(
+                    (new_node_idxs[edge_sources[needed_edges]], new_node_idxs[edge_targets[needed_edges]])
+                )
+            node_representations = mp_layer(
+                node_states=node_representations,
+                adjacency_lists=layer_adjacency_lists,
+                node_to_graph_idx=pruned_node_to_graph_idx,
+                reference_node_ids=pruned_reference_node_ids,
+                reference_node_graph_idx=pruned_reference_node_graph_idx,
+            )
+            all_states.append(node_representations)
+        if return_all_states:
+            node_representations = torch.cat(all_states, dim=-1)
+
+        output_representations = node_representations.new_zeros(
+            (num_nodes, node_representations.shape[1])
+        )
+        output_representations[kept_node_idxs] = node_representations
+        return output_representations
+
     def forward(
         self,
         *,
@@ -1,5 +1,5 @@
 from abc import abstractmethod
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import torch
 from torch import nn
@@ -35,6 +35,15 @@ class AbstractMessagePassingLayer(nn.Module):
             messages, index=message_targets, dim=0, dim_size=num_nodes, reduce=aggregation_fn
         )
 
+    @property
+    def propagation_hops(self) -> Optional[int]:
+        """
+        How far information travels along the edges in this layer: 1 for layers passing messages along the edges,
+        0 for layers computing each node state only from the state of the same node and `None` for layers that may
+        use the state of any node in the graph.
+        """
+        return 1
+
     @property
     @abstractmethod
     def input_state_dimension(self) -> int:
@@ -1,5 +1,5 @@
 from abc import abstractmethod
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import torch
 from torch import nn
@@ -21,6 +21,10 @@ class AbstractGlobalGraphExchange(AbstractMessagePassingLayer):
         self.__global_graph_representation_module = global_graph_representation_module
         self.__dropout = nn.Dropout(p=dropout_rate)
 
+    @property
+    def propagation_hops(self) -> Optional[int]:
+        return None
+
     @abstractmethod
     def _update_node_states(
         self, node_states: torch.Tensor, global_info_per_node: torch.Tensor
@@ -1,4 +1,4 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import torch
 from torch import nn
@@ -12,6 +12,10 @@ class _ResidualOriginLayer(AbstractMessagePassingLayer):
         self.__target_layer = target_layer
         self.__input_dim = input_dim
 
+    @property
+    def propagation_hops(self) -> Optional[int]:
+        return 0
+
     @property
     def input_state_dimension(self) -> int:
         return self.__input_dim
@@ -54,6 +58,10 @@ class MeanResidualLayer(AbstractMessagePassingLayer):
         self._original_input = None  # Reset
         return out
 
+    @property
+    def propagation_hops(self) -> Optional[int]:
+        return 0
+
     @property
     def input_state_dimension(self) -> int:
         return self.__input_dim
@@ -85,6 +93,10 @@ class ConcatResidualLayer(AbstractMessagePassingLayer):
         self._original_input = None  # Reset
         return out
 
+    @property
+    def propagation_hops(self) -> Optional[int]:
+        return 0
+
     @property
     def input_state_dimension(self) -> int:
         return self.__input_dim
@@ -130,6 +142,10 @@ class LinearResidualLayer(AbstractMessagePassingLayer):
         self._original_input = None  # Reset
         return self.__dropout(out)
 
+    @property
+    def propagation_hops(self) -> Optional[int]:
+        return 0
+
     @property
     def input_state_dimension(self) -> int:
         return self.__input_dim2
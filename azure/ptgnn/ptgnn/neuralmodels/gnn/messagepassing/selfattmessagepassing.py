@@ -1,4 +1,4 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import torch
 from torch import nn
@@ -55,6 +55,10 @@ class MultiHeadSelfAttentionMessagePassing(AbstractMessagePassingLayer):
         self.__target_reference = target_reference
         self.__max_num_nodes = max_num_nodes
 
+    @property
+    def propagation_hops(self) -> Optional[int]:
+        return None
+
     def __iter_idxs_per_graph(self, node_to_graph_idx):
         with torch.no_grad():
             num_nodes_per_graph = scatter_sum(
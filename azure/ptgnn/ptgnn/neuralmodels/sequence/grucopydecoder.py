@@ -455,3 +455,141 @@ class GruCopyingDecoderModel(AbstractNeuralModel[DecoderData, TokenizedOutput, G
             )
 
         return list(zip(predicted_tokens, predicted_logprobs))
+
+    def beam_decode(
+        self,
+        *,
+        input_concrete_values: List[str],
+        input_memories,
+        input_memories_origin_idx,
+        initial_states,
+        neural_model: GruCopyingDecoder,
+        beam_size: int = 5
+    ) -> List[List[Tuple[List[str], float]]]:
+        """
+        Beam search over the whole batch at once. The copy probabilities of each input element are added to the
+        probability of its value in an extended vocabulary, which has an extra entry for each value of a target's
+        inputs that is not in the output vocabulary. The beams of all targets are expanded, pruned and reordered with
+        tensor operations, until all of them have produced END or max_seq_len tokens.
+
+        :return: for each target, its `beam_size` sequences along with their log probabilities, the most likely first.
+        """
+        output_vocab = self.__output_vocabulary
+        device = input_memories.device
+        batch_size = initial_states.shape[0]
+        assert len(input_concrete_values) == input_memories.shape[0]
+        vocab_size = len(output_vocab)
+        end_id = output_vocab.get_id_or_unk(self.END)
+        unk_id = output_vocab.get_id_or_unk(output_vocab.get_unk())
+
+        # The id of each input element in the extended vocabulary: its id in the output vocabulary if it has one,
+        # otherwise vocab_size + its position among the out-of-vocabulary values of its target.
+        memory_origin_idxs = input_memories_origin_idx.cpu().tolist()
+        oov_values: List[Dict[str, int]] = [{} for _ in range(batch_size)]
+        memory_extended_ids = []
+        for batch_idx, concrete_value in zip(memory_origin_idxs, input_concrete_values):
+            if output_vocab.is_unk(concrete_value):
+                target_oov_values = oov_values[batch_idx]
+                memory_extended_ids.append(
+                    vocab_size + target_oov_values.setdefault(concrete_value, len(target_oov_values))
+                )
+            else:
+                memory_extended_ids.append(output_vocab.get_id_or_unk(concrete_value))
+        extended_vocab_size = vocab_size + max((len(v) for v in oov_values), default=0)
+
+        # Each target has beam_size rows, row batch_idx * beam_size + beam_idx. Every row reads the inputs of its target.
+        beam_offsets = torch.arange(beam_size, device=device)
+        beam_memories = input_memories.repeat_interleave(beam_size, dim=0)
+        beam_memories_origin_idx = (
+            input_memories_origin_idx.repeat_interleave(beam_size) * beam_size
+            + beam_offsets.repeat(input_memories.shape[0])
+        )
+        # Where the copy probability of each (repeated) input element goes in the flattened extended vocabulary
+        beam_memories_extended_idx = (
+            beam_memories_origin_idx * extended_vocab_size
+            + torch.tensor(memory_extended_ids, dtype=torch.int64, device=device).repeat_interleave(
+                beam_size
+            )
+        )
+
+        current_decoder_states = initial_states.repeat_interleave(beam_size, dim=0)  # [B * K, H]
+        next_token_ids = torch.full(
+            (batch_size * beam_size, 1), output_vocab.get_id_or_unk(self.START), device=device
+        )  # [B * K, 1]
+        # Only the first beam of each target starts out alive, so that the first step does not pick duplicates.
+        beam_logprobs = torch.full((batch_size, beam_size), -math.inf, device=device)  # [B, K]
+        beam_logprobs[:, 0] = 0
+        beam_done = torch.zeros((batch_size, beam_size), dtype=torch.bool, device=device)  # [B, K]
+        beam_tokens = torch.zeros(
+            (batch_size, beam_size, 0), dtype=torch.int64, device=device
+        )  # [B, K, num-steps]
+
+        for i in range(self.max_seq_len):
+            copy_logprobs, target_logprobs, output_decoder_state = neural_model._compute_logprobs(
+                current_decoder_states, beam_memories, beam_memories_origin_idx, next_token_ids
+            )
+
+            # Add up the generation and copy probabilities of each token of the extended vocabulary
+            extended_probs = torch.zeros(
+                (batch_size * beam_size, extended_vocab_size), device=device
+            )  # [B * K, V']
+            extended_probs[:, :vocab_size] = torch.exp(target_logprobs.squeeze(1))
+            extended_probs.view(-1).index_add_(
+                0, beam_memories_extended_idx, torch.exp(copy_logprobs.squeeze(1))
+            )
+            extended_logprobs = torch.log(extended_probs).view(batch_size, beam_size, -1)
+
+            # Finished beams only continue with END, at no cost
+            extended_logprobs[beam_done] = -math.inf
+            extended_logprobs[..., end_id][beam_done] = 0
+
+            candidate_logprobs = (beam_logprobs.unsqueeze(-1) + extended_logprobs).view(
+                batch_size, -1
+            )  # [B, K * V']
+            beam_logprobs, candidate_idxs = torch.topk(candidate_logprobs, beam_size, dim=-1)
+            parent_beams = candidate_idxs // extended_vocab_size  # [B, K]
+            selected_tokens = candidate_idxs % extended_vocab_size  # [B, K]
+
+            # Reorder the beams to follow their parents
+            beam_tokens = torch.cat(
+                (
+                    torch.gather(
+                        beam_tokens,
+                        1,
+                        parent_beams.unsqueeze(-1).expand(-1, -1, beam_tokens.shape[-1]),
+                    ),
+                    selected_tokens.unsqueeze(-1),
+                ),
+                dim=-1,
+            )
+            beam_done = torch.gather(beam_done, 1, parent_beams) | (selected_tokens == end_id)
+            parent_rows = (
+                parent_beams + torch.arange(batch_size, device=device).unsqueeze(-1) * beam_size
+            ).view(-1)
+            current_decoder_states = output_decoder_state.squeeze(0)[parent_rows]
+            if bool(beam_done.all()):
+                break
+
+            # Copied out-of-vocabulary values are fed back as UNK
+            next_token_ids = selected_tokens.view(-1, 1).masked_fill(
+                selected_tokens.view(-1, 1) >= vocab_size, unk_id
+            )
+
+        decoded: List[List[Tuple[List[str], float]]] = []
+        oov_names = [list(target_oov_values) for target_oov_values in oov_values]
+        for batch_idx, (target_beam_tokens, target_beam_logprobs) in enumerate(
+            zip(beam_tokens.cpu().tolist(), beam_logprobs.cpu().tolist())
+        ):
+            target_beams = []
+            for token_ids, logprob in zip(target_beam_tokens, target_beam_logprobs):
+                tokens = []
+                for token_id in token_ids:
+                    if token_id == end_id:
+                        break
+                    if token_id < vocab_size:
+                        tokens.append(output_vocab.get_name_for_id(token_id))
+                    else:
+                        tokens.append(oov_names[batch_idx][token_id - vocab_size])
+                target_beams.append((tokens, logprob))
+            decoded.append(target_beams)
+        return decoded
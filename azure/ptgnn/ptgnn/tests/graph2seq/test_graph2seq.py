@@ -0,0 +1,245 @@
+import copy
+import pickle
+import random
+import unittest
+from typing import List, Optional
+
+import torch
+
+from ptgnn.implementations.graph2seq.graph2seq import CodeGraph2Seq, Graph2Seq
+from ptgnn.neuralmodels.embeddings.strelementrepresentationmodel import (
+    StrElementRepresentationModel,
+)
+from ptgnn.neuralmodels.gnn.graphneuralnetwork import GraphNeuralNetworkModel
+from ptgnn.neuralmodels.gnn.messagepassing.gatedmessagepassing import GatedMessagePassingLayer
+from ptgnn.neuralmodels.gnn.messagepassing.residuallayers import MeanResidualLayer
+from ptgnn.neuralmodels.sequence.grucopydecoder import GruCopyingDecoderModel
+
+HIDDEN_SIZE = 16
+TOKENS = ["log", "info", "x", "y", "value", "(", ")", ".", "+", "msg"]
+
+
+def generate_graphs(num_graphs: int, random_seed: int) -> List[CodeGraph2Seq]:
+    """
+    Random graphs with a backbone of tokens, followed by syntax nodes that are connected by random edges. Some nodes
+    cannot reach the LOG node or the backbone, so pruning the GNN leaves them out.
+    """
+    rng = random.Random(random_seed)
+    graphs = []
+    for _ in range(num_graphs):
+        num_tokens = rng.randint(2, 8)
+        num_nodes = num_tokens + rng.randint(1, 20)
+        graphs.append(
+            {
+                "backbone_sequence": list(range(num_tokens)),
+                "node_labels": [rng.choice(TOKENS) for _ in range(num_tokens)]
+                + [rng.choice(["Block", "Call", "LOG"]) for _ in range(num_nodes - num_tokens)],
+                "edges": {
+                    "NEXT_TOKEN": [[i, i + 1] for i in range(num_tokens - 1)],
+                    "CHILD": [
+                        [rng.randrange(num_nodes), rng.randrange(num_nodes)]
+                        for _ in range(rng.randint(0, num_nodes))
+                    ],
+                },
+                "method_name": [rng.choice(TOKENS) for _ in range(rng.randint(1, 4))],
+                "log_node": rng.randrange(num_tokens, num_nodes),
+            }
+        )
+    return graphs
+
+
+def create_decoder_model() -> GruCopyingDecoderModel:
+    return GruCopyingDecoderModel(
+        hidden_size=HIDDEN_SIZE,
+        embedding_size=HIDDEN_SIZE,
+        memories_hidden_dim=HIDDEN_SIZE,
+        vocabulary_count_threshold=0,
+    )
+
+
+def create_gnn_model() -> GraphNeuralNetworkModel:
+    def create_mp_layers(num_edges: int):
+        ggnn_mp = GatedMessagePassingLayer(
+            state_dimension=HIDDEN_SIZE,
+            message_dimension=HIDDEN_SIZE,
+            num_edge_types=num_edges,
+            message_aggregation_function="sum",
+            dropout_rate=0.0,
+        )
+        r1 = MeanResidualLayer(HIDDEN_SIZE)
+        return [r1.pass_through_dummy_layer(), ggnn_mp, ggnn_mp, r1, ggnn_mp]
+
+    return GraphNeuralNetworkModel(
+        node_representation_model=StrElementRepresentationModel(
+            token_splitting="token", embedding_size=HIDDEN_SIZE,
+        ),
+        message_passing_layer_creator=create_mp_layers,
+    )
+
+
+def create_graph2seq_model(
+    prune_gnn: bool = False, decoder: Optional[GruCopyingDecoderModel] = None
+) -> Graph2Seq:
+    return Graph2Seq(
+        gnn_model=create_gnn_model(),
+        decoder=decoder if decoder is not None else create_decoder_model(),
+        log_node_readout=True,
+        prune_gnn=prune_gnn,
+    )
+
+
+class TestGraph2Seq(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(21)
+        self.graphs = generate_graphs(30, random_seed=21)
+
+    def test_pruned_gnn_gives_the_same_results(self):
+        full_model = create_graph2seq_model()
+        full_model.compute_metadata(iter(self.graphs), parallelize=False)
+        full_network = full_model.build_neural_module()
+        full_network.eval()
+        # The same metadata and weights, only the GNN is pruned to the LOG and backbone nodes
+        pruned_model = create_graph2seq_model(prune_gnn=True)
+        pruned_model.compute_metadata(iter(self.graphs), parallelize=False)
+        pruned_network = pruned_model.build_neural_module()
+        pruned_network.load_state_dict(full_network.state_dict())
+        pruned_network.eval()
+
+        with torch.no_grad():
+            for mb_data, _ in full_model.minibatch_iterator(
+                full_model.tensorize_dataset(iter(self.graphs)),
+                "cpu",
+                max_minibatch_size=10,
+                parallelize=False,
+            ):
+                # The GNN adds the backwards edges to the adjacency lists of the minibatch, each run gets a copy
+                full_output = full_network._run_gnn(copy.deepcopy(mb_data["encoder_mb_data"]))
+                pruned_output = pruned_network._run_gnn(copy.deepcopy(mb_data["encoder_mb_data"]))
+                for reference in ("log_node", "backbone_nodes"):
+                    nodes = full_output.node_idx_references[reference]
+                    torch.testing.assert_close(
+                        pruned_output.output_node_representations[nodes],
+                        full_output.output_node_representations[nodes],
+                    )
+                torch.testing.assert_close(
+                    pruned_network(**copy.deepcopy(mb_data)),
+                    full_network(**copy.deepcopy(mb_data)),
+                )
+
+        full_sequences = full_model.greedy_decode(self.graphs, full_network, "cpu")
+        pruned_sequences = pruned_model.greedy_decode(self.graphs, pruned_network, "cpu")
+        self.assertEqual(
+            [tokens for tokens, _ in pruned_sequences], [tokens for tokens, _ in full_sequences]
+        )
+
+    def test_decode_skips_discarded_graphs(self):
+        model = create_graph2seq_model()
+        model.compute_metadata(iter(self.graphs), parallelize=False)
+        network = model.build_neural_module()
+        network.eval()
+        # The LOG node readout discards the graphs without a LOG node
+        graphs = list(self.graphs)
+        graphs[3] = {**graphs[3], "log_node": -1}
+        graphs[-1] = {**graphs[-1], "log_node": -1}
+
+        kept_sequences = model.greedy_decode(graphs[:3] + graphs[4:-1], network, "cpu")
+        sequences = model.greedy_decode(graphs, network, "cpu")
+        self.assertEqual(len(sequences), len(graphs))
+        self.assertIsNone(sequences[3])
+        self.assertIsNone(sequences[-1])
+        for (tokens, logprob), (kept_tokens, kept_logprob) in zip(
+            sequences[:3] + sequences[4:-1], kept_sequences
+        ):
+            self.assertEqual(tokens, kept_tokens)
+            self.assertAlmostEqual(logprob, kept_logprob, places=4)
+
+    def test_multi_log_graphs_decode_like_single_log_graphs(self):
+        rng = random.Random(22)
+        multi_log_graphs, single_log_graphs = [], []
+        for graph in self.graphs:
+            num_tokens = len(graph["backbone_sequence"])
+            syntax_nodes = list(range(num_tokens, len(graph["node_labels"])))
+            log_nodes = rng.sample(syntax_nodes, min(len(syntax_nodes), rng.randint(1, 3)))
+            targets = [[rng.choice(TOKENS) for _ in range(rng.randint(1, 4))] for _ in log_nodes]
+            base_graph = {k: v for k, v in graph.items() if k not in ("method_name", "log_node")}
+            multi_log_graphs.append({**base_graph, "log_nodes": log_nodes, "method_names": targets})
+            # The same graph once per log, with only that log's LOG node and target
+            single_log_graphs.extend(
+                {**base_graph, "log_node": log_node, "method_name": target}
+                for log_node, target in zip(log_nodes, targets)
+            )
+        model = create_graph2seq_model()
+        model.compute_metadata(iter(single_log_graphs), parallelize=False)
+        network = model.build_neural_module()
+        network.eval()
+
+        multi_log_sequences = model.greedy_decode(multi_log_graphs, network, "cpu")
+        single_log_sequences = model.greedy_decode(single_log_graphs, network, "cpu")
+        self.assertEqual(len(multi_log_sequences), len(single_log_graphs))
+        for (tokens, logprob), (single_log_tokens, single_log_logprob) in zip(
+            multi_log_sequences, single_log_sequences
+        ):
+            self.assertEqual(tokens, single_log_tokens)
+            self.assertAlmostEqual(logprob, single_log_logprob, places=4)
+
+    def test_beam_search_of_width_one_is_greedy(self):
+        decoder = create_decoder_model()
+        model = create_graph2seq_model(decoder=decoder)
+        model.compute_metadata(iter(self.graphs), parallelize=False)
+        network = model.build_neural_module()
+        network.eval()
+
+        with torch.no_grad():
+            for mb_data, input_data in model.minibatch_iterator(
+                model.tensorize_dataset(iter(self.graphs), return_input_data=True),
+                "cpu",
+                max_minibatch_size=10,
+                parallelize=False,
+            ):
+                gnn_output = network._run_gnn(mb_data["encoder_mb_data"])
+                input_memories, input_memories_origin_idx = network._get_input_memories(gnn_output)
+                decoder_inputs = dict(
+                    input_concrete_values=[
+                        graph["node_labels"][k].lower()
+                        for graph in input_data
+                        for k in graph["backbone_sequence"]
+                    ],
+                    input_memories=input_memories,
+                    input_memories_origin_idx=input_memories_origin_idx,
+                    initial_states=network._get_initial_decoder_states(gnn_output),
+                    neural_model=network._decoder,
+                )
+                greedy_sequences = decoder.greedy_decode(**decoder_inputs)
+                beams = decoder.beam_decode(beam_size=1, **decoder_inputs)
+                self.assertEqual(len(beams), len(greedy_sequences))
+                for (greedy_tokens, greedy_logprob), target_beams in zip(greedy_sequences, beams):
+                    self.assertEqual(len(target_beams), 1)
+                    beam_tokens, beam_logprob = target_beams[0]
+                    self.assertEqual(beam_tokens, greedy_tokens)
+                    self.assertAlmostEqual(beam_logprob, greedy_logprob, places=4)
+
+                # Wider beams are sorted from the most likely sequence
+                for target_beams in decoder.beam_decode(beam_size=4, **decoder_inputs):
+                    logprobs = [logprob for _, logprob in target_beams]
+                    self.assertEqual(len(logprobs), 4)
+                    self.assertEqual(logprobs, sorted(logprobs, reverse=True))
+
+    def test_restore_model_pickled_without_readout_options(self):
+        model = create_graph2seq_model()
+        model.compute_metadata(iter(self.graphs), parallelize=False)
+        network = model.build_neural_module()
+        # As pickled before the LOG node readout and the GNN pruning were added
+        for attribute in ("log_node_readout", "prune_gnn"):
+            del model.__dict__[attribute]
+        for attribute in ("_Graph2SeqModule__log_node_readout", "_Graph2SeqModule__prune_gnn"):
+            del network.__dict__[attribute]
+
+        restored_model, restored_network = pickle.loads(pickle.dumps((model, network)))
+        self.assertFalse(restored_model.log_node_readout)
+        self.assertFalse(restored_model.prune_gnn)
+        self.assertFalse(restored_network._Graph2SeqModule__log_node_readout)
+        self.assertFalse(restored_network._Graph2SeqModule__prune_gnn)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import copy
+import random
+import unittest
+from typing import List
+
+import torch
+from torch import nn
+
+from ptgnn.implementations.graph2seq.graph2seq import CodeGraph2Seq
+from ptgnn.implementations.graph2seq.multitask import MultiTaskGraph2Seq
+from ptgnn.implementations.severity.severityclassifier import SEVERITY_LEVELS, severity_class
+from ptgnn.tests.graph2seq.test_graph2seq import (
+    create_decoder_model,
+    create_gnn_model,
+    create_graph2seq_model,
+    generate_graphs,
+)
+
+
+def generate_statement_graphs(num_graphs: int, random_seed: int) -> List[CodeGraph2Seq]:
+    """The random graphs of the Graph2Seq tests as statement mode records, some with an unknown severity."""
+    rng = random.Random(random_seed)
+    return [
+        {**graph, "severity": rng.choice(SEVERITY_LEVELS + ("verbose",))}
+        for graph in generate_graphs(num_graphs, random_seed)
+    ]
+
+
+def create_multitask_model(
+    message_loss_weight: float = 1.0, severity_loss_weight: float = 1.0
+) -> MultiTaskGraph2Seq:
+    return MultiTaskGraph2Seq(
+        gnn_model=create_gnn_model(),
+        decoder=create_decoder_model(),
+        log_node_readout=True,
+        message_loss_weight=message_loss_weight,
+        severity_loss_weight=severity_loss_weight,
+    )
+
+
+class TestMultiTaskGraph2Seq(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(24)
+        self.graphs = generate_statement_graphs(30, random_seed=24)
+        self.model = create_multitask_model(message_loss_weight=0.3, severity_loss_weight=2.0)
+        self.model.compute_metadata(iter(self.graphs), parallelize=False)
+        self.network = self.model.build_neural_module()
+        self.network.eval()
+        # The Graph2Seq with the same metadata and the weights of the GNN and the decoder of the multi-task model
+        self.graph2seq_model = create_graph2seq_model()
+        self.graph2seq_model.compute_metadata(iter(self.graphs), parallelize=False)
+        self.graph2seq_network = self.graph2seq_model.build_neural_module()
+        self.graph2seq_network.load_state_dict(self.network.state_dict(), strict=False)
+        self.graph2seq_network.eval()
+
+    def test_loss_is_the_weighted_sum_of_both_losses(self):
+        severity_head = self.network._MultiTaskGraph2SeqModule__severity_head
+        with torch.no_grad():
+            for mb_data, _ in self.model.minibatch_iterator(
+                self.model.tensorize_dataset(iter(self.graphs)),
+                "cpu",
+                max_minibatch_size=10,
+                parallelize=False,
+            ):
+                # The GNN adds the backwards edges to the adjacency lists of the minibatch, each run gets a copy
+                message_loss = self.graph2seq_network(
+                    encoder_mb_data=copy.deepcopy(mb_data["encoder_mb_data"]),
+                    decoder_mb_data=mb_data["decoder_mb_data"],
+                )
+                gnn_output = self.network._run_gnn(copy.deepcopy(mb_data["encoder_mb_data"]))
+                severity_loss = nn.functional.cross_entropy(
+                    severity_head(self.network._get_initial_decoder_states(gnn_output)),
+                    mb_data["severity_classes"],
+                    ignore_index=-100,
+                )
+                torch.testing.assert_close(
+                    self.network(**copy.deepcopy(mb_data)), 0.3 * message_loss + 2.0 * severity_loss
+                )
+
+    def test_decode_with_severities_decodes_like_graph2seq(self):
+        predictions = self.model.decode_with_severities(self.graphs, self.network, "cpu")
+        sequences = self.graph2seq_model.greedy_decode(self.graphs, self.graph2seq_network, "cpu")
+        self.assertEqual(len(predictions), len(self.graphs))
+        for (tokens, logprob, severity, severity_prob), (graph2seq_tokens, graph2seq_logprob) in zip(
+            predictions, sequences
+        ):
+            self.assertEqual(tokens, graph2seq_tokens)
+            self.assertAlmostEqual(logprob, graph2seq_logprob, places=4)
+            self.assertIn(severity, SEVERITY_LEVELS)
+            self.assertGreaterEqual(severity_prob, 1 / len(SEVERITY_LEVELS))
+
+    def test_unknown_severities_are_not_classified(self):
+        classes = [severity_class(graph["severity"]) for graph in self.graphs]
+        self.assertIn(None, classes)
+        tensorized = [self.model.tensorize(graph) for graph in self.graphs]
+        self.assertEqual(
+            [t.severity_classes for t in tensorized],
+            [[-100 if cls is None else cls] for cls in classes],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import copy
+import random
+import unittest
+from typing import List
+
+import numpy as np
+import torch
+
+from ptgnn.implementations.graph2seq.graph2seq import CodeGraph2Seq
+from ptgnn.implementations.severity.severityclassifier import SEVERITY_LEVELS
+from ptgnn.implementations.severity.train import create_severity_classifier_model
+from ptgnn.tests.graph2seq.test_graph2seq import HIDDEN_SIZE, generate_graphs
+
+
+def generate_severity_graphs(num_graphs: int, random_seed: int) -> List[CodeGraph2Seq]:
+    """
+    The random graphs of the Graph2Seq tests as severity mode records: every other graph is a multi-log graph with
+    up to three LOG nodes.
+    """
+    rng = random.Random(random_seed)
+    graphs = []
+    for i, graph in enumerate(generate_graphs(num_graphs, random_seed)):
+        if i % 2 == 0:
+            graphs.append({**graph, "method_name": [rng.choice(SEVERITY_LEVELS)]})
+            continue
+        num_tokens = len(graph["backbone_sequence"])
+        syntax_nodes = list(range(num_tokens, len(graph["node_labels"])))
+        log_nodes = rng.sample(syntax_nodes, min(len(syntax_nodes), rng.randint(1, 3)))
+        multi_log_graph = {k: v for k, v in graph.items() if k not in ("method_name", "log_node")}
+        multi_log_graph["log_nodes"] = log_nodes
+        multi_log_graph["method_names"] = [[rng.choice(SEVERITY_LEVELS)] for _ in log_nodes]
+        graphs.append(multi_log_graph)
+    return graphs
+
+
+def graph_log_nodes(graph: CodeGraph2Seq) -> List[int]:
+    return graph["log_nodes"] if "log_nodes" in graph else [graph["log_node"]]
+
+
+def graph_severities(graph: CodeGraph2Seq) -> List[str]:
+    if "method_names" in graph:
+        return [target[0] for target in graph["method_names"]]
+    return graph["method_name"]
+
+
+class TestSeverityClassifier(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(23)
+        self.graphs = generate_severity_graphs(20, random_seed=23)
+
+    def create_model(self, prune_gnn: bool = False):
+        model = create_severity_classifier_model(
+            prune_gnn=prune_gnn, hidden_state_size=HIDDEN_SIZE, dropout_rate=0.0
+        )
+        model.compute_metadata(iter(self.graphs), parallelize=False)
+        return model
+
+    def test_tensorize_single_and_multi_log_records(self):
+        model = self.create_model()
+        for graph in self.graphs:
+            tensorized = model.tensorize(graph)
+            self.assertEqual(
+                tensorized.target_classes,
+                [SEVERITY_LEVELS.index(severity) for severity in graph_severities(graph)],
+            )
+            np.testing.assert_array_equal(
+                tensorized.graph.reference_nodes["log_node"], graph_log_nodes(graph)
+            )
+
+        # Unknown log levels are not classified, a graph without known ones is discarded
+        graph = self.graphs[3]
+        self.assertEqual(len(graph["log_nodes"]), 2)
+        tensorized = model.tensorize({**graph, "method_names": [["verbose"], graph["method_names"][1]]})
+        self.assertEqual(tensorized.target_classes, [SEVERITY_LEVELS.index(graph["method_names"][1][0])])
+        np.testing.assert_array_equal(
+            tensorized.graph.reference_nodes["log_node"], graph["log_nodes"][1:]
+        )
+        self.assertIsNone(model.tensorize({**graph, "method_names": [["verbose"], ["verbose"]]}))
+
+    def test_predict_classifies_every_log_node(self):
+        model = self.create_model()
+        network = model.build_neural_module()
+        predictions = model.predict(self.graphs, network, "cpu")
+        self.assertEqual(
+            [actual for actual, _, _ in predictions],
+            [severity for graph in self.graphs for severity in graph_severities(graph)],
+        )
+        for _, predicted, prob in predictions:
+            self.assertIn(predicted, SEVERITY_LEVELS)
+            self.assertGreaterEqual(prob, 1 / len(SEVERITY_LEVELS))
+            self.assertLessEqual(prob, 1)
+
+    def test_pruned_gnn_gives_the_same_logits(self):
+        full_model = self.create_model()
+        full_network = full_model.build_neural_module()
+        full_network.eval()
+        # The same metadata and weights, only the GNN is pruned to the LOG nodes
+        pruned_model = self.create_model(prune_gnn=True)
+        pruned_network = pruned_model.build_neural_module()
+        pruned_network.load_state_dict(full_network.state_dict())
+        pruned_network.eval()
+
+        with torch.no_grad():
+            for mb_data, _ in full_model.minibatch_iterator(
+                full_model.tensorize_dataset(iter(self.graphs)),
+                "cpu",
+                max_minibatch_size=10,
+                parallelize=False,
+            ):
+                # The GNN adds the backwards edges to the adjacency lists of the minibatch, each run gets a copy
+                torch.testing.assert_close(
+                    pruned_network._logits(copy.deepcopy(mb_data["graph_mb_data"])),
+                    full_network._logits(copy.deepcopy(mb_data["graph_mb_data"])),
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
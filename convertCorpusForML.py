@@ -1,5 +1,12 @@
 import re
-import shutil
+import os
+import socket
+import threading
+import traceback
+import collections
+import hashlib
+import functools
+import time
 from enum import Enum
 import multiprocessing
 from graph_pb2 import Graph
@@ -33,94 +40,621 @@ class EdgeType(Enum):
     METHOD_SIGNATURE = 17
 
 
+# Edge type value -> name, as written to the edges of the converted graphs
+EDGE_TYPE_NAMES = {edgeType.value: edgeType.name for edgeType in EdgeType}
+
+# Stand-ins for the LOG node and the redirected edges of delta encoded graphs, with the fields convertGraph uses
+PatchedNode = collections.namedtuple("PatchedNode", ["id", "type", "contents"])
+PatchedEdge = collections.namedtuple("PatchedEdge", ["sourceId", "destinationId", "type"])
+
+
 def main():
-    # open our JSON
-    with open(inputJSON) as jsonf:
-        # load the logs
-        logs = json.load(jsonf)
-        # we're debugging
-        if args.debug is not None:
-            # get the single graph and convert it.
-            graphLoc = logs[args.debug][0]
-            severity = logs[args.debug][1]
-            msg = logs[args.debug][2]
-            print(graphLoc)
-            print(convertGraph(graphLoc, severity, msg))
+    # workers get their logs from the queue of the coordinator
+    if args.role == "worker":
+        runQueueWorkers(Path(args.queue_dir))
+        return
+    # stream in the logs written by nodeParsing. Only the locations, severities and msgs are kept, never the graphs
+    logs = list(readSeverities(inputJSON, follow=args.follow))
+    # we're debugging
+    if args.debug is not None:
+        # get the single graph and convert it.
+        graphLoc = logs[args.debug][0]
+        severity = logs[args.debug][1]
+        msg = logs[args.debug][2]
+        print(graphLoc)
+        print(convertGraph(graphLoc, severity, msg))
+    else:
+        # set up the output Paths, the gzipped files are written directly
+        outputSuffix = ".jsonl.gz" if args.convert else ".jsonl"
+        if args.binary:
+            outputSuffix = ".shards"
+        outputTrainLogs = outputFolder / ("trainLogs" + outputSuffix)
+        outputValidationLogs = outputFolder / ("validationLogs" + outputSuffix)
+        outputTestLogs = outputFolder / ("testLogs" + outputSuffix)
+        outputFolder.mkdir(parents=True, exist_ok=True)
+
+        # Modify all logs if the flag is true.
+        if args.disallow_same_class is True:
+            logs = modifyLogsForSmokeTest(logs)
+
+        # limit our log count
+        if args.limit is not None:
+            logs = logs[0:args.limit]
+        # only convert the graphs that are not in the existing outputs yet
+        convertedGraphsPath = outputFolder / "convertedGraphs.txt"
+        journalPath = outputFolder / "conversionJournal.json"
+        if journalPath.exists():
+            print("The previous conversion into this folder did not finish, rolling its outputs back")
+            rollBackJournal(journalPath)
+        if args.incremental and convertedGraphsPath.exists():
+            # the graph paths number the logs of each file, so the converted source files are remembered instead
+            convertedFiles = set()
+            with open(convertedGraphsPath) as convertedGraphsFile:
+                for line in convertedGraphsFile:
+                    convertedFile = line.rstrip("\n")
+                    # older runs listed the converted graphs
+                    if convertedFile.endswith(".proto"):
+                        convertedFile = graphSourceFile(convertedFile)
+                    convertedFiles.add(convertedFile)
+            logs = [log for log in logs
+                    if logSourceFile(log) not in convertedFiles and graphSourceFile(log[0]) not in convertedFiles]
+            print(f"{len(convertedFiles)} source files were converted before, {len(logs)} new logs to convert")
+        # split the logs into our sets
+        trainLogs, validationLogs, testLogs = splitLogs(logs)
+        print(
+            f"Split the data into: {len(trainLogs)} training logs, {len(validationLogs)} validation logs and {len(testLogs)} test logs!")
+        writeJournal(journalPath, [outputTrainLogs, outputValidationLogs, outputTestLogs], convertedGraphsPath)
+        if args.role == "coordinator":
+            # the workers convert the chunks of the queue, the coordinator merges them into the outputs
+            logs = coordinateQueue(Path(args.queue_dir), [("trainLogs", trainLogs, outputTrainLogs),
+                                                          ("validationLogs", validationLogs, outputValidationLogs),
+                                                          ("testLogs", testLogs, outputTestLogs)])
+        else:
+            print(f"Will use {args.workers} worker processes (should be 1 per CPU available)")
+
+            # The following three blocks convert the sets, sharing one pool of worker processes
+            with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=initWorker,
+                                                        initargs=(args,)) as executor:
+                print("Starting generation of training set.")
+                convertLogsAsync(executor, trainLogs, outputTrainLogs)
+
+                print("Done. Starting generation of validation set.")
+                convertLogsAsync(executor, validationLogs, outputValidationLogs)
+
+                print("Done. Starting generation of testing set.")
+                convertLogsAsync(executor, testLogs, outputTestLogs)
+        # remember what was converted, for the next incremental run
+        with open(convertedGraphsPath, "a" if args.incremental else "w") as convertedGraphsFile:
+            for convertedFile in dict.fromkeys(logSourceFile(log) for log in logs):
+                convertedGraphsFile.write(convertedFile + "\n")
+        journalPath.unlink()
+        if args.convert or args.binary:
+            print("All done! You can insert the generated files directly into graph2Sequence now.")
+        else:
+            print("All done! Please remember to gzip these files before feeding them into graphToSequence")
+            print("If on linux, please run 'gzip -k trainLogs.jsonl && gzip -k validationLogs.jsonl && gzip -k "
+                  "testLogs.jsonl'")
+        if amlCTX is not None and args.binary:
+            print("Uploading to azure Output")
+            for outputShards in (outputTrainLogs, outputValidationLogs, outputTestLogs):
+                amlCTX.upload_folder(name=outputShards.name, path=str(outputShards))
+                uploadSizeIndex(outputShards)
+            print("Done!")
+        elif amlCTX is not None:
+            print("Uploading to azure Output")
+            amlCTX.upload_file(name="trainLogs.jsonl.gz", path_or_stream=str(outputFolder / "trainLogs.jsonl.gz"))
+            amlCTX.upload_file(name="validationLogs.jsonl.gz",
+                               path_or_stream=str(outputFolder / "validationLogs.jsonl.gz"))
+            amlCTX.upload_file(name="testLogs.jsonl.gz", path_or_stream=str(outputFolder / "testLogs.jsonl.gz"))
+            for outputFile in (outputTrainLogs, outputValidationLogs, outputTestLogs):
+                uploadSizeIndex(outputFile)
+            print("Done!")
+
+
+# Uploads the size index of a set next to it, ptgnn's train.py looks for it next to the set it trains on
+def uploadSizeIndex(outputFile):
+    amlCTX.upload_file(name=sizeIndexPath(outputFile).name, path_or_stream=str(sizeIndexPath(outputFile)))
+
+
+# Reads the severities file written by nodeParsing, one line at a time. A partially written last line is skipped. If
+# follow is set, waits for nodeParsing to mark the file as done before returning. Legacy severities.json arrays are
+# loaded in one go.
+def readSeverities(location, follow=False):
+    if location.suffix == ".json":
+        with open(location) as jsonf:
+            yield from json.load(jsonf)
+        return
+    donePath = Path(str(location) + ".done")
+    while follow and not location.exists():
+        time.sleep(1)
+    with open(location) as jsonlFile:
+        partialLine = ""
+        writerDone = False
+        while True:
+            line = jsonlFile.readline()
+            if line.endswith("\n"):
+                yield json.loads(partialLine + line)
+                partialLine = ""
+                continue
+            partialLine += line
+            if not follow or writerDone:
+                break
+            # nodeParsing might have written more lines right before creating the .done marker, read once more
+            writerDone = donePath.exists()
+            if not writerDone:
+                time.sleep(1)
+
+
+# Converts a set of logs using the worker processes of the executor. The logs are handed out in chunks, with only a few
+# chunks per worker in flight at a time, and each chunk is written to the output file as soon as it and all chunks before
+# it are done. The output keeps the order of the logs and the memory used does not depend on the number of logs.
+# When gzipping, every worker compresses its own chunks into separate gzip members. Concatenated, they form a single
+# valid gzip file.
+# With --incremental, the graphs are appended to the existing output.
+# The sizes of the graphs are written to a sidecar index next to the output (see SizeIndexWriter).
+def convertLogsAsync(executor, logs, outputFile):
+    if args.binary:
+        output = ShardWriter(outputFile, args.shard_size, append=args.incremental)
+    else:
+        output = open(outputFile, "ab" if args.incremental else "wb")
+    sizeIndex = SizeIndexWriter(sizeIndexPath(outputFile))
+    with output as outFile, sizeIndex, tqdm(total=len(logs), unit="graphs") as progress:
+        inFlight = collections.deque()
+        for start in range(0, len(logs), args.chunk_size):
+            inFlight.append(executor.submit(convertChunk, logs[start:start + args.chunk_size]))
+            while len(inFlight) >= 2 * args.workers:
+                writeChunk(outFile, sizeIndex, inFlight.popleft().result(), progress)
+        while len(inFlight) > 0:
+            writeChunk(outFile, sizeIndex, inFlight.popleft().result(), progress)
+        writeEmptyMember(outFile)
+
+
+# Converts a chunk of logs inside a worker process, returning the number of logs, their jsonl lines (gzipped if
+# requested) and their sizes. For the binary format, returns the graph dicts instead of the lines.
+def convertChunk(logs):
+    records = [graphRecord(log[0], log[1], log[2]) for log in logs]
+    sizes = [recordSize(record) for record in records]
+    if args.binary:
+        return len(logs), records, sizes
+    jsonLines = [(json.dumps(record) + "\n").encode("utf-8") for record in records]
+    for size, jsonLine in zip(sizes, jsonLines):
+        size["length"] = len(jsonLine)
+    chunk = b"".join(jsonLines)
+    if args.convert:
+        chunk = gzip.compress(chunk, compresslevel=args.compression_level)
+    return len(logs), chunk, sizes
+
+
+def writeChunk(outFile, sizeIndex, convertedChunk, progress):
+    numLogs, chunk, sizes = convertedChunk
+    # a gzip member starts where the chunk is written
+    sizeIndex.write(sizes, outFile.tell() if args.convert and not args.binary else None)
+    outFile.write(chunk)
+    progress.update(numLogs)
+
+
+# The sidecar size index of an output (see SizeIndexWriter)
+def sizeIndexPath(outputFile):
+    return outputFile.parent / (outputFile.name + ".index.jsonl")
+
+
+# A 0 byte file is not a valid gzip file, so a gzipped set without any graphs gets a single empty gzip member
+def writeEmptyMember(outFile):
+    if args.convert and not args.binary and outFile.tell() == 0:
+        outFile.write(gzip.compress(b"", compresslevel=args.compression_level))
+
+
+# The sizes of a converted graph, as stored in the sidecar index. The target of a multi-log graph counts the tokens of
+# all its logs, logs is the number of logs
+def recordSize(record):
+    size = {
+        "nodes": len(record["node_labels"]),
+        "edges": {edgeType: len(typeEdges) for edgeType, typeEdges in record["edges"].items()},
+        "backbone": len(record["backbone_sequence"]),
+    }
+    if "log_nodes" in record:
+        size["target"] = sum(len(target) for target in record["method_names"])
+        size["logs"] = len(record["log_nodes"])
+    else:
+        size["target"] = len(record["method_name"])
+    return size
+
+
+# Writes the sidecar index of a set (trainLogs.jsonl.gz.index.jsonl etc.), one line per graph in the same order as the output,
+# so the sizes of the graphs are known without reading them:
+#   - nodes, edges (per edge type), backbone and target: number of nodes, edges, backbone nodes and method_name tokens
+#   - offset: where the graph's line starts in the (uncompressed) jsonl, or the position of the graph in the set for the
+#     binary format
+#   - length: the number of bytes of the graph's line (jsonl only)
+#   - member: where the gzip member holding the line starts in the jsonl.gz file (gzipped only)
+class SizeIndexWriter:
+    def __init__(self, location):
+        self.offset = 0
+        if args.incremental and location.exists():
+            # continue after the last graph of the existing index
+            lastEntry = None
+            with open(location) as indexFile:
+                for line in indexFile:
+                    lastEntry = json.loads(line)
+            if lastEntry is not None:
+                self.offset = lastEntry["offset"] + lastEntry.get("length", 1)
+        self.indexFile = open(location, "a" if args.incremental else "w")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.indexFile.close()
+
+    def write(self, sizes, memberOffset=None):
+        for size in sizes:
+            size["offset"] = self.offset
+            self.offset += size.get("length", 1)
+            if memberOffset is not None:
+                size["member"] = memberOffset
+            self.indexFile.write(json.dumps(size) + "\n")
+
+
+# Writes converted graphs in a sharded binary format, which ptgnn can memory-map instead of parsing JSON. Every shard is
+# a folder holding up to shardSize graphs:
+#   - shard.json: number of graphs, edge types present and the strings table. Node labels and method_name tokens are
+#     stored as ids into the strings table
+#   - node_labels.npy, backbone_sequence.npy, method_name.npy: the values of all graphs, one after the other
+#   - edges_<TYPE>.npy: the [source, destination] pairs of all graphs for one edge type
+#   - <name>_offsets.npy: for each of the above, where the values of graph i start (offsets[i]) and end (offsets[i + 1])
+#   - log_node.npy: the log node of each graph
+# Shards of multi-log graphs (shard.json has multi_log set) have log_nodes.npy and its offsets instead of log_node.npy,
+# method_name.npy holds the tokens of all logs of a graph one after the other and method_name_lengths.npy the number
+# of tokens of each log.
+# index.json lists the shards with their number of graphs. Written as graphs come in, only one shard is kept in memory.
+# When appending, new shards are added after the ones listed in an existing index.json.
+class ShardWriter:
+    def __init__(self, folder, shardSize, append=False):
+        self.folder = folder
+        self.shardSize = shardSize
+        self.shards = []
+        self.records = []
+        self.folder.mkdir(parents=True, exist_ok=True)
+        if append:
+            self.shards = self.listedShards(self.folder)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, records):
+        for record in records:
+            self.records.append(record)
+            if len(self.records) >= self.shardSize:
+                self.writeShard()
+
+    def close(self):
+        if len(self.records) > 0:
+            self.writeShard()
+        self.writeIndex(self.folder, self.shards)
+
+    # Lists the given shards in the index.json of the folder, shards not listed there are never read
+    @staticmethod
+    def writeIndex(folder, shards):
+        index = {"num_graphs": sum(shard["num_graphs"] for shard in shards), "shards": shards}
+        writeAtomically(folder / "index.json", json.dumps(index).encode("utf-8"))
+
+    # The shards listed in the index.json of the folder
+    @staticmethod
+    def listedShards(folder):
+        if not (folder / "index.json").exists():
+            return []
+        with open(folder / "index.json") as indexFile:
+            return json.load(indexFile)["shards"]
+
+    def writeShard(self):
+        shardName = f"shard-{len(self.shards):05d}"
+        shardFolder = self.folder / shardName
+        shardFolder.mkdir(exist_ok=True)
+        strings = {}
+        internStrings = lambda values: [strings.setdefault(value, len(strings)) for value in values]
+        self.saveRagged(shardFolder, "node_labels", [internStrings(r["node_labels"]) for r in self.records], np.int32)
+        multiLog = "log_nodes" in self.records[0]
+        if multiLog:
+            self.saveRagged(shardFolder, "method_name",
+                            [internStrings([token for target in r["method_names"] for token in target])
+                             for r in self.records], np.int32)
+            self.saveRagged(shardFolder, "method_name_lengths",
+                            [[len(target) for target in r["method_names"]] for r in self.records], np.int32)
+            self.saveRagged(shardFolder, "log_nodes", [r["log_nodes"] for r in self.records], np.int64)
         else:
-            # set up the output Paths
-            outputTrainLogs = outputFolder / "trainLogs.jsonl"
-            outputValidationLogs = outputFolder / "validationLogs.jsonl"
-            outputTestLogs = outputFolder / "testLogs.jsonl"
-
-            # Modify all logs if the flag is true.
-            if args.disallow_same_class is True:
-                logs = modifyLogsForSmokeTest(logs)
-
-            # limit our log count
-            if args.limit is not None:
-                logs = logs[0:args.limit]
-            # split the logs into our sets
-            trainLogs, validationLogs, testLogs = splitLogs(logs)
-            print(
-                f"Split the data into: {len(trainLogs)} training logs, {len(validationLogs)} validation logs and {len(testLogs)} test logs!")
-            print(f"Will use {multiprocessing.cpu_count()} of threads (should be 1 per CPU available)")
-
-            # The following three blocks convert the sets using as many threads as there are CPU cores
-            print("Starting generation of training set.")
-            convertLogsAsync(trainLogs, outputTrainLogs)
-
-            print("Done. Starting generation of validation set.")
-            convertLogsAsync(validationLogs, outputValidationLogs)
-
-            print("Done. Starting generation of testing set.")
-            convertLogsAsync(testLogs, outputTestLogs)
-            # Handle auto-zipping of generated files
-            if args.convert:
-                print("Zipping into gz format.")
-                zipJSONL(outputTrainLogs, "trainLogs.jsonl.gz")
-                zipJSONL(outputValidationLogs, "validationLogs.jsonl.gz")
-                zipJSONL(outputTestLogs, "testLogs.jsonl.gz")
-                print("Done. Deleting raw jsonl files.")
-                outputTrainLogs.unlink()
-                outputValidationLogs.unlink()
-                outputTestLogs.unlink()
-                print("All done! You can insert the generated files directly into graph2Sequence now.")
-            else:
-                print("All done! Please remember to gzip these files before feeding them into graphToSequence")
-                print("If on linux, please run 'gzip -k trainLogs.jsonl && gzip -k validationLogs.jsonl && gzip -k "
-                      "testLogs.jsonl'")
-            if amlCTX is not None:
-                print("Uploading to azure Output")
-                amlCTX.upload_file(name="trainLogs.jsonl.gz", path_or_stream=str(outputFolder / "trainLogs.jsonl.gz"))
-                amlCTX.upload_file(name="validationLogs.jsonl.gz",
-                                   path_or_stream=str(outputFolder / "validationLogs.jsonl.gz"))
-                amlCTX.upload_file(name="testLogs.jsonl.gz", path_or_stream=str(outputFolder / "testLogs.jsonl.gz"))
-                print("Done!")
-
-
-# Converts a set of logs using multiple threads. Writes the result to an output file
-def convertLogsAsync(logs, outputFile):
-    # set up our Executor
-    with concurrent.futures.ProcessPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
-        # Manual tqdm implementation so we have a progress bar
-        with tqdm(total=len(logs), unit="graphs") as progress:
-            futures = []
-            for [graphLoc, severity, msgToken] in logs:
-                # here is where we convert the graph
-                future = executor.submit(convertGraph, graphLoc, severity, msgToken)
-                future.add_done_callback(lambda p: progress.update())
-                futures.append(future)
-            results = []
-            for future in futures:
-                result = future.result()
-                results.append(result)
-        # better way to handle async execution, but no progress bar!
-        # results = list(executor.map(convertFromGraphs, logs))
-    # write the output to our file, then clean up memory (automaticly) when the function is over.
-    with open(outputFile, "w") as outFile:
-        for jsonLog in results:
-            outFile.write(jsonLog)
-            outFile.write("\n")
+            self.saveRagged(shardFolder, "method_name", [internStrings(r["method_name"]) for r in self.records],
+                            np.int32)
+            np.save(shardFolder / "log_node.npy", np.array([r["log_node"] for r in self.records], dtype=np.int64))
+        # the severities of the statement mode, one per log
+        hasSeverity = "severity" in self.records[0] or "severities" in self.records[0]
+        if hasSeverity:
+            self.saveRagged(shardFolder, "severity",
+                            [internStrings(r["severities"] if multiLog else [r["severity"]]) for r in self.records],
+                            np.int32)
+        self.saveRagged(shardFolder, "backbone_sequence", [r["backbone_sequence"] for r in self.records], np.int32)
+        edgeTypes = list(dict.fromkeys(edgeType for r in self.records for edgeType in r["edges"]))
+        for edgeType in edgeTypes:
+            self.saveRagged(shardFolder, "edges_" + edgeType, [r["edges"].get(edgeType, []) for r in self.records],
+                            np.int32, (0, 2))
+        with open(shardFolder / "shard.json", "w") as shardFile:
+            json.dump({"num_graphs": len(self.records), "edge_types": edgeTypes, "strings": list(strings),
+                       "multi_log": multiLog, "severity": hasSeverity}, shardFile)
+        self.shards.append({"name": shardName, "num_graphs": len(self.records)})
+        self.records = []
+
+    # Saves the values of all graphs as one array, along with the offsets of each graph's values
+    @staticmethod
+    def saveRagged(shardFolder, name, values, dtype, emptyShape=(0,)):
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(graphValues) for graphValues in values])
+        nonEmpty = [np.array(graphValues, dtype=dtype) for graphValues in values if len(graphValues) > 0]
+        allValues = np.concatenate(nonEmpty) if len(nonEmpty) > 0 else np.zeros(emptyShape, dtype=dtype)
+        np.save(shardFolder / (name + ".npy"), allValues)
+        np.save(shardFolder / (name + "_offsets.npy"), offsets)
+
+
+# Undo journal of a conversion (conversionJournal.json in the output folder), written before any output is touched. It
+# records the size of every file the conversion appends to (0 for the files it overwrites) and the shards listed by each
+# binary set. Once convertedGraphs.txt lists the new source files, the journal is removed. A conversion killed in
+# between leaves the journal behind, and the next run first rolls the outputs back to the recorded state. This way the
+# outputs never hold graphs of files that convertedGraphs.txt does not list, which an incremental run would append a
+# second time.
+def writeJournal(journalPath, outputFiles, convertedGraphsPath):
+    files = [convertedGraphsPath]
+    shards = {}
+    for outputFile in outputFiles:
+        files.append(sizeIndexPath(outputFile))
+        if args.binary:
+            shards[outputFile.name] = ShardWriter.listedShards(outputFile) if args.incremental else []
+        else:
+            files.append(outputFile)
+    # every file is in the output folder, the journal only holds their names
+    sizes = {f.name: f.stat().st_size if args.incremental and f.exists() else 0 for f in files}
+    writeAtomically(journalPath, json.dumps({"sizes": sizes, "shards": shards}).encode("utf-8"))
+
+
+def rollBackJournal(journalPath):
+    with open(journalPath) as journalFile:
+        journal = json.load(journalFile)
+    for name, size in journal["sizes"].items():
+        if (journalPath.parent / name).exists():
+            os.truncate(journalPath.parent / name, size)
+    # shards written after the recorded ones are no longer listed, they are overwritten by the next shards written
+    for name, shards in journal["shards"].items():
+        if (journalPath.parent / name).exists():
+            ShardWriter.writeIndex(journalPath.parent / name, shards)
+    journalPath.unlink()
+
+
+# Sets up a worker process of the conversion. The options are globals defined under __main__, which only forked workers
+# inherit, so they are handed to every worker explicitly
+def initWorker(workerArgs):
+    global args
+    args = workerArgs
+
+
+# Distributed conversion over a work queue in a shared directory (--queue_dir), without anything but a file system
+# shared by the coordinator and the workers:
+#   - queue.json: the chunks in output order and the conversion settings, written by the coordinator once the chunks are
+#   - chunks/<name>.json: the logs of a chunk, args.chunk_size logs of one set each
+#   - leases/<name>.<attempt>.lock: created exclusively (O_EXCL) by the worker converting the chunk. The worker writes
+#     an increasing heartbeat count to it every few seconds. A lease whose count a worker has not seen change for
+#     --lease_timeout seconds (of its own clock, so the clocks of the machines do not matter) is abandoned, and the
+#     chunk is leased again with the next attempt number, up to --max_attempts
+#   - results/<name>.jsonl(.gz): the JSON lines of the converted graphs, gzipped like the outputs. results/<name>.json
+#     holds the number of graphs and their sizes, it is renamed into place last and marks the chunk as converted.
+#     results/<name>.failed marks a chunk that failed every attempt, errors/<name>.<attempt>.txt hold the tracebacks
+# The coordinator waits for every chunk to have a result and then merges them into the usual outputs, in order.
+# The graph locations in the chunks are relative, so the workers have to run from the same folder as the coordinator.
+QUEUE_SETTINGS = ["statement_generation", "convert", "compression_level", "binary", "crop_hops", "crop_edge_types",
+                  "crop_backbone_window"]
+
+
+def coordinateQueue(queueDir, sets):
+    if (queueDir / "queue.json").exists():
+        raise SystemExit(f"{queueDir} already holds a queue, please use an empty queue directory")
+    for folder in ("chunks", "leases", "results", "errors"):
+        (queueDir / folder).mkdir(parents=True, exist_ok=True)
+    chunks = []
+    for setName, setLogs, _ in sets:
+        for start in range(0, len(setLogs), args.chunk_size):
+            chunkName = f"{setName}-{len(chunks):06d}"
+            with open(queueDir / "chunks" / (chunkName + ".json"), "w") as chunkFile:
+                json.dump(setLogs[start:start + args.chunk_size], chunkFile)
+            chunks.append({"name": chunkName, "set": setName, "logs": len(setLogs[start:start + args.chunk_size])})
+    manifest = {"chunks": chunks, "lease_timeout": args.lease_timeout, "max_attempts": args.max_attempts,
+                "settings": {setting: getattr(args, setting) for setting in QUEUE_SETTINGS}}
+    writeAtomically(queueDir / "queue.json", json.dumps(manifest).encode("utf-8"))
+    print(f"Queued {len(chunks)} chunks in {queueDir}. Waiting for workers "
+          f"(convertCorpusForML.py --role worker --queue_dir {queueDir})")
+
+    # wait for all chunks to be converted or to have failed
+    with tqdm(total=sum(chunk["logs"] for chunk in chunks), unit="graphs") as progress:
+        finished = set()
+        while len(finished) < len(chunks):
+            results = set(os.listdir(queueDir / "results"))
+            for chunk in chunks:
+                if chunk["name"] not in finished and (chunk["name"] + ".json" in results
+                                                      or chunk["name"] + ".failed" in results):
+                    finished.add(chunk["name"])
+                    progress.update(chunk["logs"])
+            if len(finished) < len(chunks):
+                time.sleep(queuePollInterval(args.lease_timeout))
+
+    # merge the results into the outputs, only the graphs of converted chunks count as converted
+    convertedLogs = []
+    for setName, setLogs, outputFile in sets:
+        print(f"Merging {setName}.")
+        if args.binary:
+            output = ShardWriter(outputFile, args.shard_size, append=args.incremental)
+        else:
+            output = open(outputFile, "ab" if args.incremental else "wb")
+        sizeIndex = SizeIndexWriter(sizeIndexPath(outputFile))
+        with output as outFile, sizeIndex, tqdm(total=len(setLogs), unit="graphs") as progress:
+            for chunk in chunks:
+                if chunk["set"] != setName:
+                    continue
+                graphsPath, resultPath = chunkResultPaths(queueDir, chunk["name"])
+                if not resultPath.exists():
+                    print(f"Chunk {chunk['name']} failed, see {queueDir / 'errors'}. Its graphs are left out.")
+                    continue
+                with open(resultPath) as resultFile:
+                    result = json.load(resultFile)
+                graphs = graphsPath.read_bytes()
+                if args.binary:
+                    graphs = [json.loads(line) for line in graphs.decode("utf-8").splitlines()]
+                writeChunk(outFile, sizeIndex, (result["logs"], graphs, result["sizes"]), progress)
+                with open(queueDir / "chunks" / (chunk["name"] + ".json")) as chunkFile:
+                    convertedLogs.extend(json.load(chunkFile))
+            writeEmptyMember(outFile)
+    return convertedLogs
+
+
+# Starts args.workers worker processes on this machine, which convert chunks until the queue is done
+def runQueueWorkers(queueDir):
+    while not (queueDir / "queue.json").exists():
+        print(f"Waiting for a queue in {queueDir}")
+        time.sleep(5)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=initWorker,
+                                                initargs=(args,)) as executor:
+        convertedChunks = sum(executor.map(queueWorker, [queueDir] * args.workers))
+    print(f"The queue is done, {convertedChunks} chunks were converted here.")
+
+
+def queueWorker(queueDir):
+    with open(queueDir / "queue.json") as manifestFile:
+        manifest = json.load(manifestFile)
+    # convert exactly like the coordinator asked for
+    for setting, value in manifest["settings"].items():
+        setattr(args, setting, value)
+    workerId = f"{socket.gethostname()}-{os.getpid()}"
+    leaseTimeout, maxAttempts = manifest["lease_timeout"], manifest["max_attempts"]
+    # the last heartbeat seen on the latest lease of each chunk, and when it was seen on the clock of this worker
+    observedLeases = {}
+    convertedChunks = 0
+    while True:
+        results = set(os.listdir(queueDir / "results"))
+        pending = [chunk["name"] for chunk in manifest["chunks"]
+                   if chunk["name"] + ".json" not in results and chunk["name"] + ".failed" not in results]
+        if len(pending) == 0:
+            return convertedChunks
+        latestAttempts = {}
+        for leaseName in os.listdir(queueDir / "leases"):
+            chunkName, attempt, _ = leaseName.rsplit(".", 2)
+            latestAttempts[chunkName] = max(latestAttempts.get(chunkName, -1), int(attempt))
+        for chunkName in pending:
+            attempt = leaseChunk(queueDir, chunkName, latestAttempts.get(chunkName), leaseTimeout, maxAttempts,
+                                 workerId, observedLeases)
+            if attempt is not None:
+                convertedChunks += convertLeasedChunk(queueDir, chunkName, attempt, leaseTimeout, workerId)
+                break
+        else:
+            # every pending chunk is being converted by another worker, check on them later
+            time.sleep(queuePollInterval(leaseTimeout))
+
+
+# Tries to lease a chunk, returning the attempt number of the lease or None if the chunk cannot be leased (yet). The
+# attempt after an abandoned lease can only be leased by one worker, as creating its lock file fails if it exists.
+# A lease is abandoned once its heartbeat has not changed for leaseTimeout seconds, timed with the clock of this worker
+# only: the clocks of other machines and the mtimes of the shared filesystem are never compared with it.
+def leaseChunk(queueDir, chunkName, latestAttempt, leaseTimeout, maxAttempts, workerId, observedLeases):
+    attempt = 0
+    if latestAttempt is not None:
+        try:
+            heartbeat = (queueDir / "leases" / f"{chunkName}.{latestAttempt}.lock").read_text()
+        except FileNotFoundError:
+            # the chunk was just finished
+            return None
+        now = time.monotonic()
+        observedAttempt, observedHeartbeat, observedAt = observedLeases.get(chunkName, (None, None, None))
+        if (observedAttempt, observedHeartbeat) != (latestAttempt, heartbeat):
+            observedLeases[chunkName] = (latestAttempt, heartbeat, now)
+            observedAt = now
+        # a worker gives up its lease right away when the conversion fails
+        if heartbeat != "abandoned" and now - observedAt < leaseTimeout:
+            return None
+        attempt = latestAttempt + 1
+    if chunkFinished(queueDir, chunkName):
+        return None
+    if attempt >= maxAttempts:
+        print(f"Chunk {chunkName} failed {maxAttempts} times, giving up on it")
+        writeAtomically(queueDir / "results" / (chunkName + ".failed"), workerId.encode("utf-8"))
+        return None
+    leasePath = queueDir / "leases" / f"{chunkName}.{attempt}.lock"
+    try:
+        leaseFile = os.open(leasePath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    os.write(leaseFile, f"{workerId} 0".encode("utf-8"))
+    os.close(leaseFile)
+    # a worker that listed the chunk as pending before it was finished can only get here once its result is written,
+    # as the result is written before the lease is released
+    if chunkFinished(queueDir, chunkName):
+        leasePath.unlink()
+        return None
+    return attempt
+
+
+def chunkFinished(queueDir, chunkName):
+    return ((queueDir / "results" / (chunkName + ".json")).exists()
+            or (queueDir / "results" / (chunkName + ".failed")).exists())
+
+
+# The files of the result of a chunk: the JSON lines of its graphs (gzipped like the outputs), and the JSON with the
+# number of graphs and their sizes, which marks the chunk as converted
+def chunkResultPaths(queueDir, chunkName):
+    graphsName = chunkName + (".jsonl.gz" if args.convert and not args.binary else ".jsonl")
+    return queueDir / "results" / graphsName, queueDir / "results" / (chunkName + ".json")
+
+
+# Converts a leased chunk while keeping its lease alive. Returns 1 if the chunk was converted, 0 if it failed, in which
+# case the lease is abandoned right away so the chunk is retried.
+def convertLeasedChunk(queueDir, chunkName, attempt, leaseTimeout, workerId):
+    leasePath = queueDir / "leases" / f"{chunkName}.{attempt}.lock"
+    stopHeartbeat = threading.Event()
+
+    def heartbeat():
+        beat = 0
+        while not stopHeartbeat.wait(leaseTimeout / 4):
+            beat += 1
+            writeAtomically(leasePath, f"{workerId} {beat}".encode("utf-8"))
+
+    heartbeatThread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeatThread.start()
+    try:
+        with open(queueDir / "chunks" / (chunkName + ".json")) as chunkFile:
+            numLogs, graphs, sizes = convertChunk(json.load(chunkFile))
+        if args.binary:
+            graphs = b"".join((json.dumps(record) + "\n").encode("utf-8") for record in graphs)
+        graphsPath, resultPath = chunkResultPaths(queueDir, chunkName)
+        writeAtomically(graphsPath, graphs)
+        writeAtomically(resultPath, json.dumps({"logs": numLogs, "sizes": sizes}).encode("utf-8"))
+    except Exception:
+        stopHeartbeat.set()
+        heartbeatThread.join()
+        with open(queueDir / "errors" / f"{chunkName}.{attempt}.txt", "w") as errorFile:
+            errorFile.write(traceback.format_exc())
+        writeAtomically(leasePath, b"abandoned")
+        return 0
+    stopHeartbeat.set()
+    heartbeatThread.join()
+    leasePath.unlink()
+    return 1
+
+
+# Writes a file under a temporary name and renames it into place, so readers never see a partial file
+def writeAtomically(location, data):
+    temporaryPath = location.parent / f".{location.name}.{socket.gethostname()}-{os.getpid()}.tmp"
+    with open(temporaryPath, "wb") as temporaryFile:
+        temporaryFile.write(data)
+    os.replace(temporaryPath, location)
+
+
+def queuePollInterval(leaseTimeout):
+    return min(5, leaseTimeout / 4)
 
 
 # part of the better way to handle async
@@ -129,12 +663,6 @@ def convertFromGraphs(log):
     return convertGraph(graphLoc, severity)
 
 
-def zipJSONL(location, targetName):
-    with open(location, 'rb') as f_in:
-        with gzip.open(outputFolder / targetName, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
-
-
 def modifyLogsForSmokeTest(logs):
     logDict = {}
     returnLogs = []
@@ -148,55 +676,85 @@ def modifyLogsForSmokeTest(logs):
     return returnLogs
 
 
+# Splits the logs into the train, validation and test sets. All logs of a source file (or of a project, see
+# --split_by) end up in the same set: the logs are grouped in one pass, the groups are shuffled (seeded with --seed) and
+# whole groups are handed to each set until it reaches its share of the logs. The logs of each set are shuffled too.
+# With --hash_split, the set of a group only depends on the hash of its path instead, so adding logs never moves a group
+# to another set.
 def splitLogs(logs):
+    groups = {}
+    for log in logs:
+        groups.setdefault(splitGroup(log), []).append(log)
+
     if amlCTX is not None:
         def modifyLogs(log):
-            graphLoc, severity, msg = log
-            return [graphLoc.replace("modified_corpus/", args.corpus_location), severity, msg]
-
-        logs = list(map(modifyLogs, logs))
-
-    # Use numpy to split our arrays into the correct percentage
-    logs = np.array(logs, dtype=object)
-    trainData, testData = np.split(logs, [int(args.training_percent * len(logs))])
-    trainData, validationData = np.split(trainData, [int(1.0 - args.validation_percent * len(logs))])
-
-    # The following 2 blocks will automatically ensure that two logs belonging to the same file are not
-    # split across two sets (either train-validate or validate-test
-    trainDataAdjusted = False
-    validationDataAdjusted = False
-    # while we are still adjusting
-    while not trainDataAdjusted:
-        # get the last file name of the train set...
-        lastTrainFileName = re.sub("\d+", "", Path(trainData[-1][0]).name)
-        # ...and the first file name of the validate set
-        firstValidateFileName = re.sub("\d+", "", Path(validationData[0][0]).name)
-        # if the name match (we've removed numbers)
-        if lastTrainFileName in firstValidateFileName:
-            # stack the train data tuple with the first element of the validation data tuple
-            trainData = np.vstack((trainData, validationData[0]))
-            # Remove the first element of hte validation tuple
-            validationData = validationData[1:]
-        # if teh names do not match, we are good to go!
-        else:
-            trainDataAdjusted = True
-    # Same logic as above, only for the validate-test sets
-    while not validationDataAdjusted:
-        lastValidateFileName = re.sub("\d+", "", Path(validationData[-1][0]).name)
-        firstTestFileName = re.sub("\d+", "", Path(testData[0][0]).name)
-        if lastValidateFileName in firstTestFileName:
-            validationData = np.vstack((validationData, testData[0]))
-            testData = testData[1:]
+            return [log[0].replace("modified_corpus/", args.corpus_location)] + log[1:]
+
+        groups = {group: list(map(modifyLogs, groupLogs)) for group, groupLogs in groups.items()}
+
+    rng = np.random.default_rng(args.seed)
+    # the training set is split into the actual training and the validation set
+    trainShare = args.training_percent * (1.0 - args.validation_percent)
+    validationShare = args.training_percent
+    groupList = list(groups.items())
+    trainData, validationData, testData = [], [], []
+    assigned = 0
+    for groupIndex in rng.permutation(len(groupList)):
+        group, groupLogs = groupList[groupIndex]
+        # the share of the logs handed out before this group, or the hash of the group for a stable split
+        position = hashFraction(group) if args.hash_split else assigned / len(logs)
+        if position < trainShare:
+            trainData.extend(groupLogs)
+        elif position < validationShare:
+            validationData.extend(groupLogs)
         else:
-            validationDataAdjusted = True
+            testData.extend(groupLogs)
+        assigned += len(groupLogs)
     # shuffle everything!
-    np.random.shuffle(trainData)
-    np.random.shuffle(validationData)
-    np.random.shuffle(testData)
+    rng.shuffle(trainData)
+    rng.shuffle(validationData)
+    rng.shuffle(testData)
     return trainData, validationData, testData
 
 
+# Stable hash of a group, between 0 and 1
+def hashFraction(group):
+    return int(hashlib.sha1(group.encode("utf-8")).hexdigest()[:15], 16) / 16 ** 15
+
+
+# The group a log is split by: its source file or the project the file belongs to. nodeParsing writes the source file
+# (relative to the corpus) as the last field of each severities.jsonl line. Older corpora do not have it, their source
+# file is guessed from the graph location by dropping the log number nodeParsing added, which merges files whose names
+# only differ in trailing digits (e.g. File1.java and File12.java)
+# nodeParsing names the graphs of a source file <source file><log number>.java.proto
+def graphSourceFile(graphLoc):
+    return re.sub(r"\d+\.java\.[^/\\]*$", ".java", graphLoc)
+
+
+# the source file of a log, derived from its graph path for corpora that predate the source file column
+def logSourceFile(log):
+    if len(log) > 3:
+        return log[3]
+    return graphSourceFile(log[0])
+
+
+def splitGroup(log):
+    sourceFile = logSourceFile(log)
+    if args.split_by == "project":
+        # the project is the first folder of the source file's path within the corpus
+        relativeParts = Path(sourceFile).parts
+        if relativeParts[0] == "modified_corpus":
+            relativeParts = relativeParts[1:]
+        return relativeParts[0]
+    return sourceFile
+
+
 def convertGraph(graphLoc, severity, msgToken):
+    return json.dumps(graphRecord(graphLoc, severity, msgToken))
+
+
+# Converts a graph of the modified corpus into the dict ptgnn expects
+def graphRecord(graphLoc, severity, msgToken):
     # return JSON structure visualized.
     returnJSON = {
         "backbone_sequence": [],
@@ -205,99 +763,245 @@ def convertGraph(graphLoc, severity, msgToken):
         "method_name": [],
         "log_node": -1
     }
-    with open(graphLoc, "rb") as graphFile:
-        g = Graph()
-        g.ParseFromString(graphFile.read())
-        nodes = g.node
-        edges = g.edge
-        # make a map of all the backbone nodes by looping over the edges and getting any node that
-        # has a NEXT_TOKEN pointing to/from it
-        backboneNodes = {}
-        for edge in edges:
-            if edge.type == 2:
-                # overwrite, but thats ok!
-                backboneNodes[edge.destinationId] = True
-                backboneNodes[edge.sourceId] = True
-        # Map of nodeId->Index. Used in step 3
-        IdIndexDict = {}
-        # Used to get the index of our special node to put it to the JSON
-        specialLogNodeIndex = -1
-        for index, node in enumerate(nodes):
-            # got the special node
-            if node.type == 17:
-                specialLogNodeIndex = index
-            # add the node's index to the id map
-            IdIndexDict[node.id] = index
-            # STEP 1) Create backbone_sequence by first checking if the node is a backbone node and then appending its
-            # index to the array
-            if node.id in backboneNodes:
-                returnJSON["backbone_sequence"].append(index)
-
-            # STEP 2) Create node_labels by appending the node contents to the array
-            returnJSON["node_labels"].append(node.contents)
-        # STEP 3) Create edges by parsing the edge data into the correct format
-        returnDict = {}
-        for edge in edges:
-            type = EdgeType(edge.type).name
-            if type not in returnDict:
-                returnDict[type] = []
-            sourceIndex = IdIndexDict[edge.sourceId]
-            destinationIndex = IdIndexDict[edge.destinationId]
-            returnDict[type].append([sourceIndex, destinationIndex])
-        returnJSON["edges"] = returnDict
-        # STEP 4) If we are trying to predict the logging statement, add the tokenized msg to the
-        # prediction variable (method_name). Also put the logging level inside as well.
-        # If we are trying to predict the severity, add the severity to the prediction variable only.
+    nodes, edges = readGraph(graphLoc)
+    # pull the fields we need out of the graph in one go, into flat arrays
+    nodeFields = [(node.id, node.type, node.contents) for node in nodes]
+    nodeIds, nodeTypes, nodeLabels = zip(*nodeFields) if len(nodeFields) > 0 else ((), (), ())
+    nodeIds = np.array(nodeIds, dtype=np.int64)
+    nodeTypes = np.array(nodeTypes, dtype=np.int64)
+    edgeArray = np.array([(edge.sourceId, edge.destinationId, edge.type) for edge in edges], dtype=np.int64)
+    edgeArray = edgeArray.reshape(-1, 3)
+    sourceIds, destinationIds, edgeTypes = edgeArray.T
+    # STEP 1) Create backbone_sequence: the indexes of all nodes that have a NEXT_TOKEN pointing to/from them
+    nextTokenEdges = edgeTypes == 2
+    backboneNodes = np.unique(np.concatenate((sourceIds[nextTokenEdges], destinationIds[nextTokenEdges])))
+    backbone = np.flatnonzero(np.isin(nodeIds, backboneNodes))
+    # STEP 2) Create node_labels from the node contents
+    nodeLabels = list(nodeLabels)
+    # STEP 3) Create edges, turning the node ids into node indexes and grouping the edges by type
+    edgeIndexes = nodeIdsToIndexes(nodeIds, edgeArray[:, :2])
+    # the index of the log node (our special node, the last one if there are several). Multi-log graphs (see
+    # nodeParsing --multi_log) have a list of severities and msgs, one for each of their log nodes.
+    logNodes = np.flatnonzero(nodeTypes == 17)
+    multiLog = isinstance(severity, list)
+    if multiLog and len(logNodes) != len(severity):
+        raise ValueError(f"{graphLoc} has {len(logNodes)} log nodes for {len(severity)} logs")
+    if not multiLog:
+        logNodes = logNodes[-1:]
+    # only keep the neighbourhood of the log nodes if requested, renumbering the nodes that are kept
+    if args.crop_hops is not None and len(logNodes) > 0:
+        keptNodes = cropAroundNodes(len(nodeLabels), edgeIndexes, edgeTypes, backbone, logNodes)
+        newIndexes = np.cumsum(keptNodes) - 1
+        keptEdges = keptNodes[edgeIndexes].all(axis=1)
+        edgeIndexes, edgeTypes = newIndexes[edgeIndexes[keptEdges]], edgeTypes[keptEdges]
+        backbone = newIndexes[backbone[keptNodes[backbone]]]
+        nodeLabels = [label for label, kept in zip(nodeLabels, keptNodes) if kept]
+        logNodes = newIndexes[logNodes]
+    returnJSON["backbone_sequence"] = backbone.tolist()
+    returnJSON["node_labels"] = nodeLabels
+    # the edge types in the order they first appear, each with its edges in their original order
+    presentTypes, firstOccurrences, typeCounts = np.unique(edgeTypes, return_index=True, return_counts=True)
+    edgesByType = np.split(np.argsort(edgeTypes, kind="stable"), np.cumsum(typeCounts)[:-1])
+    returnDict = {}
+    for typeIndex in np.argsort(firstOccurrences):
+        returnDict[EDGE_TYPE_NAMES[presentTypes[typeIndex]]] = edgeIndexes[edgesByType[typeIndex]].tolist()
+    returnJSON["edges"] = returnDict
+    # STEP 4) If we are trying to predict the logging statement, add the tokenized msg to the
+    # prediction variable (method_name). Also put the logging level inside as well (severity), for the models
+    # predicting both. If we are trying to predict the severity, add the severity to the prediction variable only.
+    # Multi-log graphs get the list of the log nodes and the prediction variable of each of them instead.
+    if multiLog:
+        del returnJSON["method_name"], returnJSON["log_node"]
         if args.statement_generation:
-            returnJSON["method_name"] = msgToken
-            # TODO check if severity should be here
-            #returnJSON["severity"] = severity
+            returnJSON["method_names"] = msgToken
+            returnJSON["severities"] = severity
         else:
-            returnJSON["method_name"].append(severity)
-        # STEP 5) Add the index of the log node to the JSON
-        returnJSON["log_node"] = specialLogNodeIndex
-        return json.dumps(returnJSON)
+            returnJSON["method_names"] = [[logSeverity] for logSeverity in severity]
+        returnJSON["log_nodes"] = logNodes.tolist()
+        return returnJSON
+    if args.statement_generation:
+        returnJSON["method_name"] = msgToken
+        returnJSON["severity"] = severity
+    else:
+        returnJSON["method_name"].append(severity)
+    # STEP 5) Add the index of the log node to the JSON
+    returnJSON["log_node"] = int(logNodes[-1]) if len(logNodes) > 0 else -1
+    return returnJSON
+
+
+# The nodes kept when cropping a graph around some nodes: the nodes at most args.crop_hops edges (of
+# args.crop_edge_types, in either direction) away from one of them, and the args.crop_backbone_window backbone nodes
+# before and after each of them. Returns a mask over the node indexes.
+def cropAroundNodes(numNodes, edgeIndexes, edgeTypes, backbone, centerNodes):
+    if args.crop_edge_types is not None:
+        followedTypes = [EdgeType[edgeTypeName].value for edgeTypeName in args.crop_edge_types]
+        edgeIndexes = edgeIndexes[np.isin(edgeTypes, followedTypes)]
+    sources, destinations = edgeIndexes[:, 0], edgeIndexes[:, 1]
+    keptNodes = np.zeros(numNodes, dtype=bool)
+    keptNodes[centerNodes] = True
+    # breadth first search, one hop at a time
+    frontier = keptNodes.copy()
+    for _ in range(args.crop_hops):
+        reached = np.zeros(numNodes, dtype=bool)
+        reached[destinations[frontier[sources]]] = True
+        reached[sources[frontier[destinations]]] = True
+        frontier = reached & ~keptNodes
+        if not frontier.any():
+            break
+        keptNodes |= frontier
+    if args.crop_backbone_window is not None and len(backbone) > 0:
+        # the backbone is sorted, the windows are centered on the nodes or where they would be in the backbone
+        window = args.crop_backbone_window
+        for center in np.minimum(np.searchsorted(backbone, centerNodes), len(backbone) - 1):
+            keptNodes[backbone[max(0, center - window):center + window + 1]] = True
+    return keptNodes
+
+
+# Maps node ids to the index of the node with that id (the last one, if an id is used twice)
+def nodeIdsToIndexes(nodeIds, ids):
+    order = np.argsort(nodeIds, kind="stable")
+    sortedIds = nodeIds[order]
+    positions = np.searchsorted(sortedIds, ids, side="right") - 1
+    found = positions >= 0
+    found[found] = sortedIds[positions[found]] == ids[found]
+    if not np.all(found):
+        raise KeyError(int(ids[~found][0]))
+    return order[positions]
+
+
+# Reads the nodes and edges of a graph of the modified corpus. Graphs of a delta encoded corpus (see nodeParsing --delta)
+# are made up of the base graph of their source file and the patch of the log, which are combined here.
+def readGraph(graphLoc):
+    if not graphLoc.endswith(".patch.json"):
+        with open(graphLoc, "rb") as graphFile:
+            g = Graph()
+            g.ParseFromString(graphFile.read())
+        return g.node, g.edge
+    with open(graphLoc) as patchFile:
+        patch = json.load(patchFile)
+    nodes, edges = readBaseGraph(str(Path(graphLoc).parent / patch["base"]))
+    # replace the log statement nodes by the LOG node
+    baseNodeIndex, lastLogNodeIndex, _, _ = patch["logNode"]
+    logNode = PatchedNode(nodes[baseNodeIndex].id, 17, "")
+    nodes = nodes[:baseNodeIndex] + [logNode] + nodes[lastLogNodeIndex:]
+    # drop the removed edges and point the redirected ones to the LOG node
+    removedEdges = set(patch["removedEdges"])
+    redirectedEdges = {index: (sourceId, destinationId) for index, sourceId, destinationId in patch["redirectedEdges"]}
+    patchedEdges = []
+    for index, edge in enumerate(edges):
+        if index in redirectedEdges:
+            sourceId, destinationId = redirectedEdges[index]
+            patchedEdges.append(PatchedEdge(sourceId, destinationId, edge.type))
+        elif index not in removedEdges:
+            patchedEdges.append(edge)
+    return nodes, patchedEdges
+
+
+# The logs of a source file share its base graph, keep the last few parsed in each process
+@functools.lru_cache(maxsize=32)
+def readBaseGraph(baseLoc):
+    with open(baseLoc, "rb") as baseFile:
+        g = Graph()
+        g.ParseFromString(baseFile.read())
+    return list(g.node), list(g.edge)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Converts the generated modified corpus into the jsonl.gz file accepted by ptgnn.")
     parser.add_argument("--corpus_location", help="Location of the modified corpus folder.",
-                        type=str, required=True)
+                        type=str)
     parser.add_argument("--training_percent", help="The percent of data that will be the training data (ex. 0.8). The "
                                                    "other 20 will be testing data",
-                        type=float, required=True)
+                        type=float)
     parser.add_argument("--validation_percent", help="The percent of the TRAINING data that will be the validation set"
                                                      "(ex. a 0.8 0.2 will take 20%% of the TRAINING set, which is 80%% of "
                                                      "the whole data)",
-                        type=float, required=True)
+                        type=float)
     parser.add_argument("-s", "--statement_generation", help="If set, the output data is the training data for logging"
                                                        "statement prediction, if false then it's for logging severity"
                                                        "prediction", action="store_true")
     parser.add_argument("--debug", help="Generate a single json file from a single proto file, to check the script's "
                                         "functionality. Takes an index location of the JSON file",
                         type=int)
-    parser.add_argument("--output_folder", help="Output folder", type=str, required=True)
+    parser.add_argument("--output_folder", help="Output folder", type=str)
     parser.add_argument("-l", "--limit", help="Limit the number of logs to use from the JSON by x logs. A value of 100"
                                               "will only take the first 100 logs and split them in the train/validation/"
                                               "test sets.", type=int)
     parser.add_argument("-c", "--convert", help="GZip the generated jsonl files to prepare them for Graph2Sequence",
                         action="store_true")
+    parser.add_argument("--compression_level", help="GZip compression level (1-9) used with --convert. Defaults to 9",
+                        type=int, default=9)
     parser.add_argument("--aml", help="Indicate usage of Azure", action="store_true")
     parser.add_argument("--disallow_same_class", help="At the start of execution, filter all logs to only allow one"
                                                       "log per unique graph file (so if two logs both originate from "
                                                       "the same file, only leave one existing. Done to generate a fully"
                                                       "unique corpus, for a 'smoke' test.",
                         action="store_true")
+    parser.add_argument("-f", "--follow", help="Wait for nodeParsing to finish writing severities.jsonl instead of "
+                                               "only using the lines written so far", action="store_true")
+    parser.add_argument("-w", "--workers", help="Number of worker processes converting graphs. Defaults to the number "
+                                                "of CPUs", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--chunk_size", "--chunk-size", help="Number of graphs handed to a worker at a time. Defaults to "
+                                                             "64", type=int, default=64)
+    parser.add_argument("--binary", help="Write each set as a folder of memory-mappable binary shards "
+                                         "(trainLogs.shards etc.) instead of jsonl files. Can be read by ptgnn directly",
+                        action="store_true")
+    parser.add_argument("--shard_size", help="Number of graphs per binary shard. Defaults to 10000", type=int,
+                        default=10000)
+    parser.add_argument("--split_by", help="Keep all logs of the same source file (default) or project in the same "
+                                           "set", choices=["file", "project"], default="file")
+    parser.add_argument("--seed", help="Seed of the random split and shuffling, to make them reproducible", type=int)
+    parser.add_argument("--hash_split", help="Assign each source file (or project) to a set based on a hash of its "
+                                             "path, so it stays in the same set when data is added",
+                        action="store_true")
+    parser.add_argument("--incremental", help="Only convert the graphs of the source files not converted by a previous run "
+                                              "into the same output folder and append them to its outputs. Requires "
+                                              "--hash_split",
+                        action="store_true")
+    parser.add_argument("--crop_hops", help="Only keep the nodes at most this many edges away from the log node, to "
+                                            "make the graphs smaller. By default, the whole graph is kept", type=int)
+    parser.add_argument("--crop_edge_types", help="The edge types followed by --crop_hops. Defaults to all edge types",
+                        nargs="+", choices=[edgeType.name for edgeType in EdgeType])
+    parser.add_argument("--crop_backbone_window", help="With --crop_hops, also keep this many backbone (token) nodes "
+                                                       "before and after the log node", type=int)
+    parser.add_argument("--queue_dir", help="Shared directory of the work queue used by --role coordinator/worker",
+                        type=str)
+    parser.add_argument("--role", help="Convert over a work queue in --queue_dir: the coordinator splits the logs, queues "
+                                       "them in chunks and merges the converted chunks, workers (any number, on any "
+                                       "machine sharing the queue directory) convert the chunks using --workers "
+                                       "processes each", choices=["coordinator", "worker"])
+    parser.add_argument("--lease_timeout", help="Seconds without a heartbeat after which a worker's chunk is given to "
+                                                "another worker. Defaults to 120", type=float, default=120)
+    parser.add_argument("--max_attempts", help="Number of times a chunk is tried before it is left out. Defaults to 3",
+                        type=int, default=3)
     args = parser.parse_args()
-    inputJSON = Path(args.corpus_location) / "severities.json"
-    outputFolder = Path(args.output_folder)
+    if args.role is not None and args.queue_dir is None:
+        parser.error("--role requires --queue_dir")
+    if args.role != "worker":
+        missing = [flag for flag in ("corpus_location", "training_percent", "validation_percent", "output_folder")
+                   if getattr(args, flag) is None]
+        if len(missing) > 0:
+            parser.error("the following arguments are required: " + ", ".join("--" + flag for flag in missing))
+    if args.crop_hops is None and (args.crop_edge_types is not None or args.crop_backbone_window is not None):
+        parser.error("--crop_edge_types and --crop_backbone_window require --crop_hops")
+    if args.incremental and not args.hash_split:
+        parser.error("--incremental requires --hash_split, otherwise the sets of the graphs would change between runs")
+    inputJSON, outputFolder = None, None
+    if args.role != "worker":
+        inputJSON = Path(args.corpus_location) / "severities.jsonl"
+        # corpora generated before severities were streamed
+        if not inputJSON.exists() and (Path(args.corpus_location) / "severities.json").exists():
+            inputJSON = Path(args.corpus_location) / "severities.json"
+        outputFolder = Path(args.output_folder)
     amlCTX = None
     if args.aml:
         from azureml.core.run import Run
 
         amlCTX = Run.get_context()
-    if args.statement_generation:
+    if args.role == "worker":
+        print("Starting a work queue worker.")
+    elif args.statement_generation:
         print("Starting generation of statement ML input set.")
     else:
         print("Starting generation of severity ML input set.")
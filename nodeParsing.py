@@ -1,125 +1,344 @@
 import argparse
+import collections
+import concurrent.futures
+import itertools
 import shutil
+import time
 from graph_pb2 import Graph
-import graph_pb2
 from pathlib import Path
 import json
 from tqdm import tqdm
+import numpy as np
 #import youtokentome as yttm
 import sentencepiece as spm
 
 
+# SentencePiece model used to tokenize the msgs, loaded on first use (see getTokenizer)
+sp = None
+
+
 def main():
-    model_path = "statement_prediction/statementPrediction.model"
-    #bpe = yttm.BPE(model=model_path)
-    sp = spm.SentencePieceProcessor(model_file='statement_prediction/spmModel.model')
-    # open the json
-    with open(jsonPath, "rb") as jsonf:
-        modifiedCorpusPath = Path("modified_corpus", ignore_errors=True, onerror=None)
-        # get the logs, make the file structure
-        logs = json.load(jsonf)
-        # debug execution to generate a single graph
-        if args.debug:
-            # Generate output directory (its ok if it does not exist)
-            modifiedCorpusPath.mkdir(parents=True, exist_ok=True)
-            print("Debug mode active, using log element at index", args.debug)
-            # get the single log to use from the args
-            singleLog = logs[args.debug]
-            rootId = singleLog["rootId"]
-            # form the correct graph location
-            graphLocation = Path(corpusPath + "/" + singleLog["fileLoc"] + ".proto")
-            print("Using graph at:", graphLocation)
-            with open(graphLocation, "rb") as graphFile:
-                # modify the graph
-                modifiedGraph = modifyGraphFile(graphFile, rootId)
-                output = modifiedCorpusPath / graphLocation.name
-                print("Writing new graph at", output)
-                with open(output, "wb") as out:
-                    out.write(modifiedGraph.SerializeToString())
-                print("Done!")
-        # proper corpus generation
-        else:
-            # generate the copy of the relevant corpus file structure
-            generateCorpus(logs, modifiedCorpusPath)
-            print("Starting graph modification")
-            # new dictionary containing our filenames and how many times the file has been opened, used in file naming
-            fileDict = {}
-            # dictionary containing each file with its corresponding correct log level
-            levelArray = []
-            # For each log...
-            for log in tqdm(logs, unit="logs"):
-                # get the graph location, the root ID and the output path
-                rootId = log["rootId"]
-                graphLocation = Path(corpusPath + "/" + log["fileLoc"] + ".proto")
-                outputPathStr = log["fileLoc"].replace(".java", "")
-                if outputPathStr in fileDict:
-                    fileDict[outputPathStr] += 1
+    modifiedCorpusPath = Path("modified_corpus", ignore_errors=True, onerror=None)
+    # stream the logs, one at a time
+    logs = readJSONL(jsonPath, follow=args.follow)
+    # debug execution to generate a single graph
+    if args.debug:
+        # Generate output directory (its ok if it does not exist)
+        modifiedCorpusPath.mkdir(parents=True, exist_ok=True)
+        print("Debug mode active, using log element at index", args.debug)
+        # get the single log to use from the args
+        singleLog = next(itertools.islice(logs, args.debug, None))
+        rootId = singleLog["rootId"]
+        # form the correct graph location
+        graphLocation = Path(corpusPath + "/" + singleLog["fileLoc"] + ".proto")
+        print("Using graph at:", graphLocation)
+        with open(graphLocation, "rb") as graphFile:
+            # modify the graph
+            modifiedGraph = modifyGraphFile(graphFile, rootId)
+            output = modifiedCorpusPath / graphLocation.name
+            print("Writing new graph at", output)
+            with open(output, "wb") as out:
+                out.write(modifiedGraph.SerializeToString())
+            print("Done!")
+    # proper corpus generation
+    else:
+        # generate the root of the modified corpus, the folders of each file get created as the logs come in
+        generateCorpus(modifiedCorpusPath)
+        print("Starting graph modification")
+        # new dictionary containing our filenames and how many times the file has been opened, used in file naming
+        fileDict = {}
+        # JSON lines file containing each graph with its corresponding correct log level and msg, one line per graph
+        severitiesPath = modifiedCorpusPath / "severities.jsonl"
+        # Whole source files are handed to the workers. At most a few files per worker are in flight at a time, and
+        # their results are written in the order the files were handed out, so severities.jsonl is the same no matter
+        # how many workers are used.
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+        inFlight = collections.deque()
+        # The msgs are tokenized in batches by a separate stage, running alongside the graph modification. Finished
+        # files wait in toWrite until the batch holding their msgs is handed to the tokenizer.
+        tokenizer = MessageTokenizer(args.token_batch_size, args.token_threads)
+        toWrite = collections.deque()
+        with open(severitiesPath, "w") as outJSONL, tqdm(unit="logs") as progress:
+            # retrieveLogs writes all the logs of a file one after the other, so grouping consecutive logs by file
+            # means each source graph is parsed once, no matter how many logs it contains. The order of the logs (and
+            # therefore severities.jsonl) stays the same.
+            for fileLoc, fileLogs in itertools.groupby(logs, key=lambda log: log["fileLoc"]):
+                graphLocation = Path(corpusPath + "/" + fileLoc + ".proto")
+                outputPathStr = fileLoc.replace(".java", "")
+                # work out the output path of every log of the file up front, the file naming depends on the order
+                # (with --multi_log, all logs of the file share the output path of their single graph)
+                logsWithOutput = []
+                for log in fileLogs:
+                    if len(logsWithOutput) == 0 or not args.multi_log:
+                        if outputPathStr in fileDict:
+                            fileDict[outputPathStr] += 1
+                        else:
+                            fileDict[outputPathStr] = 1
+                        outputSuffix = ".patch.json" if args.delta else ".logs.proto" if args.multi_log else ".proto"
+                        outputPath = modifiedCorpusPath / Path(outputPathStr + f"{str(fileDict[outputPathStr])}.java" +
+                                                               outputSuffix)
+                    logsWithOutput.append((log, outputPath))
+                    tokenizer.add(log["msg"])
+                # form the output folder structure, its ok if it exists (as we can have multiple logs per file)
+                logsWithOutput[0][1].parent.mkdir(parents=True, exist_ok=True)
+                # the graph all the patches of the file apply to
+                basePath = modifiedCorpusPath / Path(outputPathStr + ".java.base.proto") if args.delta else None
+
+                modifyFile = modifySourceFileMultiLog if args.multi_log else modifySourceFile
+                if executor is None:
+                    toWrite.append(modifyFile(graphLocation, logsWithOutput, basePath))
                 else:
-                    fileDict[outputPathStr] = 1
-
-                outputPath = modifiedCorpusPath / Path(outputPathStr + f"{str(fileDict[outputPathStr])}.java.proto")
-                # tokenize the msg
-                #tokenizedMsg = bpe.encode([log["msg"]], output_type=yttm.OutputType.SUBWORD)[0]
-                tokenizedMsg = sp.encode([log["msg"]], out_type=str)[0]
-                levelArray.append([str(outputPath), log["severity"],tokenizedMsg])
-                #levelDict[str(outputPath)] = log["severity"]
-                # open the input graph
-                with open(graphLocation, "rb") as graphFile:
-                    # Do the hard work modifying it
-                    modifiedGraph = modifyGraphFile(graphFile, rootId)
-                    # write it back out, overwriting the old file
-                    with open(outputPath, "wb") as out:
-                        out.write(modifiedGraph.SerializeToString())
-
-            print("Finished writing graph files")
-            with open(modifiedCorpusPath / "severities.json", "w") as outJSON:
-                json.dump(levelArray, outJSON)
-                print("Wrote severities.json. Contains each graph location, it's corresponding log level and msg.")
+                    inFlight.append(executor.submit(modifyFile, graphLocation, logsWithOutput, basePath))
+                    while len(inFlight) >= 4 * args.workers:
+                        toWrite.append(inFlight.popleft().result())
+                while len(toWrite) > 0 and tokenizer.submitted(toWrite[0]):
+                    writeSeverities(outJSONL, toWrite.popleft(), tokenizer, progress)
+            while len(inFlight) > 0:
+                toWrite.append(inFlight.popleft().result())
+            while len(toWrite) > 0:
+                writeSeverities(outJSONL, toWrite.popleft(), tokenizer, progress)
+        if executor is not None:
+            executor.shutdown()
+        tokenizer.shutdown()
+
+        Path(str(severitiesPath) + ".done").touch()
+        print("Finished writing graph files")
+        print("Wrote severities.jsonl. Contains each graph location, it's corresponding log level, msg and source "
+              "file.")
+
+
+# Generates the modified graphs of all the logs of one source file, parsing the source graph only once. Takes the logs
+# of the file along with their output paths and returns the output path, severity, msg and source file of each of them
+# (the msg is tokenized by the MessageTokenizer, the source file lets convertCorpusForML keep the graphs of a file
+# together). Runs inside the worker processes when using more than one worker. With a basePath, writes the graph once to
+# the basePath and a patch per log instead (see writeGraphPatches).
+def modifySourceFile(graphLocation, logsWithOutput, basePath=None):
+    # open and parse the input graph
+    sourceGraph = Graph()
+    with open(graphLocation, "rb") as graphFile:
+        sourceGraph.ParseFromString(graphFile.read())
+    if basePath is not None:
+        return writeGraphPatches(sourceGraph, logsWithOutput, basePath)
+    severities = []
+    for log, outputPath in logsWithOutput:
+        # Do the hard work modifying a copy of the graph, the parsed graph is reused for the next log
+        graph = Graph()
+        graph.CopyFrom(sourceGraph)
+        modifiedGraph = modifyGraph(graph, log["rootId"])
+        # write it back out, overwriting the old file
+        with open(outputPath, "wb") as out:
+            out.write(modifiedGraph.SerializeToString())
+        severities.append([str(outputPath), log["severity"], log["msg"], log["fileLoc"]])
+    return severities
+
+
+# Multi-log version of modifySourceFile: all logs of the file are replaced by LOG nodes in a single graph, written to the
+# (shared) output path of the logs. Returns a single entry with the severities and msgs of the logs, in the order of
+# their LOG nodes in the graph. Logs whose statement was removed along with an earlier log (e.g. a log call inside the
+# arguments of another one) are left out.
+def modifySourceFileMultiLog(graphLocation, logsWithOutput, basePath=None):
+    graph = Graph()
+    with open(graphLocation, "rb") as graphFile:
+        graph.ParseFromString(graphFile.read())
+    outputPath = logsWithOutput[0][1]
+    modifiedLogs = []
+    for log, _ in logsWithOutput:
+        if not any(node.id == log["rootId"] for node in graph.node):
+            continue
+        modifyGraph(graph, log["rootId"])
+        modifiedLogs.append(log)
+    with open(outputPath, "wb") as out:
+        out.write(graph.SerializeToString())
+    # the LOG nodes keep the id of the root of their log
+    logNodePositions = {node.id: index for index, node in enumerate(graph.node) if node.type == 17}
+    modifiedLogs.sort(key=lambda log: logNodePositions[log["rootId"]])
+    return [[str(outputPath), [log["severity"] for log in modifiedLogs], [log["msg"] for log in modifiedLogs],
+             logsWithOutput[0][0]["fileLoc"]]]
+
+
+# Delta encoded version of the modified corpus. The source graph is written once, as the base graph of the file, and
+# each log only gets a small JSON patch describing how its modified graph differs from the base (see graphPatch).
+# convertCorpusForML applies the patches when reading.
+def writeGraphPatches(sourceGraph, logsWithOutput, basePath):
+    patches = [graphPatch(sourceGraph, log["rootId"], basePath.name) for log, _ in logsWithOutput]
+    # the base graph holds the changes that do not depend on the log. It is written before the patches, so a patch never
+    # points to a missing base
+    removeGraphLeaks(sourceGraph)
+    with open(basePath, "wb") as out:
+        out.write(sourceGraph.SerializeToString())
+    severities = []
+    for (log, outputPath), patch in zip(logsWithOutput, patches):
+        with open(outputPath, "w") as out:
+            json.dump(patch, out)
+        severities.append([str(outputPath), log["severity"], log["msg"], log["fileLoc"]])
+    return severities
+
+
+# Appends the entries of one source file to severities.jsonl, replacing each msg by its tokens. Only called once the
+# graphs are written, so a reader never sees a graph that does not exist. Entries of multi-log graphs hold a list of
+# severities and a list of msgs.
+def writeSeverities(outJSONL, severities, tokenizer, progress):
+    for outputPath, severity, msg, sourceFile in severities:
+        tokens = [tokenizer.get(m) for m in msg] if isinstance(msg, list) else tokenizer.get(msg)
+        outJSONL.write(json.dumps([outputPath, severity, tokens, sourceFile]) + "\n")
+    outJSONL.flush()
+    progress.update(len(severities))
+
+
+# Tokenizes the msgs in batches using SentencePiece's batch encoding, on a thread of its own so it runs while the
+# graphs are modified. Every distinct msg is only tokenized once, boilerplate msgs are common.
+class MessageTokenizer:
+    def __init__(self, batchSize, numThreads):
+        self.batchSize = batchSize
+        self.numThreads = numThreads
+        # msg -> the future of the batch tokenizing it (None while it waits in the pending batch)
+        self.batches = {}
+        self.pending = []
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    # Queues a msg for tokenization, a full batch is handed to the tokenizer thread straight away
+    def add(self, msg):
+        if msg in self.batches:
+            return
+        self.batches[msg] = None
+        self.pending.append(msg)
+        if len(self.pending) >= self.batchSize:
+            self.submitPending()
+
+    def submitPending(self):
+        future = self.executor.submit(tokenizeBatch, self.pending, self.numThreads)
+        for msg in self.pending:
+            self.batches[msg] = future
+        self.pending = []
+
+    # Whether all msgs of the given severities are tokenized or being tokenized
+    def submitted(self, severities):
+        return all(self.batches[m] is not None for _, _, msg, _ in severities
+                   for m in (msg if isinstance(msg, list) else [msg]))
+
+    # Returns the tokens of a msg added before, waiting for its batch if needed
+    def get(self, msg):
+        if self.batches[msg] is None:
+            self.submitPending()
+        return self.batches[msg].result()[msg]
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def tokenizeBatch(msgs, numThreads):
+    #tokenizedMsgs = bpe.encode(msgs, output_type=yttm.OutputType.SUBWORD)
+    tokenizedMsgs = getTokenizer().encode(msgs, out_type=str, num_threads=numThreads)
+    return dict(zip(msgs, tokenizedMsgs))
+
+
+def getTokenizer():
+    global sp
+    if sp is None:
+        #model_path = "statement_prediction/statementPrediction.model"
+        #bpe = yttm.BPE(model=model_path)
+        sp = spm.SentencePieceProcessor(model_file='statement_prediction/spmModel.model')
+    return sp
+
+
+# Reads the logs written by retrieveLogs one at a time. A partially written last line (crashed or still running
+# writer) is never returned. With follow set, waits for more lines until the writer creates <file>.done, so the
+# modification can start while retrieveLogs is still running. Legacy .json arrays are read in one go.
+def readJSONL(location, follow=False):
+    if location.suffix == ".json":
+        with open(location) as jsonf:
+            yield from json.load(jsonf)
+        return
+    donePath = Path(str(location) + ".done")
+    while follow and not location.exists():
+        time.sleep(1)
+    with open(location) as jsonlFile:
+        partialLine = ""
+        writerDone = False
+        while True:
+            line = jsonlFile.readline()
+            if line.endswith("\n"):
+                yield json.loads(partialLine + line)
+                partialLine = ""
+                continue
+            # end of the file for now, keep what we have of the line
+            partialLine += line
+            if not follow or writerDone:
+                break
+            # once the writer is done, read one more time to pick up anything written right before it finished
+            writerDone = donePath.exists()
+            if not writerDone:
+                time.sleep(1)
 
 
 def modifyGraphFile(graphFile, rootId):
     g = Graph()
     g.ParseFromString(graphFile.read())
-    nodes = g.node
-    edges = g.edge
+    graphFile.close()
+    return modifyGraph(g, rootId)
+
 
+# Removes the log statement starting at rootId from the parsed graph, returning the modified graph. The graph is
+# modified in place: the log span is deleted, the root node patched and only the edges around the log changed, instead
+# of copying every node and edge over to a new graph.
+def modifyGraph(g, rootId):
+    applyGraphPatch(g, graphPatch(g, rootId))
+    return g
+
+
+# Works out how the graph changes when removing the log statement starting at rootId, without modifying the graph:
+#   - logNode: the index span [start, end) of the log statement nodes, the node at start becomes the LOG node and gets
+#     the given end line number and end position
+#   - removedEdges: the indexes of the edges to remove
+#   - redirectedEdges: [index, new source id, new destination id] of the edges now pointing to/from the LOG node
+# base is the name of the graph the patch applies to, if it is stored separately.
+def graphPatch(g, rootId, base=None):
     # get all the relevant log nodes
     allLogNodes, baseNodeIndex, \
-    lastLogNodeIndex, lastNodeEndLineNumber, lastNodeEndPosition = retrieveAllLogsNodes(nodes, rootId)
+    lastLogNodeIndex, lastNodeEndLineNumber, lastNodeEndPosition = retrieveAllLogsNodes(g.node, rootId)
     # get the releant node ids
     allLogNodesIds = list(map(lambda node: node.id, allLogNodes))
+    # Remove any edge within our log statement and make the edges linking to it point to the root LOG node
+    keptEdges, sources, destinations, redirected = rewriteEdges(g.edge, allLogNodesIds)
+    removedEdges = np.setdiff1d(np.arange(len(g.edge)), keptEdges, assume_unique=True)
+    redirectedEdges = np.intersect1d(np.flatnonzero(redirected), keptEdges, assume_unique=True)
+    lastLogNodeIndex = max(lastLogNodeIndex, baseNodeIndex + 1)
+    return {
+        "base": base,
+        "logNode": [baseNodeIndex, lastLogNodeIndex, lastNodeEndLineNumber, lastNodeEndPosition],
+        "removedEdges": removedEdges.tolist(),
+        "redirectedEdges": [[int(index), int(sources[index]), int(destinations[index])] for index in redirectedEdges]
+    }
 
-    # STEP 1) Remove any edge that both originates and targets nodes within our log statment
-    edges = removeLogEdges(edges, allLogNodesIds)
-    # STEP 2) Modify any edge that links to one of our log nodes within the statement. These edges will now point to the
-    # root LOG node.
-    edges = adjustOutsideEdges(edges, allLogNodesIds)
-    # STEP 3) Modify all the log nodes. Modify root node to be special LOG node, delete rest.
-    nodes = modifyNodes(nodes, baseNodeIndex, lastLogNodeIndex, lastNodeEndLineNumber, lastNodeEndPosition)
-
-    # create a new Graph file to return for writing, using all the modified nodes and edges
-    returnGraph = Graph()
-    for node in nodes:
-        graphNode = graph_pb2.FeatureNode()
-        graphNode.id = node.id
-        graphNode.type = node.type
-        graphNode.contents = removeImportLeaks(node.contents)
-        graphNode.startPosition = node.startPosition
-        graphNode.endPosition = node.endPosition
-        graphNode.startLineNumber = node.startLineNumber
-        graphNode.endLineNumber = node.endLineNumber
-        # append our node to the new graph file
-        returnGraph.node.append(graphNode)
-    for edge in edges:
-        graphEdge = graph_pb2.FeatureEdge()
-        graphEdge.sourceId = edge.sourceId
-        graphEdge.destinationId = edge.destinationId
-        graphEdge.type = edge.type
-        # append our edge to the graph file
-        returnGraph.edge.append(graphEdge)
 
-    graphFile.close()
-    return returnGraph
+# Applies a patch created by graphPatch to the graph it was created for, in place
+def applyGraphPatch(g, patch):
+    nodes = g.node
+    edges = g.edge
+    # Point the redirected edges to the LOG node, then delete the removed edges (back to front, so the indexes stay
+    # valid). Only the few edges around the log statement are touched, the rest stays as parsed.
+    for index, sourceId, destinationId in patch["redirectedEdges"]:
+        edges[index].sourceId = sourceId
+        edges[index].destinationId = destinationId
+    for index in reversed(patch["removedEdges"]):
+        del edges[index]
+    # Modify all the log nodes. Modify root node to be special LOG node, delete rest.
+    baseNodeIndex, lastLogNodeIndex, lastNodeEndLineNumber, lastNodeEndPosition = patch["logNode"]
+    modifyNodes(nodes, baseNodeIndex, lastLogNodeIndex, lastNodeEndLineNumber, lastNodeEndPosition)
+    removeGraphLeaks(g)
+
+
+# Removes the import leaks from all nodes of the graph and the fields the modified graphs do not contain
+def removeGraphLeaks(g):
+    for node in g.node:
+        contents = node.contents
+        cleanedContents = removeImportLeaks(contents)
+        if cleanedContents != contents:
+            node.contents = cleanedContents
+    # the modified graph only ever contained the nodes and edges
+    g.ClearField("sourceFile")
+    g.ClearField("first_token")
+    g.ClearField("ast_root")
 
 
 # Removes any potential leaks of log levels at import statements.
@@ -142,32 +361,40 @@ def modifyNodes(nodes, baseNodeIndex, lastLogNodeIndex, lastNodeEndLineNumber, l
     return nodes
 
 
-# Adjusts any edges that point to a node outside our log nodes (either as source or destination)
-def adjustOutsideEdges(edges, allLogIds):
-    def mapEdges(edge):
-        # if the edge originates from one of our nodes
-        if edge.sourceId in allLogIds:
-            # change the sourceId to point to the root node (future LOG)
-            edge.sourceId = allLogIds[0]
-        # if the edge points to one of our log nodes
-        elif edge.destinationId in allLogIds:
-            # make it point to the root node (future LOG node)
-            edge.destinationId = allLogIds[0]
-        return edge
-
-    return list(map(mapEdges, edges))
-
+# Handles the edges of the graph on flat arrays of their source ids, destination ids and types instead of edge by edge:
+#   - any edge that both originates and targets nodes within our log statement is removed
+#   - any other edge starting or ending within the log statement is redirected to the root node (future LOG node)
+#   - redirecting turns edges such as a->x and b->x (a and b both in the statement) into identical root->x edges, only
+#     the first of those is kept
+# Returns the indexes of the edges to keep (in their original order), the new source and destination id of every edge
+# and a mask of the edges that were redirected.
+def rewriteEdges(edges, allLogIds):
+    numEdges = len(edges)
+    sources = np.fromiter((edge.sourceId for edge in edges), dtype=np.int64, count=numEdges)
+    destinations = np.fromiter((edge.destinationId for edge in edges), dtype=np.int64, count=numEdges)
+    types = np.fromiter((edge.type for edge in edges), dtype=np.int64, count=numEdges)
+    # no log statement found, nothing to do
+    if len(allLogIds) == 0:
+        return np.arange(numEdges), sources, destinations, np.zeros(numEdges, dtype=bool)
 
-# Removes all logs that have edges starting AND pointing to nodes within our log statement
-def removeLogEdges(edges, nodeIds):
-    def filterEdges(edge):
-        if edge.sourceId in nodeIds:
-            if edge.destinationId in nodeIds:
-                return False
-        return True
+    logIds = np.array(allLogIds, dtype=np.int64)
+    fromLog = np.isin(sources, logIds)
+    toLog = np.isin(destinations, logIds)
+    keep = ~(fromLog & toLog)
+    redirected = keep & (fromLog | toLog)
+    sources[fromLog] = logIds[0]
+    destinations[toLog] = logIds[0]
 
-    edges = list(filter(filterEdges, edges))
-    return edges
+    # find the duplicates among the redirected edges
+    redirectedIndexes = np.flatnonzero(redirected)
+    if len(redirectedIndexes) > 0:
+        redirectedEdges = np.stack(
+            (sources[redirectedIndexes], destinations[redirectedIndexes], types[redirectedIndexes]), axis=1)
+        _, firstOccurrences = np.unique(redirectedEdges, axis=0, return_index=True)
+        duplicates = np.ones(len(redirectedIndexes), dtype=bool)
+        duplicates[firstOccurrences] = False
+        keep[redirectedIndexes[duplicates]] = False
+    return np.flatnonzero(keep), sources, destinations, redirected
 
 
 # analyzes all nodes of a graph, returning the nodes that contain the logging statement
@@ -200,8 +427,8 @@ def retrieveAllLogsNodes(nodes, rootId):
     return allLogNodes, baseNodeIndex, lastNodeIndex, lastNodeEndLineNumber, lastNodeEndPosition
 
 
-# Generate the entire new corpus file structure. Currently unused
-def generateCorpus(logs, modifiedCorpusPath):
+# Generate the root folder of the new corpus. The folders of each file are created while writing the graphs
+def generateCorpus(modifiedCorpusPath):
     if args.delete:
         try:
             print("Deleting old modified corpus")
@@ -215,14 +442,6 @@ def generateCorpus(logs, modifiedCorpusPath):
     except FileExistsError:
         print("\nModified corpus already exists, please delete before executing")
         exit(1)
-    # For every log...
-    for log in logs:
-        # get the path
-        logPath = Path(log["fileLoc"])
-        # form the new output folder structure
-        corpusPath = modifiedCorpusPath / logPath.parents[0]
-        # write it, its ok if it exists (as we can have multiple logs per file)
-        corpusPath.mkdir(parents=True, exist_ok=True)
     print(" Done!")
 
 
@@ -232,13 +451,33 @@ if __name__ == "__main__":
         description="Generates a new corpus of protobuff files containing modified graph structures. Does so by "
                     "removing all log instances and re-creating the graph structure to leave no trace of a log's "
                     "existence, except a unique LOG node.")
-    parser.add_argument("input_json", help="Location of json file.",
+    parser.add_argument("input_json", help="Location of the JSON lines file generated by retrieveLogs (a .json array "
+                                           "also works).",
                         type=str)
     parser.add_argument("corpus_location", help="Root folder location of the corpus used to generate the JSON")
     parser.add_argument("-d", "--delete", help="If a modified corpus exists, delete it", action="store_true")
     parser.add_argument("--debug", help=" Generate a single graph file, to check the graph output. Takes an integer,"
                                         "pointing to an element of the input json array.", type=int)
+    parser.add_argument("-w", "--workers", help="Number of worker processes modifying graphs. Each worker handles whole "
+                                                "source files. Defaults to 1 (no worker processes)", type=int,
+                        default=1)
+    parser.add_argument("-f", "--follow", help="Keep reading the input file as retrieveLogs writes it, until it is "
+                                               "marked as done. Lets both scripts run at the same time",
+                        action="store_true")
+    parser.add_argument("--token_batch_size", help="Number of distinct msgs tokenized together. Defaults to 1000",
+                        type=int, default=1000)
+    parser.add_argument("--token_threads", help="Number of threads SentencePiece uses to tokenize a batch. Defaults to "
+                                                "-1 (all cores)", type=int, default=-1)
+    parser.add_argument("--delta", help="Write a delta encoded corpus: each source graph is stored once and each log "
+                                        "as a small patch on top of it, which convertCorpusForML applies when reading",
+                        action="store_true")
+    parser.add_argument("--multi_log", help="Write one graph per source file with all its logs replaced by LOG nodes, "
+                                            "instead of one graph per log. Its severities.jsonl entry lists the "
+                                            "severities and msgs of the LOG nodes in graph order",
+                        action="store_true")
     args = parser.parse_args()
+    if args.multi_log and args.delta:
+        parser.error("--multi_log graphs are written whole, they cannot be combined with --delta")
     jsonPath = Path(args.input_json)
     corpusPath = str(Path(args.corpus_location))
     main()
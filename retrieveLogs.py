@@ -1,5 +1,10 @@
 import glob
+import hashlib
 import json
+import mmap
+import os
+import time
+import concurrent.futures
 from tqdm import tqdm
 from pathlib import Path
 import argparse
@@ -21,6 +26,11 @@ class Log:
         return str(self.__dict__)
 
 
+# Rebuilds a Log from its JSON representation (the __dict__ written to the output and the manifest)
+def logFromDict(log):
+    return Log(log["severity"], log["msg"], log["lineLoc"], log["fileLoc"], log["rootId"])
+
+
 logLevels = [
     "trace",
     "debug",
@@ -31,38 +41,59 @@ logLevels = [
 ]
 
 
+# Node contents that mark the start of a logging statement
+loggerNames = {"logger", "log", "LOG"}
+
+
 # Detects Log4j, LogBack,slf4j, Juli (Tomcat's custom implementation of java.util.logging) and Jboss (Hibernate)
+# Runs in linear time: one forward pass over the nodes collects their contents, the positions of every SEMI and every
+# node that could start a logging statement. The candidates are then checked in order, with a pointer into the SEMI
+# positions that only ever moves forward, so no candidate has to search (or copy) the rest of the nodes.
 def detectLogs(graph):
     # get all the nodes of the graph
     nodes = graph.node
-    results = []
-    length = len(nodes)
-    # uses i beacause we need the element location as well as the element. Could have used enumerate but I didn't for
-    # some reason
-    for i in range(length):
-        node = nodes[i]
+    contents = []
+    semiPositions = []
+    candidates = []
+    for i, node in enumerate(nodes):
+        content = node.contents
+        contents.append(content)
+        if content == "SEMI":
+            semiPositions.append(i)
         # our node has some mention of a log
-        if node.contents == "logger" or node.contents == "log" or node.contents == "LOG":
-            # get the log level by moving down two elements in the array (DOT followed by the level)
-            severity = nodes[i + 2].contents
-            # make it lower
-            severity = severity.lower()
-            # address jboss on this level instead of further down (makes life easier)
-            severity = addressjBoss(severity)
-            # verify the log level
-            if verifyLogLevel(severity):
-                # isolate the message
-                msg = isolateMsg(nodes, i + 4)
-                # Avoid false positives. If they occur, then the ENTIRE file (10k+ nodes) gets written.
-                if len(msg) <= 1500:
-                    fileLoc = graph.sourceFile
-                    # remove false location data (and make it relative to the corpus)
-                    fileLoc = fileLoc.replace('/local/data/Desktop/java-corpus-utils/java_projects-waiting/', '')
-                    fileLoc = fileLoc.replace('/local/data/Desktop/java-corpus-utils/java_projects/', '')
-                    lineLoc = node.startLineNumber
-                    rootID = node.id
-                    log = Log(severity, msg, lineLoc, fileLoc, rootID)
-                    results.append(log)
+        elif content in loggerNames:
+            candidates.append(i)
+    length = len(contents)
+    results = []
+    semiIndex = 0
+    for i in candidates:
+        # a logger at the very end of the file can't be followed by a log level (and neither can any later one)
+        if i + 2 >= length:
+            break
+        # get the log level by moving down two elements in the array (DOT followed by the level), make it lower and
+        # address jboss on this level instead of further down (makes life easier)
+        severity = addressjBoss(contents[i + 2].lower())
+        # verify the log level
+        if not verifyLogLevel(severity):
+            continue
+        # the msg starts after the LPAREN, find the first semicolon at or after it
+        startOfStatement = i + 4
+        while semiIndex < len(semiPositions) and semiPositions[semiIndex] < startOfStatement:
+            semiIndex += 1
+        endOfStatement = semiPositions[semiIndex] if semiIndex < len(semiPositions) else None
+        # isolate the message
+        msg = isolateMsg(contents, startOfStatement, endOfStatement)
+        # Avoid false positives. If they occur, then the ENTIRE file (10k+ nodes) gets written.
+        if len(msg) <= 1500:
+            node = nodes[i]
+            fileLoc = graph.sourceFile
+            # remove false location data (and make it relative to the corpus)
+            fileLoc = fileLoc.replace('/local/data/Desktop/java-corpus-utils/java_projects-waiting/', '')
+            fileLoc = fileLoc.replace('/local/data/Desktop/java-corpus-utils/java_projects/', '')
+            lineLoc = node.startLineNumber
+            rootID = node.id
+            log = Log(severity, msg, lineLoc, fileLoc, rootID)
+            results.append(log)
     return results
 
 
@@ -84,26 +115,20 @@ def convertContentToString(content):
         return content
 
 
-# Isolate the msg from the nodes provided (start of logging statement to semicolon)
-def isolateMsg(nodes, startOfStatement):
-    # get the nodes STARTING at the msg
-    startNodes = nodes[startOfStatement:]
-    length = len(startNodes)
-    endLocation = 0
-    for i in range(length):
-        node = startNodes[i]
-        # found a semicolon, statement is over
-        if node.contents == "SEMI":
-            # go back an element from the semicolon
-            endLocation = i - 1
-            break
-    # grab the nodes that contain the statement
-    statementNodes = startNodes[0: endLocation]
-    msg = ""
+# Isolate the msg from the node contents provided (start of logging statement to the semicolon at endOfStatement, None
+# if there is no semicolon)
+def isolateMsg(contents, startOfStatement, endOfStatement):
+    # no semicolon, no msg
+    if endOfStatement is None:
+        return ""
+    # go back an element from the semicolon
+    endLocation = endOfStatement - 1
+    # A semicolon straight at the start of the msg used to produce a slice ending at -1 (everything but the last node).
+    # Kept so the output does not change.
+    if endLocation < startOfStatement:
+        endLocation = len(contents) - 1
     # Extract the msg and return it
-    for node in statementNodes:
-        msg = msg + convertContentToString(node.contents)
-    return msg
+    return "".join([convertContentToString(content) for content in contents[startOfStatement:endLocation]])
 
 
 # Hibernate decided to have custom log functions. This parses them into standard log levels
@@ -134,6 +159,31 @@ def verifyLogLevel(logLevel):
         return False
 
 
+# Writes the logs of each file to the output JSON lines file as soon as every file before it is done, so the output
+# keeps the original file order and downstream stages can start reading it straight away. Results that arrive out of
+# order (parallel scan) are held until then.
+class OrderedLogWriter:
+    def __init__(self, outputFile, numFiles):
+        self.outputFile = outputFile
+        self.resultsPerFile = [None] * numFiles
+        self.nextToWrite = 0
+        self.numLogs = 0
+
+    def add(self, index, logs):
+        self.resultsPerFile[index] = logs
+        while self.nextToWrite < len(self.resultsPerFile) and self.resultsPerFile[self.nextToWrite] is not None:
+            for log in self.resultsPerFile[self.nextToWrite]:
+                if verbose:
+                    print(log)
+                self.outputFile.write(json.dumps(log.__dict__) + "\n")
+                self.numLogs += 1
+            # written, no need to hold on to it
+            self.resultsPerFile[self.nextToWrite] = None
+            self.nextToWrite += 1
+        # flush so anyone following the file sees complete lines
+        self.outputFile.flush()
+
+
 def main():
     # https://mkyong.com/python/python-how-to-list-all-files-in-a-directory/
     # Get all files within the directory of the path
@@ -142,22 +192,8 @@ def main():
         print("No java.proto files found, are you imputing a correct folder?")
         exit(0)
     print("Found " + str(len(files)) + " proto files, starting analysis...")
-    results = []
 
-    # if we are using verbose, don't display the bar (everything will print)
-    if verbose:
-        for f in files:
-            results = results + runAnalysis(f)
-    else:
-        # Use tqdm to display a nice progress bar, requires manual for loop instead of for f in files
-        for file in tqdm(files, unit="files"):
-            results = results + runAnalysis(file)
-    if verbose:
-        for result in results:
-            print(result)
-    print("Execution finished, number of logs found: " + str(len(results)))
-
-    # Write to JSON
+    # Write to JSON lines
     if args.name is None:
         outputName = "result"
     else:
@@ -165,13 +201,239 @@ def main():
 
     if args.output is None:
         print("No output location specified, writing to script location")
-        output = outputName + ".json"
+        output = Path(outputName + ".jsonl")
+    else:
+        output = Path(args.output) / (outputName + ".jsonl")
+    # the .done marker tells the stages following this file that it is complete, remove the one of a previous run
+    donePath = Path(str(output) + ".done")
+    if donePath.exists():
+        donePath.unlink()
+    outfile = open(output, "w")
+    writer = OrderedLogWriter(outfile, len(files))
+
+    pending = list(range(len(files)))
+    manifestFile = None
+    if args.manifest is not None:
+        manifestPath = Path(args.manifest)
+        manifest = loadManifest(manifestPath)
+        fileStats = [statFile(f) for f in files]
+        cachedLogs = reuseManifest(files, fileStats, manifest)
+        pending = [index for index in range(len(files)) if index not in cachedLogs]
+        print(f"Manifest: reusing {len(cachedLogs)} files, analyzing {len(pending)} new or changed files")
+        for index, logs in cachedLogs.items():
+            writer.add(index, logs)
+        manifestFile = openManifest(manifestPath)
+
+    # skipped files/bytes and parsed files/bytes/seconds, used to report what the prefilter saved
+    prefilterStats = {"skippedFiles": 0, "skippedBytes": 0, "parsedFiles": 0, "parsedBytes": 0, "parseTime": 0.0}
+
+    # Stores the logs of an analyzed file, appending it to the manifest straight away so a killed run can resume
+    def storeResult(index, logs, digest, scanStats):
+        writer.add(index, logs)
+        if manifestFile is not None:
+            writeManifestEntry(manifestFile, files[index], fileStats[index], digest, logs)
+        skipped, numBytes, parseTime = scanStats
+        if skipped:
+            prefilterStats["skippedFiles"] += 1
+            prefilterStats["skippedBytes"] += numBytes
+        else:
+            prefilterStats["parsedFiles"] += 1
+            prefilterStats["parsedBytes"] += numBytes
+            prefilterStats["parseTime"] += parseTime
+
+    # if we are using multiple workers, hand the files over to the process pool
+    if args.workers > 1:
+        runParallelAnalysis(files, pending, storeResult)
+    # if we are using verbose, don't display the bar (everything will print)
+    elif verbose:
+        for index in pending:
+            storeResult(index, *analyzeFile(files[index]))
+    else:
+        # Use tqdm to display a nice progress bar, requires manual for loop instead of for f in files
+        for index in tqdm(pending, unit="files"):
+            storeResult(index, *analyzeFile(files[index]))
+
+    outfile.close()
+    donePath.touch()
+
+    if not args.no_prefilter:
+        reportPrefilter(prefilterStats)
+
+    if manifestFile is not None:
+        manifestFile.close()
+        # rewrite the manifest so it only holds the files that are still part of the corpus
+        compactManifest(manifestPath, files, fileStats)
+
+    print("Execution finished, number of logs found: " + str(writer.numLogs))
+    print("Data written to " + str(output))
+
+
+# Analyzes the files using a pool of worker processes. Files are sent to the workers in chunks, largest files first, so
+# that one huge graph does not end up being the last thing running. Every finished file is handed to storeResult along
+# with its original index, which keeps the output identical to the serial scan.
+def runParallelAnalysis(files, pending, storeResult):
+    # biggest files first, remember their original position so we can put the results back in order
+    indexedFiles = sorted(((index, files[index]) for index in pending),
+                          key=lambda indexedFile: os.path.getsize(indexedFile[1]), reverse=True)
+    chunks = [indexedFiles[i:i + args.chunk_size] for i in range(0, len(indexedFiles), args.chunk_size)]
+    print(f"Using {args.workers} workers, {len(chunks)} chunks of up to {args.chunk_size} files")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, initializer=initWorker,
+                                                initargs=(args,)) as executor:
+        with tqdm(total=len(indexedFiles), unit="files", disable=verbose) as progress:
+            futures = [executor.submit(analyzeChunk, chunk) for chunk in chunks]
+            for future in concurrent.futures.as_completed(futures):
+                chunkResults = future.result()
+                for index, logs, digest, scanStats in chunkResults:
+                    storeResult(index, logs, digest, scanStats)
+                progress.update(len(chunkResults))
+
+
+# Sets up a worker process of the parallel scan. The options are globals defined under __main__, which only forked
+# workers inherit, so they are handed to every worker explicitly
+def initWorker(workerArgs):
+    global args, verbose
+    args = workerArgs
+    verbose = workerArgs.verbose
+
+
+# Worker side of the parallel scan. Analyzes a chunk of (index, file) pairs and returns all the logs in one go
+def analyzeChunk(chunk):
+    return [(index, *analyzeFile(fileLocation)) for index, fileLocation in chunk]
+
+
+# Analyzes a single file. Returns the logs, the content hash of the file if a manifest is in use, and whether the
+# prefilter skipped the file along with its size and parse time (for the prefilter report)
+def analyzeFile(fileLocation):
+    numBytes = os.path.getsize(fileLocation)
+    if not args.no_prefilter and not mayContainLogs(fileLocation):
+        logs = []
+        if args.check_prefilter:
+            logs = runAnalysis(fileLocation)
+            if len(logs) > 0:
+                print(f"\nPrefilter skipped {fileLocation}, which contains {len(logs)} logs!")
+        scanStats = (True, numBytes, 0.0)
+    else:
+        startTime = time.perf_counter()
+        logs = runAnalysis(fileLocation)
+        scanStats = (False, numBytes, time.perf_counter() - startTime)
+    digest = fileDigest(fileLocation) if args.manifest is not None else None
+    return logs, digest, scanStats
+
+
+# Serialized form of a node whose contents are exactly one of the names detectLogs looks for: the key of the contents
+# field (field 3, length delimited), the length of the name and the name itself. A graph containing such a node
+# contains one of these byte strings, so a file without any of them cannot contain a log.
+loggerPatterns = [b"\x1a\x06logger", b"\x1a\x03log", b"\x1a\x03LOG"]
+
+
+# Checks the raw bytes of a graph file for the logger names, without decoding the protobuf
+def mayContainLogs(fileLocation):
+    with open(fileLocation, "rb") as f:
+        # mmap refuses to map empty files, and an empty graph has no logs anyway
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return any(data.find(pattern) != -1 for pattern in loggerPatterns)
+
+
+# Prints how many files the prefilter skipped and estimates the parse time that saved, using the parse speed
+# (seconds per byte) of the files that did get parsed
+def reportPrefilter(prefilterStats):
+    skippedFiles = prefilterStats["skippedFiles"]
+    totalFiles = skippedFiles + prefilterStats["parsedFiles"]
+    if prefilterStats["parsedBytes"] > 0:
+        timeSaved = prefilterStats["parseTime"] / prefilterStats["parsedBytes"] * prefilterStats["skippedBytes"]
+    else:
+        timeSaved = 0.0
+    print(f"Prefilter skipped {skippedFiles}/{totalFiles} files ({prefilterStats['skippedBytes'] / 1e6:.1f} MB), "
+          f"saving an estimated {timeSaved:.1f}s of parsing")
+
+
+# Size and modification time of a file, the cheap half of the manifest key
+def statFile(fileLocation):
+    stat = os.stat(fileLocation)
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Content hash of a file, used when the size or modification time changed to check if the contents did as well
+def fileDigest(fileLocation):
+    with open(fileLocation, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# Manifest entries are keyed on the path relative to the input folder, so the corpus can be moved around
+def manifestKey(fileLocation):
+    return os.path.relpath(fileLocation, path)
+
+
+# Loads the manifest, a JSON lines file with one entry per analyzed file. Later entries override earlier ones, and a
+# partially written last line (left behind by a killed run) is ignored.
+def loadManifest(manifestPath):
+    manifest = {}
+    if not manifestPath.exists():
+        return manifest
+    with open(manifestPath) as manifestFile:
+        for line in manifestFile:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            manifest[entry["path"]] = entry
+    return manifest
+
+
+# Returns the cached logs (by file index) of every file that did not change since it was last analyzed
+def reuseManifest(files, fileStats, manifest):
+    cachedLogs = {}
+    for index, fileLocation in enumerate(files):
+        entry = manifest.get(manifestKey(fileLocation))
+        size, mtime = fileStats[index]
+        if entry is not None and entry["size"] == size:
+            # same size and modification time, or touched but with the same contents
+            if entry["mtime"] == mtime or entry["sha1"] == fileDigest(fileLocation):
+                cachedLogs[index] = [logFromDict(log) for log in entry["logs"]]
+    return cachedLogs
+
+
+# Opens the manifest for appending, making sure a partial last line does not swallow the first new entry
+def openManifest(manifestPath):
+    if manifestPath.exists() and manifestPath.stat().st_size > 0:
+        with open(manifestPath, "rb") as manifestFile:
+            manifestFile.seek(-1, os.SEEK_END)
+            endsWithNewline = manifestFile.read(1) == b"\n"
     else:
-        output = str(Path(args.output)) + "/" + outputName + ".json"
+        endsWithNewline = True
+    manifestFile = open(manifestPath, "a")
+    if not endsWithNewline:
+        manifestFile.write("\n")
+    return manifestFile
+
+
+def writeManifestEntry(manifestFile, fileLocation, fileStat, digest, logs):
+    size, mtime = fileStat
+    entry = {
+        "path": manifestKey(fileLocation),
+        "size": size,
+        "mtime": mtime,
+        "sha1": digest,
+        "logs": [log.__dict__ for log in logs]
+    }
+    manifestFile.write(json.dumps(entry) + "\n")
+    # flush every entry, this is what lets a killed run pick up where it stopped
+    manifestFile.flush()
+
 
-    with open(output, 'w') as outfile:
-        json.dump([ob.__dict__ for ob in results], outfile)
-    print("Data written to file!")
+# Rewrites the manifest with one entry per file of the current corpus (all of which have an up to date entry by now),
+# dropping stale and deleted entries
+def compactManifest(manifestPath, files, fileStats):
+    manifest = loadManifest(manifestPath)
+    tempPath = manifestPath.with_name(manifestPath.name + ".tmp")
+    with open(tempPath, "w") as tempFile:
+        for index, fileLocation in enumerate(files):
+            entry = manifest[manifestKey(fileLocation)]
+            entry["size"], entry["mtime"] = fileStats[index]
+            tempFile.write(json.dumps(entry) + "\n")
+    os.replace(tempPath, manifestPath)
 
 
 def runAnalysis(fileLocation):
@@ -189,11 +451,24 @@ def runAnalysis(fileLocation):
 
 if __name__ == "__main__":
     # use argparser to set up all argument parsing
-    parser = argparse.ArgumentParser(description="Detect log statements in java protocol buffer files")
+    parser = argparse.ArgumentParser(description="Detect log statements in java protocol buffer files. The logs are "
+                                                 "streamed to a JSON lines file, <name>.jsonl.done is created once it "
+                                                 "is complete")
     parser.add_argument("input_folder", help="Root folder containing all protocol buffer files.", type=str)
     parser.add_argument("-o", "--output", help="Output folder to write to, will default to script location", type=str)
     parser.add_argument("-v", "--verbose", help="Enable verbose mode", action="store_true")
-    parser.add_argument("-n", "--name", help="Name of output JSON file. Do not include extension")
+    parser.add_argument("-n", "--name", help="Name of output JSON lines file. Do not include extension")
+    parser.add_argument("-w", "--workers", help="Number of worker processes used to scan the corpus. Defaults to 1 "
+                                                "(serial scan)", type=int, default=1)
+    parser.add_argument("--chunk_size", help="Number of files handed to a worker at a time when using more than one "
+                                             "worker", type=int, default=32)
+    parser.add_argument("-m", "--manifest", help="Manifest file caching the logs found in each proto file. Only new or "
+                                                 "changed files are analyzed, and a killed run resumes where it "
+                                                 "stopped. Created if it does not exist", type=str)
+    parser.add_argument("--no_prefilter", help="Parse every proto file, instead of skipping the files that do not "
+                                               "contain any logger names", action="store_true")
+    parser.add_argument("--check_prefilter", help="Parse the files skipped by the prefilter anyway and report any logs "
+                                                  "found in them. Used to verify the prefilter", action="store_true")
     args = parser.parse_args()
     verbose = args.verbose
     path = Path(args.input_folder)
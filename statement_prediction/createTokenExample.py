@@ -5,23 +5,29 @@ import sentencepiece as spm
 
 def youtoken():
     bpe = yttm.BPE(model="statementPrediction.model")
-    with open("../results/all_projects.json") as jsonf:
-        logs = json.load(jsonf)
+    with open("../results/all_projects.jsonl") as jsonf:
+        logs = [json.loads(line) for line in jsonf]
         with open("tokenizedExample.txt","w") as output:
             for log in logs:
                 msg = log["msg"]
                 tokenizedMsg = bpe.encode([msg], output_type=yttm.OutputType.SUBWORD)[0]
                 output.write(f"{msg} ----> {str(tokenizedMsg)}\n")
 
-def senterpiece():
+def senterpiece(batchSize=1000, numThreads=-1):
     sp = spm.SentencePieceProcessor(model_file='spmModel.model')
     totalTokens = 0
-    with open("../results/all_projects.json") as jsonf:
-        logs = json.load(jsonf)
+    with open("../results/all_projects.jsonl") as jsonf:
+        logs = [json.loads(line) for line in jsonf]
+        # tokenize every distinct msg once, in batches
+        msgs = list(dict.fromkeys(log["msg"] for log in logs))
+        tokenizedMsgs = {}
+        for start in range(0, len(msgs), batchSize):
+            batch = msgs[start:start + batchSize]
+            tokenizedMsgs.update(zip(batch, sp.encode(batch, out_type=str, num_threads=numThreads)))
         with open("tokenizedExample.txt","w") as output:
             for log in logs:
                 msg = log["msg"]
-                tokenizedMsg = sp.encode([msg], out_type=str)[0]
+                tokenizedMsg = tokenizedMsgs[msg]
                 totalTokens += len(tokenizedMsg)
                 output.write(f"{msg} ----> {str(tokenizedMsg)}\n")
 
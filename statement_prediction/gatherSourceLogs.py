@@ -44,10 +44,9 @@ def main():
     logs = list(map(convertLog, logs))
     # write out the train data for the tokenizer
     with open("trainData.txt", "w") as output:
-        with open(inputJSON) as jsonf:
-            JSONlogs = json.load(jsonf)
-            for log in JSONlogs:
-                output.write(log["msg"] + "\n")
+        JSONlogs = loadLogs(inputJSON)
+        for log in JSONlogs:
+            output.write(log["msg"] + "\n")
         print(f"Found {len(logs)} logs! Will also write {len(JSONlogs)} as well.")
         for log in logs:
             output.write(log["msg"] + "\n")
@@ -57,18 +56,24 @@ def main():
         # Header
         output.write(f"project\tseverity\tmsg\n")
         # use the JSON to write the extra logs we discovered in the Graph files
-        with open(inputJSON) as jsonf:
-            JSONlogs = json.load(jsonf)
-            for log in JSONlogs:
-                projectName = log["fileLoc"].split("/")[0]
-                msg = log["msg"].replace("\t", "")
-                output.write(f"{projectName}\t{log['severity']}\t{msg}\n")
+        for log in JSONlogs:
+            projectName = log["fileLoc"].split("/")[0]
+            msg = log["msg"].replace("\t", "")
+            output.write(f"{projectName}\t{log['severity']}\t{msg}\n")
         # write out the logs we found in the source code
         for index,log in enumerate(logs):
             projectName = logsWithProject[index][0]
             output.write(f'{projectName}\t{log["severity"]}\t{log["msg"]}\n')
 
 
+# Load the logs generated by retrieveLogs, either the JSON lines file or an old style JSON array
+def loadLogs(location):
+    with open(location) as jsonf:
+        if location.suffix == ".json":
+            return json.load(jsonf)
+        return [json.loads(line) for line in jsonf]
+
+
 def convertLog(log):
     returnDict = {
 
@@ -102,7 +107,7 @@ if __name__ == "__main__":
                                           "project's source code)",
                         type=str)
     parser.add_argument("input_json",
-                        help="JSON file location",
+                        help="JSON lines file location (output of retrieveLogs)",
                         type=str)
 
     args = parser.parse_args()
@@ -10,7 +10,11 @@ import re
 # open all projects and run the three methods
 def main():
     with open(fileLoc) as json_file:
-        logs = json.load(json_file)
+        # retrieveLogs writes JSON lines, older runs wrote a single JSON array
+        if fileLoc.suffix == ".json":
+            logs = json.load(json_file)
+        else:
+            logs = [json.loads(line) for line in json_file]
         calculateGlobalStatistics(logs)
         calculateLevelStatistics(logs)
         calculateMsgStatistics(logs)
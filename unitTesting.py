@@ -1,25 +1,630 @@
+import argparse
+import concurrent.futures
 import glob
+import gzip
 import json
+import os
+import tempfile
+import time
 import unittest
 from collections import Counter
 from pathlib import Path
 import random
+import sys
 
 from graph_pb2 import Graph
+import convertCorpusForML
+import nodeParsing
+import retrieveLogs
+
+# the vendored ptgnn reads the binary shards written by convertCorpusForML
+sys.path.append(str(Path(__file__).parent / "azure" / "ptgnn"))
+from ptgnn.implementations.graph2seq.graphshards import read_graph_data, read_graph_shards
 
 corpusLocation = Path().absolute() / "modified_corpus"
-jsonLocation = Path().absolute() / "results/all_projects.json"
+jsonLocation = Path().absolute() / "results/all_projects.jsonl"
 
 class TestGraphGeneration(unittest.TestCase):
     # Read the logs at the start
     def setUp(self):
-        with open(jsonLocation, "rb") as jsonf:
-            self.logs = json.load(jsonf)
+        with open(jsonLocation) as jsonf:
+            self.logs = [json.loads(line) for line in jsonf]
 
     def test_number_of_logs(self):
         files = [f for f in glob.glob(str(corpusLocation) + "/**/*.java.proto", recursive=True)]
         self.assertEqual(len(files), len(self.logs))
 
 
+# The quadratic detector retrieveLogs used before the single linear pass, kept to check that the output did not change
+def quadraticDetectLogs(graph):
+    nodes = graph.node
+    results = []
+    for i in range(len(nodes)):
+        if nodes[i].contents in ("logger", "log", "LOG"):
+            severity = retrieveLogs.addressjBoss(nodes[i + 2].contents.lower())
+            if retrieveLogs.verifyLogLevel(severity):
+                startNodes = nodes[i + 4:]
+                endLocation = 0
+                for j, node in enumerate(startNodes):
+                    if node.contents == "SEMI":
+                        endLocation = j - 1
+                        break
+                msg = "".join(retrieveLogs.convertContentToString(node.contents) for node in startNodes[0:endLocation])
+                if len(msg) <= 1500:
+                    results.append((severity, msg, nodes[i].startLineNumber, nodes[i].id))
+    return results
+
+
+# Builds a graph with one node per content
+def makeGraph(contents):
+    graph = Graph()
+    graph.sourceFile = "/local/data/Desktop/java-corpus-utils/java_projects/proj/Test.java"
+    for i, content in enumerate(contents):
+        node = graph.node.add()
+        node.id = i + 1
+        node.contents = content
+        node.startLineNumber = i // 5
+    return graph
+
+
+class TestLogDetection(unittest.TestCase):
+    def test_same_logs_as_quadratic_detection(self):
+        vocabulary = ["logger", "log", "LOG", "DOT", "info", "warnf", "Error", "isDebugEnabled", "LPAREN", "RPAREN",
+                      "PLUS", "COMMA", "SEMI", "SEMI", "msg", "x"]
+        rng = random.Random(4)
+        for _ in range(500):
+            # no logger in the last two nodes, the quadratic detector reads past the end of those
+            contents = [rng.choice(vocabulary) for _ in range(rng.randint(3, 60))] + ["x", "x"]
+            graph = makeGraph(contents)
+            logs = [(log.severity, log.msg, log.lineLoc, log.rootId) for log in retrieveLogs.detectLogs(graph)]
+            self.assertEqual(logs, quadraticDetectLogs(graph))
+
+    def test_statement_edge_cases(self):
+        # regular statement, statement without a semicolon and a semicolon straight after the LPAREN
+        graph = makeGraph(["logger", "DOT", "info", "LPAREN", "a", "PLUS", "b", "RPAREN", "SEMI",
+                           "LOG", "DOT", "errorf", "LPAREN", "SEMI", "c", "SEMI", "d",
+                           "log", "DOT", "warn", "LPAREN", "e"])
+        logs = retrieveLogs.detectLogs(graph)
+        # a semicolon straight after the LPAREN keeps the old behaviour of taking everything but the last node
+        self.assertEqual([log.msg for log in logs], ["a + b", "SEMIcSEMIdlog.warn(", ""])
+        self.assertEqual([log.severity for log in logs], ["info", "error", "warn"])
+        self.assertEqual(logs[0].fileLoc, "proj/Test.java")
+
+    def test_logger_at_end_of_graph(self):
+        self.assertEqual(retrieveLogs.detectLogs(makeGraph(["x", "logger", "DOT"])), [])
+
+    def test_prefilter_keeps_graphs_with_logs(self):
+        vocabulary = ["logger", "log", "LOG", "Logger", "logger2", "catalog", "DOT", "info", "warn", "LPAREN", "SEMI",
+                      "x"]
+        rng = random.Random(3)
+        numSkipped = 0
+        with tempfile.TemporaryDirectory() as folder:
+            graphPath = Path(folder) / "Test.java.proto"
+            for _ in range(500):
+                graph = makeGraph([rng.choice(vocabulary) for _ in range(rng.randint(0, 30))])
+                for node in graph.node:
+                    node.type = rng.choice([1, 2, 3, 4, 17])
+                    node.startPosition = rng.randint(0, 1000)
+                graphPath.write_bytes(graph.SerializeToString())
+                if len(retrieveLogs.detectLogs(graph)) > 0:
+                    self.assertTrue(retrieveLogs.mayContainLogs(str(graphPath)))
+                elif not retrieveLogs.mayContainLogs(str(graphPath)):
+                    numSkipped += 1
+        # the graphs without any node named like a logger are skipped
+        self.assertGreater(numSkipped, 0)
+
+
+class TestManifest(unittest.TestCase):
+    def writeGraph(self, graphPath, severity, mtime):
+        graphPath.write_bytes(makeGraph(["logger", "DOT", severity, "LPAREN", "msg", "RPAREN", "SEMI"])
+                              .SerializeToString())
+        os.utime(graphPath, ns=(mtime, mtime))
+
+    def writeEntry(self, manifestPath, graphPath):
+        logs = retrieveLogs.detectLogs(Graph.FromString(graphPath.read_bytes()))
+        with retrieveLogs.openManifest(manifestPath) as manifestFile:
+            retrieveLogs.writeManifestEntry(manifestFile, str(graphPath), retrieveLogs.statFile(str(graphPath)),
+                                            retrieveLogs.fileDigest(str(graphPath)), logs)
+
+    def test_stale_and_deleted_files_leave_the_manifest(self):
+        with tempfile.TemporaryDirectory() as folder:
+            retrieveLogs.path = folder
+            manifestPath = Path(folder) / "manifest.jsonl"
+            graphPaths = [Path(folder) / name for name in ("A.java.proto", "B.java.proto", "C.java.proto")]
+            for graphPath in graphPaths:
+                self.writeGraph(graphPath, "info", 1_000_000_000)
+                self.writeEntry(manifestPath, graphPath)
+            # A is deleted, B changes without changing its size and C is only touched
+            graphPaths[0].unlink()
+            self.writeGraph(graphPaths[1], "warn", 2_000_000_000)
+            os.utime(graphPaths[2], ns=(2_000_000_000, 2_000_000_000))
+            files = [str(graphPath) for graphPath in graphPaths[1:]]
+            fileStats = [retrieveLogs.statFile(f) for f in files]
+            cachedLogs = retrieveLogs.reuseManifest(files, fileStats, retrieveLogs.loadManifest(manifestPath))
+            self.assertEqual(list(cachedLogs), [1])
+            self.assertEqual([log.severity for log in cachedLogs[1]], ["info"])
+
+            # B is scanned again, the manifest then only holds the current files
+            self.writeEntry(manifestPath, graphPaths[1])
+            retrieveLogs.compactManifest(manifestPath, files, fileStats)
+            manifest = retrieveLogs.loadManifest(manifestPath)
+            self.assertEqual(list(manifest), ["B.java.proto", "C.java.proto"])
+            self.assertEqual([log["severity"] for log in manifest["B.java.proto"]["logs"]], ["warn"])
+            self.assertEqual(manifest["C.java.proto"]["mtime"], 2_000_000_000)
+            cachedLogs = retrieveLogs.reuseManifest(files, fileStats, manifest)
+            self.assertEqual(list(cachedLogs), [0, 1])
+
+
+# Builds a random graph with a log statement (from the root node up to the next SEMI) somewhere in the middle. Returns
+# the graph and the id of the root node. Edges are drawn at random, so some of them are duplicates.
+def makeLogGraph(rng):
+    contents = [rng.choice(["a", "b", "DOT", "SEMI", "org.log.debug", "LPAREN"]) for _ in range(rng.randint(6, 40))]
+    root = rng.randrange(len(contents) - 2)
+    contents[root] = "logger"
+    graph = makeGraph(contents)
+    for node in graph.node:
+        node.type = rng.randint(1, 4)
+        node.endLineNumber = node.startLineNumber + rng.randint(0, 1)
+        node.startPosition = rng.randint(0, 100)
+        node.endPosition = node.startPosition + rng.randint(1, 10)
+    for _ in range(rng.randint(0, 4 * len(contents))):
+        edge = graph.edge.add()
+        edge.sourceId = rng.randint(1, len(contents))
+        edge.destinationId = rng.randint(1, len(contents))
+        edge.type = rng.randint(1, 3)
+    return graph, graph.node[root].id
+
+
+# The per edge passes nodeParsing used before rewriteEdges (drop the edges within the log statement, then point the
+# edges touching it to the root node), followed by dropping the repeated redirected edges. Returns the kept edges as
+# (source, destination, type).
+def perEdgeRewrite(edges, logIds):
+    keptEdges = []
+    redirectedEdges = set()
+    for edge in edges:
+        source, destination = edge.sourceId, edge.destinationId
+        if source in logIds and destination in logIds:
+            continue
+        if source in logIds:
+            source = logIds[0]
+        elif destination in logIds:
+            destination = logIds[0]
+        else:
+            keptEdges.append((source, destination, edge.type))
+            continue
+        if (source, destination, edge.type) not in redirectedEdges:
+            redirectedEdges.add((source, destination, edge.type))
+            keptEdges.append((source, destination, edge.type))
+    return keptEdges
+
+
+# modifyGraph as it was before it modified the parsed graph in place: the log statement is removed from the nodes and
+# every node and kept edge is copied over to a new graph
+def rebuildModifiedGraph(g, rootId):
+    allLogNodes, baseNodeIndex, lastLogNodeIndex, lastNodeEndLineNumber, lastNodeEndPosition = \
+        nodeParsing.retrieveAllLogsNodes(g.node, rootId)
+    keptEdges, sources, destinations, _ = nodeParsing.rewriteEdges(g.edge, [node.id for node in allLogNodes])
+    nodes = nodeParsing.modifyNodes(g.node, baseNodeIndex, lastLogNodeIndex, lastNodeEndLineNumber,
+                                    lastNodeEndPosition)
+    returnGraph = Graph()
+    for node in nodes:
+        graphNode = returnGraph.node.add()
+        graphNode.id = node.id
+        graphNode.type = node.type
+        graphNode.contents = nodeParsing.removeImportLeaks(node.contents)
+        graphNode.startPosition = node.startPosition
+        graphNode.endPosition = node.endPosition
+        graphNode.startLineNumber = node.startLineNumber
+        graphNode.endLineNumber = node.endLineNumber
+    for index in keptEdges:
+        graphEdge = returnGraph.edge.add()
+        graphEdge.sourceId = int(sources[index])
+        graphEdge.destinationId = int(destinations[index])
+        graphEdge.type = g.edge[int(index)].type
+    return returnGraph
+
+
+# The field values of the nodes and edges of a graph. Graphs that hold the same values can still differ in which
+# default valued fields are explicitly set
+def graphValues(g):
+    nodes = [(node.id, node.type, node.contents, node.startPosition, node.endPosition, node.startLineNumber,
+              node.endLineNumber) for node in g.node]
+    edges = [(edge.sourceId, edge.destinationId, edge.type) for edge in g.edge]
+    return nodes, edges
+
+
+# The ids, types and contents of the nodes and the edges of a graph read by convertCorpusForML, the fields it converts
+def convertedValues(nodes, edges):
+    return [(node.id, node.type, node.contents) for node in nodes], \
+        [(edge.sourceId, edge.destinationId, edge.type) for edge in edges]
+
+
+class TestGraphModification(unittest.TestCase):
+    def test_same_edges_as_per_edge_rewrite(self):
+        rng = random.Random(8)
+        for _ in range(300):
+            graph, rootId = makeLogGraph(rng)
+            logIds = [node.id for node in nodeParsing.retrieveAllLogsNodes(graph.node, rootId)[0]]
+            keptEdges, sources, destinations, _ = nodeParsing.rewriteEdges(graph.edge, logIds)
+            types = [graph.edge[int(index)].type for index in keptEdges]
+            self.assertEqual(list(zip(sources[keptEdges].tolist(), destinations[keptEdges].tolist(), types)),
+                             perEdgeRewrite(graph.edge, logIds))
+
+    def test_same_graph_as_rebuilding(self):
+        rng = random.Random(9)
+        for _ in range(300):
+            graph, rootId = makeLogGraph(rng)
+            expected = rebuildModifiedGraph(Graph.FromString(graph.SerializeToString()), rootId)
+            modified = nodeParsing.modifyGraph(graph, rootId)
+            self.assertEqual(graphValues(modified), graphValues(expected))
+            self.assertFalse(modified.HasField("sourceFile"))
+
+    def test_patches_give_the_modified_graphs(self):
+        rng = random.Random(11)
+        with tempfile.TemporaryDirectory() as folder:
+            for graphIndex in range(50):
+                graph, rootId = makeLogGraph(rng)
+                # the logs of a file share its base graph
+                rootIds = [rootId] + [node.id for node in rng.sample(list(graph.node), 2)]
+                modifiedGraphs = [nodeParsing.modifyGraph(Graph.FromString(graph.SerializeToString()), logRootId)
+                                  for logRootId in rootIds]
+                expected = [convertedValues(modified.node, modified.edge) for modified in modifiedGraphs]
+                basePath = Path(folder) / f"Test{graphIndex}.java.base.proto"
+                logsWithOutput = [({"rootId": logRootId, "severity": "info", "msg": "a", "fileLoc": "proj/Test.java"},
+                                   Path(folder) / f"Test{graphIndex}{i + 1}.java.patch.json")
+                                  for i, logRootId in enumerate(rootIds)]
+                nodeParsing.writeGraphPatches(graph, logsWithOutput, basePath)
+                baseGraph = Graph.FromString(basePath.read_bytes())
+                # the second time, the base graph comes from the cache of readBaseGraph, which the patches share
+                for _ in range(2):
+                    for (_, outputPath), expectedValues in zip(logsWithOutput, expected):
+                        self.assertEqual(convertedValues(*convertCorpusForML.readGraph(str(outputPath))),
+                                         expectedValues)
+                    self.assertEqual(convertedValues(*convertCorpusForML.readBaseGraph(str(basePath))),
+                                     convertedValues(baseGraph.node, baseGraph.edge))
+
+    def test_multi_log_graph_has_a_log_node_per_log(self):
+        rng = random.Random(22)
+        with tempfile.TemporaryDirectory() as folder:
+            graphLocation = Path(folder) / "Test.java.proto"
+            outputPath = Path(folder) / "Test1.java.logs.proto"
+            for _ in range(100):
+                contents = []
+                for _ in range(rng.randint(1, 5)):
+                    contents += [rng.choice(["a", "b", "SEMI"]) for _ in range(rng.randint(0, 4))]
+                    contents += ["logger", "DOT", rng.choice(retrieveLogs.logLevels), "LPAREN", "msg", "RPAREN", "SEMI"]
+                graph = makeGraph(contents)
+                for _ in range(rng.randint(0, 2 * len(contents))):
+                    edge = graph.edge.add()
+                    edge.sourceId, edge.destinationId = rng.randint(1, len(contents)), rng.randint(1, len(contents))
+                    edge.type = rng.randint(1, 3)
+                graphLocation.write_bytes(graph.SerializeToString())
+                logs = [log.__dict__ for log in retrieveLogs.detectLogs(graph)]
+                # nodeParsing hands over the logs in the order they were found, not necessarily the order of the graph
+                rng.shuffle(logs)
+                [[graphLoc, severities, msgs, fileLoc]] = nodeParsing.modifySourceFileMultiLog(
+                    graphLocation, [(log, outputPath) for log in logs])
+                logNodes = [node for node in Graph.FromString(outputPath.read_bytes()).node if node.type == 17]
+                logsByRoot = {log["rootId"]: log for log in logs}
+                self.assertEqual(len(logNodes), len(logs))
+                self.assertEqual(severities, [logsByRoot[node.id]["severity"] for node in logNodes])
+                self.assertEqual(msgs, [logsByRoot[node.id]["msg"] for node in logNodes])
+                self.assertEqual((graphLoc, fileLoc), (str(outputPath), "proj/Test.java"))
+
+
+class TestTokenization(unittest.TestCase):
+    def test_same_tokens_as_encoding_each_msg(self):
+        words = ["Failed to open", "file", "\" + path + \"", "user", "{}", "connection closed", "retrying in", "ms",
+                 "ERROR", "\u00e9t\u00e9", ""]
+        rng = random.Random(10)
+        # repeated msgs are tokenized once, with the batch of their first occurrence
+        msgs = [" ".join(rng.choice(words) for _ in range(rng.randint(0, 6))) for _ in range(60)]
+        msgs += rng.sample(msgs, 20)
+        tokenizer = nodeParsing.MessageTokenizer(batchSize=8, numThreads=2)
+        try:
+            for msg in msgs:
+                tokenizer.add(msg)
+            severities = [["Test.java.proto", "info", msg, "proj/Test.java"] for msg in msgs]
+            tokens = [tokenizer.get(msg) for msg in msgs]
+            self.assertTrue(tokenizer.submitted(severities))
+        finally:
+            tokenizer.shutdown()
+        sp = nodeParsing.getTokenizer()
+        self.assertEqual(tokens, [sp.encode(msg, out_type=str) for msg in msgs])
+
+
+# The options of convertCorpusForML, with the defaults of its argument parser
+def conversionArgs(**options):
+    defaults = {"statement_generation": False, "convert": False, "compression_level": 9, "binary": False,
+                "shard_size": 10000, "workers": 2, "chunk_size": 3, "incremental": False, "crop_hops": None,
+                "crop_edge_types": None, "crop_backbone_window": None}
+    return argparse.Namespace(**{**defaults, **options})
+
+
+# Writes random modified graphs (with their NEXT_TOKEN edges) to folder, returning their severities.jsonl entries
+def writeModifiedCorpus(folder, rng, numGraphs):
+    logs = []
+    for i in range(numGraphs):
+        graph, rootId = makeLogGraph(rng)
+        for node in graph.node[1:]:
+            edge = graph.edge.add()
+            edge.sourceId, edge.destinationId, edge.type = node.id - 1, node.id, 2
+        graphLoc = str(Path(folder) / f"Test{i}.java.proto")
+        with open(graphLoc, "wb") as graphFile:
+            graphFile.write(nodeParsing.modifyGraph(graph, rootId).SerializeToString())
+        logs.append([graphLoc, rng.choice(retrieveLogs.logLevels), ["\u2581" + rng.choice(["a", "b"]), "c"]])
+    return logs
+
+
+# convertGraph as it was before it worked on numpy arrays, converting edge by edge with a dict of node ids
+def dictGraphRecord(graphLoc, severity):
+    nodes, edges = convertCorpusForML.readGraph(graphLoc)
+    backboneNodes = {edgeId for edge in edges if edge.type == 2 for edgeId in (edge.sourceId, edge.destinationId)}
+    idIndexDict = {}
+    record = {"backbone_sequence": [], "node_labels": [], "edges": {}, "method_name": [severity], "log_node": -1}
+    for index, node in enumerate(nodes):
+        if node.type == 17:
+            record["log_node"] = index
+        idIndexDict[node.id] = index
+        if node.id in backboneNodes:
+            record["backbone_sequence"].append(index)
+        record["node_labels"].append(node.contents)
+    for edge in edges:
+        record["edges"].setdefault(convertCorpusForML.EdgeType(edge.type).name, []).append(
+            [idIndexDict[edge.sourceId], idIndexDict[edge.destinationId]])
+    return record
+
+
+class TestCorpusConversion(unittest.TestCase):
+    def test_same_record_as_dict_conversion(self):
+        convertCorpusForML.args = conversionArgs()
+        rng = random.Random(14)
+        with tempfile.TemporaryDirectory() as folder:
+            graphLoc = str(Path(folder) / "Test.java.proto")
+            for _ in range(300):
+                # reused node ids, several or no LOG nodes and edges of every type
+                graph = Graph()
+                for _ in range(rng.randint(0, 30)):
+                    node = graph.node.add()
+                    node.id = rng.randint(1, 40)
+                    node.type = rng.choice([1, 2, 17])
+                    node.contents = rng.choice(["a", "b", "SEMI"])
+                nodeIds = [node.id for node in graph.node]
+                for _ in range(rng.randint(0, 60) if len(nodeIds) > 0 else 0):
+                    edge = graph.edge.add()
+                    edge.sourceId, edge.destinationId = rng.choice(nodeIds), rng.choice(nodeIds)
+                    edge.type = rng.choice([2, 2, 3, 5, 17])
+                with open(graphLoc, "wb") as graphFile:
+                    graphFile.write(graph.SerializeToString())
+                record = convertCorpusForML.graphRecord(graphLoc, "info", None)
+                expected = dictGraphRecord(graphLoc, "info")
+                self.assertEqual(record, expected)
+                # the edge types are in the same order too
+                self.assertEqual(list(record["edges"]), list(expected["edges"]))
+
+    def test_unknown_edge_node_id(self):
+        convertCorpusForML.args = conversionArgs()
+        with tempfile.TemporaryDirectory() as folder:
+            graph = makeGraph(["a", "b"])
+            edge = graph.edge.add()
+            edge.sourceId, edge.destinationId, edge.type = 1, 3, 2
+            graphLoc = str(Path(folder) / "Test.java.proto")
+            with open(graphLoc, "wb") as graphFile:
+                graphFile.write(graph.SerializeToString())
+            with self.assertRaises(KeyError):
+                convertCorpusForML.graphRecord(graphLoc, "info", None)
+
+    def test_cropped_records(self):
+        # LOG nodes before and after the backbone of 8 tokens, with a and c one hop and b two hops away from them. The
+        # token t4 is three hops away
+        graph = makeGraph(["", "t1", "t2", "t3", "t4", "t5", "t6", "t7", "t8", "", "a", "b", "c"])
+        graph.node[0].type = graph.node[9].type = 17
+        edges = [(i, i + 1, 2) for i in range(2, 9)] + [(1, 11, 3), (12, 11, 3), (5, 12, 3), (13, 10, 6)]
+        for sourceId, destinationId, edgeType in edges:
+            edge = graph.edge.add()
+            edge.sourceId, edge.destinationId, edge.type = sourceId, destinationId, edgeType
+        with tempfile.TemporaryDirectory() as folder:
+            graphLoc = str(Path(folder) / "Test.java.logs.proto")
+            with open(graphLoc, "wb") as graphFile:
+                graphFile.write(graph.SerializeToString())
+            # the backbone windows of the LOG nodes are clamped to the first and the last three tokens
+            convertCorpusForML.args = conversionArgs(crop_hops=2, crop_backbone_window=2)
+            record = convertCorpusForML.graphRecord(graphLoc, ["info", "warn"], None)
+            self.assertEqual(record["node_labels"], ["", "t1", "t2", "t3", "t6", "t7", "t8", "", "a", "b", "c"])
+            self.assertEqual(record["backbone_sequence"], [1, 2, 3, 4, 5, 6])
+            self.assertEqual(record["edges"], {"NEXT_TOKEN": [[1, 2], [2, 3], [4, 5], [5, 6]],
+                                               "AST_CHILD": [[0, 8], [9, 8]], "LAST_USE": [[10, 7]]})
+            self.assertEqual(record["log_nodes"], [0, 7])
+            # c is only reached over a LAST_USE edge
+            convertCorpusForML.args = conversionArgs(crop_hops=2, crop_edge_types=["AST_CHILD"])
+            record = convertCorpusForML.graphRecord(graphLoc, ["info", "warn"], None)
+            self.assertEqual(record["node_labels"], ["", "", "a", "b"])
+            self.assertEqual(record["backbone_sequence"], [])
+            self.assertEqual(record["edges"], {"AST_CHILD": [[0, 2], [3, 2]]})
+            self.assertEqual(record["log_nodes"], [0, 1])
+            # single-log records are cropped around their (last) LOG node
+            convertCorpusForML.args = conversionArgs(crop_hops=0, crop_backbone_window=2)
+            record = convertCorpusForML.graphRecord(graphLoc, "info", None)
+            self.assertEqual(record["node_labels"], ["t6", "t7", "t8", ""])
+            self.assertEqual(record["backbone_sequence"], [0, 1, 2])
+            self.assertEqual(record["edges"], {"NEXT_TOKEN": [[0, 1], [1, 2]]})
+            self.assertEqual(record["log_node"], 3)
+
+    def test_chunked_conversion_keeps_serial_order(self):
+        with tempfile.TemporaryDirectory() as folder:
+            convertCorpusForML.args = conversionArgs(statement_generation=True)
+            logs = writeModifiedCorpus(folder, random.Random(12), 20)
+            outputFile = Path(folder) / "trainLogs.jsonl"
+            with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+                convertCorpusForML.convertLogsAsync(executor, logs, outputFile)
+            with open(outputFile) as outputJSONL:
+                self.assertEqual(outputJSONL.read(),
+                                 "".join(convertCorpusForML.convertGraph(*log) + "\n" for log in logs))
+
+    def test_unfinished_conversion_is_rolled_back(self):
+        with tempfile.TemporaryDirectory() as folder:
+            convertCorpusForML.args = conversionArgs(incremental=True)
+            logs = writeModifiedCorpus(folder, random.Random(17), 6)
+            outputFile = Path(folder) / "trainLogs.jsonl"
+            convertedGraphsPath = Path(folder) / "convertedGraphs.txt"
+            journalPath = Path(folder) / "conversionJournal.json"
+            with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+                convertCorpusForML.convertLogsAsync(executor, logs[:3], outputFile)
+                convertedGraphsPath.write_text("".join(log[0] + "\n" for log in logs[:3]))
+                before = [outputFile.read_bytes(), convertCorpusForML.sizeIndexPath(outputFile).read_bytes()]
+                # a run killed after appending its graphs, but before listing them as converted
+                convertCorpusForML.writeJournal(journalPath, [outputFile], convertedGraphsPath)
+                convertCorpusForML.convertLogsAsync(executor, logs[3:], outputFile)
+            convertCorpusForML.rollBackJournal(journalPath)
+            self.assertEqual([outputFile.read_bytes(), convertCorpusForML.sizeIndexPath(outputFile).read_bytes()],
+                             before)
+            self.assertFalse(journalPath.exists())
+
+    def test_incremental_run_skips_converted_files(self):
+        with tempfile.TemporaryDirectory() as folder:
+            convertCorpusForML.args = conversionArgs(incremental=True, hash_split=True, split_by="file", seed=5,
+                                                     training_percent=1.0, validation_percent=0.0, limit=None,
+                                                     debug=None, disallow_same_class=False, role=None, follow=False)
+            convertCorpusForML.amlCTX = None
+            convertCorpusForML.inputJSON = Path(folder) / "severities.jsonl"
+            convertCorpusForML.outputFolder = Path(folder) / "output"
+            # the third log is a new log of an already converted file
+            logs = [log + [sourceFile] for log, sourceFile in
+                    zip(writeModifiedCorpus(folder, random.Random(23), 4),
+                        ["proj/File.java", "proj/File.java", "proj/File.java", "proj/New.java"])]
+            for runLogs in (logs[:2], logs):
+                convertCorpusForML.inputJSON.write_text("".join(json.dumps(log) + "\n" for log in runLogs))
+                convertCorpusForML.main()
+            with open(convertCorpusForML.outputFolder / "trainLogs.jsonl") as outputJSONL:
+                self.assertEqual(sorted(outputJSONL.read().splitlines()),
+                                 sorted(convertCorpusForML.convertGraph(*log[:3]) for log in logs[:2] + logs[3:]))
+            self.assertEqual((convertCorpusForML.outputFolder / "convertedGraphs.txt").read_text(),
+                             "proj/File.java\nproj/New.java\n")
+
+    def test_gzipped_graphs_read_out_of_order(self):
+        with tempfile.TemporaryDirectory() as folder:
+            convertCorpusForML.args = conversionArgs(convert=True)
+            logs = writeModifiedCorpus(folder, random.Random(18), 20)
+            outputFile = Path(folder) / "trainLogs.jsonl.gz"
+            with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+                convertCorpusForML.convertLogsAsync(executor, logs, outputFile)
+            with gzip.open(outputFile) as outputJSONL:
+                records = [json.loads(line) for line in outputJSONL]
+            # every chunk is a gzip member of its own, the graphs are read from their member without the others
+            positions = list(range(len(records)))
+            random.Random(18).shuffle(positions)
+            self.assertEqual(list(read_graph_data(str(outputFile), positions=positions)),
+                             [records[position] for position in positions])
+
+    def test_empty_gzipped_set_is_valid(self):
+        with tempfile.TemporaryDirectory() as folder:
+            convertCorpusForML.args = conversionArgs(convert=True)
+            outputFile = Path(folder) / "testLogs.jsonl.gz"
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+                convertCorpusForML.convertLogsAsync(executor, [], outputFile)
+            # Python reads a 0 byte file as an empty gzip file, the gzip tool does not
+            self.assertTrue(outputFile.read_bytes().startswith(b"\x1f\x8b"))
+            with gzip.open(outputFile) as outputJSONL:
+                self.assertEqual(outputJSONL.read(), b"")
+
+
+# Turns the numpy arrays of a graph read from the binary shards into lists, as in the jsonl records
+def shardRecordToLists(record):
+    record = dict(record)
+    record["backbone_sequence"] = record["backbone_sequence"].tolist()
+    record["edges"] = {edgeType: typeEdges.tolist() for edgeType, typeEdges in record["edges"].items()}
+    return record
+
+
+class TestSplit(unittest.TestCase):
+    def test_source_files_are_not_merged(self):
+        convertCorpusForML.args = conversionArgs(split_by="file", seed=16, hash_split=False, training_percent=0.5,
+                                                 validation_percent=0.5)
+        convertCorpusForML.amlCTX = None
+        # nodeParsing names the graphs <File><log number>.java.proto, File2 and File21 clash with File and File1
+        logs = [[f"modified_corpus/proj/{name}{i}.java.proto", "info", ["a"], f"proj/{name}.java"]
+                for name in ("File", "File1", "File2", "File21") for i in range(1, 4)]
+        sets = convertCorpusForML.splitLogs(logs)
+        setsOfFiles = {}
+        for setIndex, setLogs in enumerate(sets):
+            for log in setLogs:
+                setsOfFiles.setdefault(log[3], set()).add(setIndex)
+        self.assertEqual(len(setsOfFiles), 4)
+        self.assertTrue(all(len(fileSets) == 1 for fileSets in setsOfFiles.values()))
+        self.assertTrue(all(len(setLogs) > 0 for setLogs in sets))
+
+
+class TestBinaryShards(unittest.TestCase):
+    def assertShardsHoldRecords(self, records):
+        with tempfile.TemporaryDirectory() as folder:
+            # small shards, so the records are spread over several of them
+            shardsFolder = Path(folder) / "trainLogs.shards"
+            with convertCorpusForML.ShardWriter(shardsFolder, 4) as shardWriter:
+                shardWriter.write(records)
+            readRecords = [shardRecordToLists(record) for record in read_graph_shards(shardsFolder)]
+        self.assertEqual(readRecords, records)
+
+    def test_severity_records(self):
+        with tempfile.TemporaryDirectory() as folder:
+            convertCorpusForML.args = conversionArgs()
+            logs = writeModifiedCorpus(folder, random.Random(15), 10)
+            self.assertShardsHoldRecords([convertCorpusForML.graphRecord(*log) for log in logs])
+
+    def test_statement_records(self):
+        with tempfile.TemporaryDirectory() as folder:
+            convertCorpusForML.args = conversionArgs(statement_generation=True)
+            logs = writeModifiedCorpus(folder, random.Random(15), 10)
+            self.assertShardsHoldRecords([convertCorpusForML.graphRecord(*log) for log in logs])
+
+    def test_multi_log_records(self):
+        rng = random.Random(15)
+        records = []
+        for _ in range(10):
+            numNodes = rng.randint(1, 10)
+            logNodes = sorted(rng.sample(range(numNodes), rng.randint(1, numNodes)))
+            records.append({
+                "backbone_sequence": list(range(numNodes)),
+                "node_labels": [rng.choice(["a", "b", ""]) for _ in range(numNodes)],
+                "edges": {"NEXT_TOKEN": [[i, i + 1] for i in range(numNodes - 1)]} if numNodes > 1 else {},
+                "method_names": [[rng.choice(["x", "y"]) for _ in range(rng.randint(0, 3))] for _ in logNodes],
+                "severities": [rng.choice(retrieveLogs.logLevels) for _ in logNodes],
+                "log_nodes": logNodes,
+            })
+        self.assertShardsHoldRecords(records)
+
+
+
+class TestWorkQueue(unittest.TestCase):
+    def makeQueue(self, folder):
+        queueDir = Path(folder)
+        for subfolder in ("leases", "results"):
+            (queueDir / subfolder).mkdir()
+        return queueDir
+
+    def test_finished_chunk_is_not_leased_again(self):
+        convertCorpusForML.args = conversionArgs()
+        with tempfile.TemporaryDirectory() as folder:
+            queueDir = self.makeQueue(folder)
+            # a worker that listed the chunk as pending before it was finished and its lease released
+            (queueDir / "results" / "trainLogs-000000.json").write_text('{"logs": 0, "sizes": []}')
+            self.assertIsNone(convertCorpusForML.leaseChunk(queueDir, "trainLogs-000000", None, 60, 3, "w", {}))
+            self.assertEqual(os.listdir(queueDir / "leases"), [])
+
+    def test_lease_expires_on_the_clock_of_the_observer(self):
+        convertCorpusForML.args = conversionArgs()
+        with tempfile.TemporaryDirectory() as folder:
+            queueDir = self.makeQueue(folder)
+            self.assertEqual(convertCorpusForML.leaseChunk(queueDir, "trainLogs-000000", None, 0.2, 3, "a", {}), 0)
+            # an mtime far in the past does not make the lease look abandoned
+            os.utime(queueDir / "leases" / "trainLogs-000000.0.lock", (0, 0))
+            observedLeases = {}
+            self.assertIsNone(convertCorpusForML.leaseChunk(queueDir, "trainLogs-000000", 0, 0.2, 3, "b",
+                                                            observedLeases))
+            # only a heartbeat that has not changed for the lease timeout does
+            time.sleep(0.3)
+            self.assertEqual(convertCorpusForML.leaseChunk(queueDir, "trainLogs-000000", 0, 0.2, 3, "b",
+                                                           observedLeases), 1)
+
+
 if __name__ == '__main__':
     unittest.main()